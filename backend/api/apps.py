@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # Build the sprite asset index once at startup so renders never stat files
+        import os
+        from django.conf import settings
+        from .postcard_generator import get_asset_index, warm_base_canvases
+
+        static_root = getattr(settings, 'STATIC_ROOT', None)
+        if static_root:
+            get_asset_index(static_root)
+
+            # Optionally prebuild the postcard base canvases too
+            if os.getenv('POSTCARD_WARM_CANVASES') == '1':
+                try:
+                    warm_base_canvases(static_root)
+                except FileNotFoundError as e:
+                    print(f'Postcard canvas warm-up skipped: {e}')
@@ -128,6 +128,19 @@ CLOTHES_BACK_MAPPING = {
     1: 14
 }
 
+# Probability weights for optional features (matching in-game generator)
+FEATURE_PROBABILITIES = {
+    'Moustache': 0.50,      # 50% - Matches in-game generator
+    'Beard': 0.10,          # 10% - Matches in-game generator
+    'AccessoryFace': 0.50,  # 50% - Glasses/monocle (matches in-game accessories)
+    'AccessoryFront': 0.50, # 50% - Pipe (matches in-game accessories)
+    'AccessoryHead': 0.50,  # 50% - Hats, etc. (matches in-game accessories)
+    'Blemish': 0.15,        # 15% - Scars, marks
+    'DetailUpper': 0.20,    # 20% - Wrinkles, etc.
+    'DetailLower': 0.20,    # 20% - Chin details
+    'Background': 0.80      # 80% - Usually want background
+}
+
 # Layer to variant key mapping
 LAYER_TO_VARIANT_KEY = {
     'AccessoryFront': 'Accessory',
@@ -294,19 +307,6 @@ def generate_random_character(gender='Male', skin_color_range=None):
         'parts': {}
     }
 
-    # Probability weights for optional features (matching in-game generator)
-    FEATURE_PROBABILITIES = {
-        'Moustache': 0.50,      # 50% - Matches in-game generator
-        'Beard': 0.10,          # 10% - Matches in-game generator
-        'AccessoryFace': 0.50,  # 50% - Glasses/monocle (matches in-game accessories)
-        'AccessoryFront': 0.50, # 50% - Pipe (matches in-game accessories)
-        'AccessoryHead': 0.50,  # 50% - Hats, etc. (matches in-game accessories)
-        'Blemish': 0.15,        # 15% - Scars, marks
-        'DetailUpper': 0.20,    # 20% - Wrinkles, etc.
-        'DetailLower': 0.20,    # 20% - Chin details
-        'Background': 0.80      # 80% - Usually want background
-    }
-
     # First pass: Add each layer (except Mouth, ClothesBack, and HairBack which have dependencies)
     for layer_name, layer in LAYERS.items():
         if layer_name in ['Mouth', 'ClothesBack', 'HairBack']:
@@ -394,3 +394,188 @@ def generate_random_character(gender='Male', skin_color_range=None):
         character['parts']['HairBack'] = {'index': -1, 'variant': -1}
 
     return character
+
+
+# Layers set after the first pass, from other layers' picks
+DEPENDENT_LAYERS = ('Mouth', 'ClothesBack', 'HairBack')
+
+
+def layer_choices(layer_name, gender, indices=None):
+    """
+    (index, variants) pairs for a layer, as get_available_indices and
+    get_available_variants would return them
+
+    Returns:
+        tuple: ((index, (variant, ...)), ...)
+    """
+    if indices is None:
+        indices = get_available_indices(layer_name, gender)
+    return tuple((index, tuple(get_available_variants(layer_name, index, gender))) for index in indices)
+
+
+def build_choice_tables():
+    """
+    Precompute, per gender, every per-layer lookup generate_random_character makes
+
+    Returns:
+        dict: gender -> {
+            'first_pass': [(layer_name, probability or None if required, choices or None if never set)],
+            'clothes_back': ClothesBack indices for unmapped Clothes,
+            'mouth': Mouth choices,
+            'hair_back': {Hair index: matching HairBack choices}
+        }
+    """
+    tables = {}
+    for gender in ('Male', 'Female'):
+        first_pass = []
+        for layer_name, layer in LAYERS.items():
+            if layer_name in DEPENDENT_LAYERS:
+                continue
+            if gender == 'Female' and layer_name in ['Beard', 'Moustache']:
+                first_pass.append((layer_name, None, None))
+                continue
+            probability = None if not layer.get('canBeNone') else FEATURE_PROBABILITIES.get(layer_name, 0.3)
+            first_pass.append((layer_name, probability, layer_choices(layer_name, gender)))
+
+        hair_back = {}
+        for hair_index in get_available_indices('Hair', gender):
+            matching = get_matching_hairback_indices(hair_index, gender)
+            if matching:
+                hair_back[hair_index] = layer_choices('HairBack', gender, matching)
+
+        tables[gender] = {
+            'first_pass': first_pass,
+            'clothes_back': tuple(get_available_indices('ClothesBack', gender)),
+            'mouth': layer_choices('Mouth', gender),
+            'hair_back': hair_back,
+        }
+    return tables
+
+
+# Built once; ASSET_VARIANTS and LAYERS do not change at runtime
+CHOICE_TABLES = build_choice_tables()
+
+
+def skin_sampler(skin_color_range):
+    """
+    Precomputed bounds for generate_random_character's skin tone weighting
+
+    Returns:
+        tuple: (min, max, lighter max, darker min, weighted) - weighted when
+               the range spans both lighter (0-4) and darker (5-9) tones
+    """
+    min_skin = max(0, skin_color_range[0])
+    max_skin = min(len(COLOR_PALETTES['Skin']) - 1, skin_color_range[1])
+    weighted = not (max_skin <= 4 or min_skin >= 5)
+    return (min_skin, max_skin, min(4, max_skin), max(5, min_skin), weighted)
+
+
+def generate_characters(n, gender_mix=None, skin_ranges=None, seed=None):
+    """
+    Generate many random characters at once
+
+    Same rules and probabilities as generate_random_character, but the
+    per-layer index/variant lists come from CHOICE_TABLES instead of being
+    re-sorted and re-filtered for every layer of every character.
+
+    Args:
+        n: Number of characters
+        gender_mix: 'Male', 'Female' or {'Male': weight, 'Female': weight}
+                    (default: equal weights)
+        skin_ranges: (min, max) skin color range, or a list of ranges to pick
+                     from per character (default: all skin tones)
+        seed: Seed for reproducible batches (default: random)
+
+    Returns:
+        list: Character dicts, as returned by generate_random_character
+    """
+    rng = random.Random(seed)
+    randint = rng.randint
+    uniform = rng.random
+    choice = rng.choice
+
+    if gender_mix is None:
+        gender_mix = {'Male': 1, 'Female': 1}
+    if isinstance(gender_mix, str):
+        genders = [gender_mix] * n
+    else:
+        names = [gender for gender, weight in gender_mix.items() if weight > 0]
+        if not names:
+            raise ValueError('gender_mix needs a positive weight')
+        genders = rng.choices(names, weights=[gender_mix[name] for name in names], k=n)
+
+    if skin_ranges is None:
+        skin_ranges = [(0, len(COLOR_PALETTES['Skin']) - 1)]
+    elif isinstance(skin_ranges, tuple):
+        skin_ranges = [skin_ranges]
+    samplers = [skin_sampler(skin_range) for skin_range in skin_ranges]
+
+    body_max = len(BODY_SHAPES) - 1
+    hair_max = len(COLOR_PALETTES['Hair']) - 1
+    eye_max = len(COLOR_PALETTES['Eye']) - 1
+    accessory_max = len(COLOR_PALETTES['Accessory']) - 1
+
+    characters = []
+    for gender in genders:
+        tables = CHOICE_TABLES[gender]
+
+        min_skin, max_skin, lighter_max, darker_min, weighted = (
+            samplers[0] if len(samplers) == 1 else choice(samplers)
+        )
+        if not weighted:
+            skin_color_index = randint(min_skin, max_skin)
+        elif uniform() < 0.9:
+            skin_color_index = randint(min_skin, lighter_max)
+        else:
+            skin_color_index = randint(darker_min, max_skin)
+
+        parts = {}
+        for layer_name, probability, choices in tables['first_pass']:
+            if choices and (probability is None or uniform() < probability):
+                index, variants = choice(choices)
+                parts[layer_name] = {'index': index, 'variant': choice(variants)} if variants else \
+                    {'index': -1, 'variant': -1}
+            else:
+                parts[layer_name] = {'index': -1, 'variant': -1}
+
+        # ClothesBack follows Clothes
+        clothes_index = parts['Clothes']['index']
+        if clothes_index != -1:
+            clothes_back_index = CLOTHES_BACK_MAPPING.get(clothes_index)
+            if clothes_back_index is None and tables['clothes_back']:
+                clothes_back_index = choice(tables['clothes_back'])
+            parts['ClothesBack'] = {'index': clothes_back_index, 'variant': 0} \
+                if clothes_back_index is not None else {'index': -1, 'variant': -1}
+        else:
+            parts['ClothesBack'] = {'index': -1, 'variant': -1}
+
+        # Mouth only without a moustache, 70% of the time
+        if parts['Moustache']['index'] == -1 and uniform() > 0.3 and tables['mouth']:
+            index, variants = choice(tables['mouth'])
+            parts['Mouth'] = {'index': index, 'variant': choice(variants)} if variants else \
+                {'index': -1, 'variant': -1}
+        else:
+            parts['Mouth'] = {'index': -1, 'variant': -1}
+
+        # HairBack matching the Hair index, 70% of the time
+        hair_back = tables['hair_back'].get(parts['Hair']['index'])
+        if hair_back and uniform() > 0.3:
+            index, variants = choice(hair_back)
+            parts['HairBack'] = {'index': index, 'variant': choice(variants)} if variants else \
+                {'index': -1, 'variant': -1}
+        else:
+            parts['HairBack'] = {'index': -1, 'variant': -1}
+
+        characters.append({
+            'gender': gender,
+            'bodyShapeIndex': randint(0, body_max),
+            'colorIndices': {
+                'Skin': skin_color_index,
+                'Hair': randint(0, hair_max),
+                'Eye': randint(0, eye_max),
+                'Accessory': randint(0, accessory_max)
+            },
+            'parts': parts
+        })
+
+    return characters
@@ -0,0 +1,118 @@
+"""
+Response cache for generated crews
+Keeps the parsed crew lists Claude returned for a description, keyed on a
+normalized form of it, so popular squadrons do not cost a Claude call each
+time. Only the crew data is cached - appearances are still randomized per
+request by the caller.
+"""
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached crew stays valid
+CREW_CACHE_TTL_SECONDS = int(os.getenv('CREW_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+# Maximum number of distinct descriptions kept (0 disables the cache)
+CREW_CACHE_MAX_ENTRIES = int(os.getenv('CREW_CACHE_MAX_ENTRIES', 500))
+
+# Crews collected per description before serving from cache; cache hits
+# return a random one of them
+CREW_CACHE_VARIETY = max(1, int(os.getenv('CREW_CACHE_VARIETY', 3)))
+
+
+def normalize_description(description):
+    """Fold case, whitespace and punctuation: ' Polish 303 Squadron!' -> 'polish 303 squadron'"""
+    words = re.sub(r'[^\w\s]', ' ', description.casefold()).split()
+    return ' '.join(words)
+
+
+class CrewCache:
+    """
+    Thread-safe LRU of description -> up to `variety` crews, each with a TTL
+    """
+
+    def __init__(self, max_entries, ttl_seconds, variety):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variety = variety
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key, now):
+        """Unexpired crews for a key, dropping expired ones (call with lock held)"""
+        crews = [(stored_at, crew) for stored_at, crew in self._items.get(key, [])
+                 if now - stored_at < self.ttl_seconds]
+        if crews:
+            self._items[key] = crews
+        else:
+            self._items.pop(key, None)
+        return crews
+
+    def get(self, description):
+        """
+        Return a cached crew list for the description, or None
+
+        Misses until `variety` crews have been collected, so the first
+        requests for a description still reach Claude and add variety.
+        """
+        if self.max_entries <= 0:
+            return None
+
+        key = normalize_description(description)
+        with self._lock:
+            crews = self._fresh(key, time.time())
+            if len(crews) < self.variety:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return random.choice(crews)[1]
+
+    def put(self, description, crew):
+        """
+        Add a crew list for the description (treat it as read-only afterwards)
+
+        Empty crews are not cached, so a failed generation is retried.
+        """
+        if self.max_entries <= 0 or not crew:
+            return
+
+        key = normalize_description(description)
+        now = time.time()
+        with self._lock:
+            crews = self._fresh(key, now)
+            crews.append((now, crew))
+            self._items[key] = crews[-self.variety:]
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached crews and reset counters"""
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return cache counters as a JSON-serializable dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'variety': self.variety,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide crew cache used by the generate_crew view
+crew_cache = CrewCache(CREW_CACHE_MAX_ENTRIES, CREW_CACHE_TTL_SECONDS, CREW_CACHE_VARIETY)
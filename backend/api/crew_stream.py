@@ -0,0 +1,104 @@
+"""
+Incremental parsing and event framing for streamed crew generation
+Claude streams the crew as one JSON array; CrewArrayParser hands out each
+member object as soon as its closing brace arrives, so members can be
+enriched and sent to the client while the rest is still being generated.
+"""
+import json
+
+# Streaming formats accepted by generate_crew's "stream" option
+STREAM_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+class CrewArrayParser:
+    """
+    Incremental parser for the first top-level JSON array in a text stream
+
+    Text before the array (e.g. a ```json fence) is skipped. Each object
+    directly inside the array is returned by feed() once complete.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current = []
+
+    def feed(self, text):
+        """
+        Consume a chunk of streamed text
+
+        Returns:
+            list: Member dicts completed by this chunk (possibly empty)
+        """
+        members = []
+        for char in text:
+            if self.finished:
+                break
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                continue
+
+            if self._depth > 0:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    self._current = [char]
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # Closing bracket of the crew array itself
+                    self.finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    member = self._parse_current()
+                    if member is not None:
+                        members.append(member)
+        return members
+
+    def _parse_current(self):
+        text = ''.join(self._current)
+        self._current = []
+        try:
+            member = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f'Skipping unparseable streamed crew member: {e}')
+            return None
+        return member if isinstance(member, dict) else None
+
+
+def format_event(stream_format, event, payload):
+    """
+    Frame one event for the response body
+
+    Args:
+        stream_format: 'ndjson' or 'sse'
+        event: Event name ('member', 'done' or 'error')
+        payload: JSON-serializable dict
+
+    Returns:
+        bytes: One NDJSON line ({"type": event, ...}) or one SSE message
+    """
+    if stream_format == 'sse':
+        return f'event: {event}\ndata: {json.dumps(payload)}\n\n'.encode('utf-8')
+    return (json.dumps({'type': event, **payload}) + '\n').encode('utf-8')
@@ -0,0 +1,292 @@
+"""
+Admission control for Claude API calls
+All crew and photo calls pass through one process-wide limiter: a token
+bucket caps the request rate, a semaphore caps calls in flight, and callers
+beyond that wait in a bounded FIFO queue with a deadline. When the queue is
+full (or the wait runs out) the caller gets LLMOverloaded, which the views
+turn into 429 + Retry-After instead of piling more calls onto the provider.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Claude calls started per minute (token bucket refill; 0 = no rate limit)
+LLM_RATE_PER_MINUTE = float(os.getenv('LLM_RATE_PER_MINUTE', 50))
+
+# Calls that may start back to back before the rate applies
+LLM_BURST = max(1, int(os.getenv('LLM_BURST', 10)))
+
+# Claude calls in flight at once (0 = unlimited)
+LLM_MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', 8))
+
+# Callers allowed to wait for a slot; more are rejected at once
+LLM_QUEUE_SIZE = int(os.getenv('LLM_QUEUE_SIZE', 32))
+
+# Seconds a caller waits in the queue before giving up
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 20))
+
+# Recent queue waits kept for the wait-time percentiles
+WAIT_SAMPLES = 500
+
+
+class LLMOverloaded(Exception):
+    """Raised when a Claude call is not admitted; retry_after is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f'Claude API busy ({reason}), retry in {retry_after}s')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A queued caller: its event loop and the future it sleeps on"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = None
+
+    def wake(self):
+        """Wake the caller from any thread (call with the limiter lock held)"""
+        future = self.future
+        if future is not None:
+            self.loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMLimiter:
+    """
+    Token bucket + concurrency cap + bounded FIFO queue
+
+    State is guarded by a threading lock and waiters are woken with
+    call_soon_threadsafe, so one limiter covers every event loop in the
+    process (a single ASGI loop, or a loop per request under WSGI).
+    """
+
+    def __init__(self, rate_per_minute, burst, max_concurrent, max_queue, queue_timeout):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._queue = deque()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.active = 0
+        self.peak_active = 0
+        self.peak_queue = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.provider_limited = 0
+        self._held_seconds = 0.0
+        self._completed = 0
+
+    # -- bucket (call with lock held) --
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _seconds_until_slot(self, now):
+        """Time until the rate limit allows another call (0 if it does now)"""
+        wait = max(0.0, self._paused_until - now)
+        if self.rate > 0 and self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def _try_take(self, now):
+        if self.max_concurrent and self.active >= self.max_concurrent:
+            return False
+        self._refill(now)
+        if self._seconds_until_slot(now) > 0:
+            return False
+        if self.rate > 0:
+            self._tokens -= 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        self.admitted += 1
+        return True
+
+    def _can_run_now(self):
+        now = time.monotonic()
+        if self.max_concurrent and self.active >= self.max_concurrent:
+            return False
+        self._refill(now)
+        return not self._queue and self._seconds_until_slot(now) == 0
+
+    def _retry_after(self, now):
+        """Rough seconds until a new caller would get a slot"""
+        rate = self.rate or math.inf
+        if self._completed and self.max_concurrent:
+            # Calls finish at about max_concurrent per average call duration
+            rate = min(rate, self.max_concurrent * self._completed / max(self._held_seconds, 0.001))
+        backlog = len(self._queue) + 1
+        estimate = self._seconds_until_slot(now) + (backlog / rate if rate != math.inf else 0)
+        return max(1, math.ceil(min(estimate, self.queue_timeout * 2)))
+
+    # -- public API --
+
+    def check(self):
+        """
+        Non-binding admission check, for callers that must answer before they
+        acquire (e.g. streaming responses)
+
+        Returns:
+            int or None: Retry-After seconds if a new caller would be rejected
+                         right now because the queue is full
+        """
+        with self._lock:
+            if len(self._queue) >= self.max_queue and not self._can_run_now():
+                return self._retry_after(time.monotonic())
+            return None
+
+    async def acquire(self):
+        """
+        Wait for a slot
+
+        Raises:
+            LLMOverloaded: Queue full, or no slot within queue_timeout
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+
+        with self._lock:
+            if not self._queue and self._try_take(start):
+                self._waits.append(0.0)
+                return
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloaded('queue full', self._retry_after(start))
+            waiter = _Waiter(loop)
+            self._queue.append(waiter)
+            self.queued += 1
+            self.peak_queue = max(self.peak_queue, len(self._queue))
+
+        granted = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    if self._queue[0] is waiter and self._try_take(now):
+                        self._queue.popleft()
+                        granted = True
+                        self._waits.append(now - start)
+                        # The next caller may be able to start as well
+                        if self._queue:
+                            self._queue[0].wake()
+                        return
+                    timeout = deadline - now
+                    if timeout <= 0:
+                        self.timed_out += 1
+                        raise LLMOverloaded('queue timeout', self._retry_after(now))
+                    if self._queue[0] is waiter:
+                        slot_wait = self._seconds_until_slot(now)
+                        if slot_wait > 0:
+                            timeout = min(timeout, slot_wait)
+                    waiter.future = loop.create_future()
+                    future = waiter.future
+
+                try:
+                    await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if not granted:
+                with self._lock:
+                    was_head = self._queue and self._queue[0] is waiter
+                    try:
+                        self._queue.remove(waiter)
+                    except ValueError:
+                        pass
+                    if was_head and self._queue:
+                        self._queue[0].wake()
+
+    def release(self, held_seconds=None):
+        """Return a slot taken by acquire()"""
+        with self._lock:
+            self.active -= 1
+            if held_seconds is not None:
+                self._held_seconds += held_seconds
+                self._completed += 1
+            if self._queue:
+                self._queue[0].wake()
+
+    def pause(self, seconds):
+        """
+        Stop admitting calls for a while, e.g. after the provider returned 429
+
+        Calls already running are not affected; queued callers keep waiting
+        (up to their deadline).
+        """
+        with self._lock:
+            self.provider_limited += 1
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._paused_until = max(self._paused_until, now + seconds)
+
+    @asynccontextmanager
+    async def slot(self):
+        """async with llm_limiter.slot(): ... - hold a slot for one Claude call"""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self):
+        """Return limiter state and counters as a JSON-serializable dict"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            waits = sorted(self._waits)
+
+            def percentile(fraction):
+                if not waits:
+                    return 0.0
+                return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1)
+
+            return {
+                'rate_per_minute': round(self.rate * 60, 2),
+                'burst': self.burst,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'active': self.active,
+                'peak_active': self.peak_active,
+                'queue_depth': len(self._queue),
+                'peak_queue_depth': self.peak_queue,
+                'tokens': round(self._tokens, 2),
+                'paused_for': round(max(0.0, self._paused_until - now), 1),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'provider_limited': self.provider_limited,
+                'wait_ms_avg': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                'wait_ms_p50': percentile(0.5),
+                'wait_ms_p95': percentile(0.95),
+                'wait_ms_max': round(waits[-1] * 1000, 1) if waits else 0.0,
+                'call_ms_avg': round(self._held_seconds / self._completed * 1000, 1) if self._completed else 0.0,
+            }
+
+
+# Process-wide limiter shared by generate_crew, analyze_photo and analyze_photos
+llm_limiter = LLMLimiter(
+    LLM_RATE_PER_MINUTE, LLM_BURST, LLM_MAX_CONCURRENT, LLM_QUEUE_SIZE, LLM_QUEUE_TIMEOUT
+)
@@ -0,0 +1,339 @@
+"""
+Pluggable transport for Claude calls: live, record or replay
+get_async_client() in views.py builds its client here. In record mode every
+response from the real API is appended to a JSONL cassette; in replay mode
+responses come from the cassette (with artificial latency) and no network
+is used, so the full views - parsing, enrichment, sprite matching - can be
+load tested offline.
+
+Cassette lines:
+    {"key": <request hash>, "route": "<model>:<tool or text>", "stream": bool,
+     "recorded_at": <ISO time>, "response": <Message as JSON>}
+
+The request itself is not stored (photos would bloat the file), only its
+hash. Replay looks up the exact request first, then falls back to the
+recorded responses for the same route in turn, so new descriptions and
+photos still get realistic answers.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+import anthropic
+from anthropic.types import Message
+
+# 'live' (default), 'record' or 'replay'
+LLM_TRANSPORT = os.getenv('LLM_TRANSPORT', 'live').lower()
+
+# Cassette file for record/replay (the default is gitignored - it holds real
+# crews and photo features)
+LLM_CASSETTE = os.getenv(
+    'LLM_CASSETTE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'llm_cassette.jsonl')
+)
+
+# Replay: delay before the response (or the first streamed chunk), and
+# between streamed chunks
+LLM_REPLAY_LATENCY_MS = float(os.getenv('LLM_REPLAY_LATENCY_MS', 0))
+LLM_REPLAY_CHUNK_MS = float(os.getenv('LLM_REPLAY_CHUNK_MS', 0))
+
+# Replay: fail on requests that were not recorded instead of reusing
+# another response for the same route
+LLM_REPLAY_STRICT = os.getenv('LLM_REPLAY_STRICT', '0') == '1'
+
+# Characters per streamed chunk when replaying
+REPLAY_CHUNK_CHARS = 24
+
+TRANSPORTS = ('live', 'record', 'replay')
+
+
+def request_key(kwargs):
+    """Stable hash of a messages.create/stream call (timeout excluded)"""
+    payload = {key: value for key, value in kwargs.items() if key not in ('timeout', 'extra_headers')}
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def request_route(kwargs):
+    """Model plus the forced tool (or 'text'): which recorded responses fit a request"""
+    tool_choice = kwargs.get('tool_choice') or {}
+    return f'{kwargs.get("model")}:{tool_choice.get("name", "text")}'
+
+
+class Cassette:
+    """Thread-safe JSONL store of recorded responses"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_route = defaultdict(list)
+        self._next = defaultdict(int)
+        self._loaded = False
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def _load(self):
+        """Read the cassette once (call with lock held)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            print(f'LLM cassette {self.path} does not exist yet')
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._add(entry)
+                except (ValueError, KeyError) as e:
+                    print(f'LLM cassette {self.path}:{number}: skipping bad entry ({e})')
+        print(f'LLM cassette loaded: {len(self._by_key)} responses from {self.path}')
+
+    def _add(self, entry):
+        self._by_key[entry['key']] = entry
+        self._by_route[entry['route']].append(entry)
+
+    def find(self, key, route):
+        """
+        Recorded entry for a request
+
+        Returns:
+            dict or None: The exact recording, else (unless strict) the next
+                          recording for the same route
+        """
+        with self._lock:
+            self._load()
+            entry = self._by_key.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            candidates = self._by_route.get(route)
+            if candidates and not LLM_REPLAY_STRICT:
+                self.fallbacks += 1
+                entry = candidates[self._next[route] % len(candidates)]
+                self._next[route] += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def record(self, key, route, stream, message):
+        """Append a response to the cassette (blocking - see record_async)"""
+        entry = {
+            'key': key,
+            'route': route,
+            'stream': stream,
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'response': message.model_dump(mode='json', exclude_none=True),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._load()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self._add(entry)
+            self.recorded += 1
+
+    async def record_async(self, key, route, stream, message):
+        """record() in a worker thread, keeping file I/O off the event loop"""
+        await asyncio.to_thread(self.record, key, route, stream, message)
+
+    def stats(self):
+        """Return cassette counters as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                'path': self.path,
+                'responses': len(self._by_key),
+                'routes': {route: len(entries) for route, entries in self._by_route.items()},
+                'hits': self.hits,
+                'fallbacks': self.fallbacks,
+                'misses': self.misses,
+                'recorded': self.recorded,
+            }
+
+
+class ReplayEvent:
+    """Minimal stand-in for the SDK's text / input_json stream events"""
+
+    def __init__(self, type, text=None, partial_json=None):
+        self.type = type
+        self.text = text
+        self.partial_json = partial_json
+
+
+class ReplayStream:
+    """Async context manager that streams a recorded Message back in chunks"""
+
+    def __init__(self, message):
+        self.message = message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def _events(self):
+        if LLM_REPLAY_LATENCY_MS:
+            await asyncio.sleep(LLM_REPLAY_LATENCY_MS / 1000)
+        for block in self.message.content:
+            if block.type == 'text':
+                chunks, event_type = block.text, 'text'
+            elif block.type == 'tool_use':
+                chunks, event_type = json.dumps(block.input), 'input_json'
+            else:
+                continue
+            for start in range(0, len(chunks), REPLAY_CHUNK_CHARS):
+                chunk = chunks[start:start + REPLAY_CHUNK_CHARS]
+                if event_type == 'text':
+                    yield ReplayEvent('text', text=chunk)
+                else:
+                    yield ReplayEvent('input_json', partial_json=chunk)
+                if LLM_REPLAY_CHUNK_MS:
+                    await asyncio.sleep(LLM_REPLAY_CHUNK_MS / 1000)
+
+    def __aiter__(self):
+        return self._events()
+
+    @property
+    def text_stream(self):
+        async def texts():
+            async for event in self._events():
+                if event.type == 'text':
+                    yield event.text
+        return texts()
+
+    async def get_final_message(self):
+        return self.message
+
+
+class ReplayMessages:
+    """messages.create / messages.stream served from the cassette"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def _lookup(self, kwargs):
+        entry = self.cassette.find(request_key(kwargs), request_route(kwargs))
+        if entry is None:
+            raise RuntimeError(
+                f'LLM replay: no recorded response for route {request_route(kwargs)} '
+                f'in {self.cassette.path} (record one with LLM_TRANSPORT=record)'
+            )
+        return Message.model_validate(entry['response'])
+
+    async def create(self, **kwargs):
+        message = self._lookup(kwargs)
+        if LLM_REPLAY_LATENCY_MS:
+            await asyncio.sleep(LLM_REPLAY_LATENCY_MS / 1000)
+        return message
+
+    def stream(self, **kwargs):
+        return ReplayStream(self._lookup(kwargs))
+
+
+class ReplayClient:
+    """Offline replacement for AsyncAnthropic"""
+
+    def __init__(self, cassette):
+        self.messages = ReplayMessages(cassette)
+
+
+class RecordingStream:
+    """Wraps a live MessageStreamManager and records the final message on exit"""
+
+    def __init__(self, manager, cassette, key, route):
+        self._manager = manager
+        self._cassette = cassette
+        self._key = key
+        self._route = route
+        self._stream = None
+
+    async def __aenter__(self):
+        self._stream = await self._manager.__aenter__()
+        return self._stream
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                # Reads any remaining events, so early exits record the full response
+                message = await self._stream.get_final_message()
+                await self._cassette.record_async(self._key, self._route, True, message)
+            except Exception as e:
+                print(f'LLM cassette: cannot record streamed response ({e})')
+        return await self._manager.__aexit__(exc_type, exc, tb)
+
+
+class RecordingMessages:
+    """messages.create / messages.stream on the real API, appending responses to the cassette"""
+
+    def __init__(self, messages, cassette):
+        self._messages = messages
+        self._cassette = cassette
+
+    async def create(self, **kwargs):
+        message = await self._messages.create(**kwargs)
+        await self._cassette.record_async(request_key(kwargs), request_route(kwargs), False, message)
+        return message
+
+    def stream(self, **kwargs):
+        return RecordingStream(
+            self._messages.stream(**kwargs), self._cassette, request_key(kwargs), request_route(kwargs)
+        )
+
+
+class RecordingClient:
+    """AsyncAnthropic whose message calls are recorded"""
+
+    def __init__(self, client, cassette):
+        self._client = client
+        self.messages = RecordingMessages(client.messages, cassette)
+
+
+# Process-wide cassette for record/replay
+cassette = Cassette(LLM_CASSETTE)
+
+
+def create_async_client(api_key, transport=None):
+    """
+    Client for the configured transport
+
+    Args:
+        api_key: Anthropic API key (unused when replaying)
+        transport: 'live', 'record' or 'replay' (default LLM_TRANSPORT)
+
+    Returns:
+        AsyncAnthropic, or a drop-in wrapper with the same messages.create
+        and messages.stream
+    """
+    transport = transport or LLM_TRANSPORT
+    if transport not in TRANSPORTS:
+        print(f'Unknown LLM_TRANSPORT {transport!r}, using live')
+        transport = 'live'
+    if transport == 'replay':
+        return ReplayClient(cassette)
+    client = anthropic.AsyncAnthropic(api_key=api_key)
+    if transport == 'record':
+        return RecordingClient(client, cassette)
+    return client
+
+
+def transport_stats():
+    """Transport and cassette state for health checks"""
+    stats = {'transport': LLM_TRANSPORT}
+    if LLM_TRANSPORT in ('record', 'replay'):
+        stats['cassette'] = cassette.stats()
+        if LLM_TRANSPORT == 'replay':
+            stats['latency_ms'] = LLM_REPLAY_LATENCY_MS
+            stats['chunk_ms'] = LLM_REPLAY_CHUNK_MS
+    return stats
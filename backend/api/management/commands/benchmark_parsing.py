@@ -0,0 +1,131 @@
+"""
+Replay recorded Claude responses through the text and tool-use parsers
+
+Times parse_crew_response / parse_photo_response (json.loads, then the
+markdown and bracket regex fallbacks) against validating the equivalent
+tool arguments with the compiled pydantic schemas, and counts responses
+each path fails on. No API calls are made.
+
+Usage:
+    python manage.py benchmark_parsing
+    python manage.py benchmark_parsing --responses recorded.jsonl --repeat 200
+
+Recorded responses are JSON lines: {"kind": "crew"|"photo", "text": "..."}
+and/or {"kind": ..., "tool_input": {...}}. Without --responses a built-in
+set of well-formed, fenced, chatty and truncated responses is used.
+"""
+import contextlib
+import io
+import json
+import time
+from django.core.management.base import BaseCommand
+from api.views import parse_crew_response, parse_photo_response
+from api.schemas import parse_crew_tool_input, parse_photo_tool_input
+
+SAMPLE_MEMBER = {
+    'FirstName': 'Jan', 'LastName': 'Kowalski', 'Nickname': 'Eagle', 'BirthDate': '1918-05-15',
+    'Gender': 'Male', 'Ethnicity': 'European', 'Class': 'AirCrew', 'Role': 'Pilot', 'Job': 'None',
+    'Biography': {'en': 'Flew with the Polish Air Force before escaping to Britain in 1940. '
+                        'Known for his calm voice on the radio.'},
+    'SkillRanks': {'Flying': 5, 'Shooting': 4, 'Bombing': 1, 'Endurance': 4, 'Engineering': 2, 'Navigating': 3},
+}
+
+SAMPLE_FEATURES = {
+    'face_detected': True, 'gender_presentation': 'Female', 'face_shape': 'oval',
+    'face_characteristics': ['soft curves', 'defined chin'], 'skin_tone': 'light medium',
+    'hair': {'present': True, 'length': 'medium', 'style': 'wavy', 'color': 'auburn', 'characteristics': ['natural']},
+    'facial_hair': {'beard': 'none', 'mustache': 'none'},
+    'nose': {'size': 'small', 'shape': 'button', 'bridge': 'low', 'characteristics': ['delicate']},
+    'eyes': {'shape': 'almond', 'size': 'medium', 'color': 'green'},
+    'mouth': {'size': 'medium', 'shape': 'full', 'expression': 'smiling'},
+    'accessories': {'glasses': 'none', 'other': []},
+    'age_markers': {'apparent_age': 'young', 'wrinkles': 'none', 'details': []},
+    'overall_characteristics': ['youthful', 'soft'],
+}
+
+
+def sample_responses():
+    """Text responses in the shapes seen from free-text prompts, plus their tool equivalents"""
+    crew = [dict(SAMPLE_MEMBER, FirstName=f'Member{i}') for i in range(8)]
+    crew_json = json.dumps(crew, indent=2)
+    features_json = json.dumps(SAMPLE_FEATURES, indent=2)
+    texts = {
+        'crew': [
+            crew_json,
+            f'```json\n{crew_json}\n```',
+            f'Here is the crew for 303 Squadron:\n\n{crew_json}\n\nLet me know if you want changes [optional].',
+            crew_json[:len(crew_json) * 2 // 3],
+        ],
+        'photo': [
+            features_json,
+            f'```json\n{features_json}\n```',
+            f'Sure! The photo shows:\n{features_json}\nNote: lighting was {{dim}}.',
+            features_json[:len(features_json) // 2],
+        ],
+    }
+    responses = []
+    for kind, variants in texts.items():
+        tool_input = {'crew': crew} if kind == 'crew' else SAMPLE_FEATURES
+        for text in variants:
+            responses.append({'kind': kind, 'text': text})
+        responses.append({'kind': kind, 'tool_input': tool_input})
+    return responses
+
+
+class Command(BaseCommand):
+    help = 'Compare free-text JSON parsing with schema-validated tool arguments over recorded responses'
+
+    # Offline tool - does not need URL/model checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--responses',
+            default=None,
+            help='JSONL file of recorded responses (default: built-in samples)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=500,
+            help='Times each response is parsed (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        if options['responses']:
+            with open(options['responses'], encoding='utf-8') as f:
+                responses = [json.loads(line) for line in f if line.strip()]
+        else:
+            responses = sample_responses()
+
+        parsers = {
+            ('crew', 'text'): parse_crew_response,
+            ('crew', 'tool_input'): parse_crew_tool_input,
+            ('photo', 'text'): parse_photo_response,
+            ('photo', 'tool_input'): parse_photo_tool_input,
+        }
+
+        for (kind, field), parse in parsers.items():
+            payloads = [response[field] for response in responses
+                        if response.get('kind') == kind and field in response]
+            if not payloads:
+                continue
+
+            failures = 0
+            start = time.perf_counter()
+            # The parsers log every attempt; keep that out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(options['repeat']):
+                    for payload in payloads:
+                        try:
+                            parse(payload)
+                        except ValueError:
+                            failures += 1
+            elapsed = time.perf_counter() - start
+
+            calls = options['repeat'] * len(payloads)
+            self.stdout.write(
+                f'{kind:<5} {field:<10} {len(payloads):>4} responses  '
+                f'{elapsed / calls * 1e6:>8.1f} us/parse  '
+                f'{failures // options["repeat"]} failed'
+            )
@@ -0,0 +1,280 @@
+"""
+Compare Claude prompt size and latency before and after the cached system prompts
+
+Counts input tokens for the old single-message prompts and the current
+system + user prompts (api/prompts.py) with the token counting endpoint, and
+with --live also measures time to first token and prompt cache usage over
+real streamed calls.
+
+Usage:
+    python manage.py benchmark_prompts
+    python manage.py benchmark_prompts --live 5 --photo selfie.jpg
+"""
+import base64
+import json
+import os
+import statistics
+import time
+from io import BytesIO
+import anthropic
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageDraw
+from api.prompts import crew_request, photo_request
+
+MODEL = 'claude-sonnet-4-5'
+
+DEFAULT_DESCRIPTION = 'Polish 303 Squadron, Battle of Britain, 8 airmen and 2 mechanics'
+
+
+def baseline_crew_prompt(description):
+    """generate_crew prompt before the system/user split (one user message)"""
+    return f"""You are a crew generator for a WW2 aviation game. Generate a crew based on this description: "{description}"
+
+IMPORTANT: Return ONLY valid JSON, no markdown formatting, no code blocks, no explanations.
+
+Requirements:
+- Generate an appropriate number of crew members (if not specified, generate 5-10)
+- MAXIMUM 10 crew members total - never generate more than 10
+- All birth dates must be before 1922 (valid format: YYYY-MM-DD)
+- Use authentic names appropriate for the nationality/squadron mentioned
+- Class must be either "AirCrew" or "BaseCrew"
+- For AirCrew: Role must be one of: Pilot, Gunner, Navigator, BombAimer, FlightEngineer, RadioOperator
+- For BaseCrew: Job must be one of: AAFCook, FieldMechanic, FieldEngineer, RAFMedic, AAFLabour
+- Skill ranks must be 0-6 (only for AirCrew)
+- Gender must be "Male" or "Female"
+- Create brief but authentic biographies (2-3 sentences)
+- Add "Ethnicity" field: Based on the nationality/description, specify the ethnicity/appearance
+  Valid values: "European", "African", "Asian", "MiddleEastern", "Hispanic", "Mixed"
+  Examples: Polish → European, Tuskegee Airmen → African, Japanese → Asian
+
+Return a JSON array with this EXACT structure:
+[
+  {{
+    "FirstName": "Jan",
+    "LastName": "Kowalski",
+    "Nickname": "Eagle",
+    "BirthDate": "1918-05-15",
+    "Gender": "Male",
+    "Ethnicity": "European",
+    "Class": "AirCrew",
+    "Role": "Pilot",
+    "Job": "None",
+    "Biography": {{
+      "en": "Brief biography here..."
+    }},
+    "SkillRanks": {{
+      "Flying": 4,
+      "Shooting": 3,
+      "Bombing": 2,
+      "Endurance": 5,
+      "Engineering": 2,
+      "Navigating": 3
+    }}
+  }}
+]
+
+Generate the crew now:"""
+
+
+BASELINE_PHOTO_PROMPT = """Analyze this portrait photo and extract facial features in structured JSON format.
+
+REQUIREMENTS:
+- Detect ONE person's face (if multiple, analyze the most prominent)
+- Return detailed, descriptive terms (not measurements)
+- Use terms like: angular, soft, rounded, square, oval, delicate, prominent, etc.
+
+Return JSON with this EXACT structure:
+{
+  "face_detected": true,
+  "gender_presentation": "Male|Female|Ambiguous",
+  "face_shape": "oval|round|square|heart|diamond|rectangular|angular",
+  "face_characteristics": ["angular jaw", "defined chin", "soft curves"],
+
+  "skin_tone": "very light|light|light medium|medium|olive|brown|dark brown",
+
+  "hair": {
+    "present": true,
+    "length": "bald|very short|short|medium|long",
+    "style": "spiky|wavy|straight|curly|swept|slicked|messy|ponytail|bob",
+    "color": "black|dark brown|brown|light brown|blonde|red|auburn|gray|white",
+    "characteristics": ["messy", "styled", "natural"]
+  },
+
+  "facial_hair": {
+    "beard": "none|stubble|goatee|full",
+    "mustache": "none|thin|handlebar|chevron|walrus"
+  },
+
+  "nose": {
+    "size": "small|medium|large",
+    "shape": "rounded|angular|curved|straight|button|hook|upturned",
+    "bridge": "low|medium|high",
+    "characteristics": ["delicate", "prominent", "feminine", "masculine"]
+  },
+
+  "eyes": {
+    "shape": "almond|round|narrow|wide",
+    "size": "small|medium|large",
+    "color": "blue|green|brown|hazel|gray|amber"
+  },
+
+  "mouth": {
+    "size": "small|medium|large",
+    "shape": "full|thin|neutral",
+    "expression": "neutral|smiling|frowning"
+  },
+
+  "accessories": {
+    "glasses": "none|round|rectangular|monocle",
+    "other": ["beauty mark", "scar", "etc"]
+  },
+
+  "age_markers": {
+    "apparent_age": "young|middle|mature|elderly",
+    "wrinkles": "none|minimal|moderate|prominent",
+    "details": ["crow's feet", "smile lines", "forehead lines"]
+  },
+
+  "overall_characteristics": ["youthful", "strong", "delicate", "angular", "soft"]
+}
+
+Analyze the photo now and return ONLY the JSON, no markdown, no explanations."""
+
+
+def baseline_request(kind, description, image_base64, mime_type):
+    """Prompt arguments as sent before the system/user split"""
+    if kind == 'crew':
+        return {'messages': [{'role': 'user', 'content': baseline_crew_prompt(description)}]}
+    return {
+        'messages': [
+            {
+                'role': 'user',
+                'content': [
+                    {'type': 'image', 'source': {'type': 'base64', 'media_type': mime_type, 'data': image_base64}},
+                    {'type': 'text', 'text': BASELINE_PHOTO_PROMPT}
+                ]
+            }
+        ]
+    }
+
+
+def current_request(kind, description, image_base64, mime_type):
+    """Prompt arguments as sent by the views now"""
+    if kind == 'crew':
+        return crew_request(description)
+    return photo_request(image_base64, mime_type)
+
+
+def prompt_text(request):
+    """All text in a request's tools, system and messages, for the offline estimate"""
+    parts = [json.dumps(tool) for tool in request.get('tools', [])]
+    parts += [block['text'] for block in request.get('system', [])]
+    for message in request['messages']:
+        content = message['content']
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block['text'] for block in content if block['type'] == 'text')
+    return ''.join(parts)
+
+
+def sample_photo():
+    """Small synthetic portrait, so photo prompts can be counted without a file"""
+    image = Image.new('RGB', (384, 512), (200, 170, 150))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((92, 96, 292, 376), fill=(225, 190, 165))
+    draw.ellipse((140, 200, 170, 220), fill=(60, 40, 30))
+    draw.ellipse((214, 200, 244, 220), fill=(60, 40, 30))
+    draw.arc((150, 280, 234, 330), 20, 160, fill=(120, 50, 50), width=4)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return base64.b64encode(buffer.getvalue()).decode('ascii'), 'image/jpeg'
+
+
+class Command(BaseCommand):
+    help = 'Compare input tokens and time to first token of the old and current Claude prompts'
+
+    # Offline tool - does not need URL/model checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--description',
+            default=DEFAULT_DESCRIPTION,
+            help='Crew description used for the crew prompts'
+        )
+        parser.add_argument(
+            '--photo',
+            default=None,
+            help='JPEG/PNG/WebP portrait for the photo prompts (default: a generated placeholder)'
+        )
+        parser.add_argument(
+            '--live',
+            type=int,
+            default=0,
+            help='Also make this many streamed calls per prompt variant and report time to first token'
+        )
+        parser.add_argument(
+            '--only',
+            choices=['crew', 'photo'],
+            default=None,
+            help='Benchmark only one endpoint'
+        )
+
+    def handle(self, *args, **options):
+        if options['photo']:
+            with open(options['photo'], 'rb') as f:
+                image_base64 = base64.b64encode(f.read()).decode('ascii')
+            extension = os.path.splitext(options['photo'])[1].lower().lstrip('.')
+            mime_type = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
+                         'webp': 'image/webp'}.get(extension, 'image/jpeg')
+        else:
+            image_base64, mime_type = sample_photo()
+
+        api_key = os.getenv('ANTHROPIC_API_KEY')
+        client = anthropic.Anthropic(api_key=api_key) if api_key else None
+        if client is None:
+            if options['live']:
+                raise CommandError('--live needs ANTHROPIC_API_KEY')
+            self.stdout.write(self.style.WARNING(
+                'ANTHROPIC_API_KEY not set - estimating tokens as characters / 4 (text only)'
+            ))
+
+        kinds = [options['only']] if options['only'] else ['crew', 'photo']
+        for kind in kinds:
+            variants = [
+                ('before', baseline_request(kind, options['description'], image_base64, mime_type)),
+                ('after', current_request(kind, options['description'], image_base64, mime_type)),
+            ]
+            self.stdout.write(f'\n{kind}:')
+            for name, request in variants:
+                if client is not None:
+                    tokens = client.messages.count_tokens(model=MODEL, **request).input_tokens
+                    self.stdout.write(f'  {name:<6} {tokens:>6} input tokens')
+                else:
+                    tokens = len(prompt_text(request)) // 4
+                    self.stdout.write(f'  {name:<6} ~{tokens:>5} text tokens')
+
+            if options['live']:
+                for name, request in variants:
+                    self.stdout.write(f'  {name:<6} {self.measure(client, request, options["live"])}')
+
+    def measure(self, client, request, runs):
+        """Time to first token and cache usage over sequential streamed calls"""
+        first_token_ms, total_ms, cache_read, cache_write = [], [], 0, 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            first = None
+            with client.messages.stream(model=MODEL, max_tokens=2048, **request) as stream:
+                for _text in stream.text_stream:
+                    if first is None:
+                        first = time.perf_counter()
+                usage = stream.get_final_message().usage
+            end = time.perf_counter()
+            first_token_ms.append(((first or end) - start) * 1000)
+            total_ms.append((end - start) * 1000)
+            cache_read += getattr(usage, 'cache_read_input_tokens', 0) or 0
+            cache_write += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        return (f'TTFT median {statistics.median(first_token_ms):.0f} ms, '
+                f'total median {statistics.median(total_ms):.0f} ms, '
+                f'cache read {cache_read} / write {cache_write} tokens over {runs} calls')
@@ -0,0 +1,63 @@
+"""
+Build the precomputed tinted-sprite atlas
+
+Usage:
+    python manage.py build_sprite_atlas
+    python manage.py build_sprite_atlas --size 256 --folder 10_Hair_Hair
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import postcard_generator
+from api.sprite_atlas import build_sprite_atlas, get_atlas_dir
+
+
+class Command(BaseCommand):
+    help = 'Pre-tint every sprite for every palette color and pack them into mmap-able atlas files'
+
+    # Offline build step - does not need URL/model checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-path',
+            default=None,
+            help='Static files directory containing PortraitSprites/ (default: STATIC_ROOT)'
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Atlas output directory (default: SPRITE_ATLAS_DIR, backend/sprite_atlas)'
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            action='append',
+            dest='sizes',
+            help='Square render size in pixels; repeat for several (default: every postcard slot size)'
+        )
+        parser.add_argument(
+            '--folder',
+            action='append',
+            dest='folders',
+            help='Only build this sprite folder; repeat for several (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        base_path = options['base_path'] or settings.STATIC_ROOT
+        if options['sizes']:
+            sizes = [(s, s) for s in options['sizes']]
+        else:
+            sizes = postcard_generator.get_render_sizes()
+        output_dir = options['output'] or get_atlas_dir()
+
+        self.stdout.write(f'Building sprite atlas in {output_dir} for sizes {sizes}')
+        start = time.perf_counter()
+        results = build_sprite_atlas(base_path, sizes, output_dir, options['folders'])
+
+        total_entries = sum(r['entries'] for r in results.values())
+        total_bytes = sum(r['bytes'] for r in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {len(results)} atlases: {total_entries} sprites, '
+            f'{total_bytes / (1024 * 1024):.1f} MB in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,166 @@
+"""
+Load test the Claude-backed views offline, replaying a recorded cassette
+
+Runs generate-crew / analyze-photo / analyze-photos through the full Django
+views (parsing, enrichment, sprite matching, limiter) with LLM_TRANSPORT
+forced to replay, so no network or API key is needed. Record a cassette
+first with LLM_TRANSPORT=record, or use --seed for synthetic responses.
+
+Usage:
+    python manage.py loadtest_llm --seed
+    python manage.py loadtest_llm --endpoint crew-stream --requests 500 --concurrency 50
+    LLM_REPLAY_LATENCY_MS=800 python manage.py loadtest_llm --endpoint photo --photo selfie.jpg
+"""
+import asyncio
+import base64
+import json
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from anthropic.types import Message
+from api import llm_transport
+from api.crew_cache import crew_cache
+from api.llm_limiter import llm_limiter
+from api.photo_cache import photo_cache
+from api.schemas import CREW_TOOL_NAME, PHOTO_TOOL_NAME
+from api.management.commands.benchmark_parsing import SAMPLE_MEMBER, SAMPLE_FEATURES
+from api.management.commands.benchmark_prompts import MODEL, sample_photo
+
+ENDPOINTS = {
+    'crew': '/api/generate-crew',
+    'crew-stream': '/api/generate-crew',
+    'photo': '/api/analyze-photo',
+    'photos': '/api/analyze-photos',
+}
+
+
+def synthetic_message(tool_name, arguments):
+    """A tool_use response like the ones Claude returns"""
+    return Message.model_validate({
+        'id': 'msg_synthetic',
+        'type': 'message',
+        'role': 'assistant',
+        'model': MODEL,
+        'content': [{'type': 'tool_use', 'id': 'toolu_synthetic', 'name': tool_name, 'input': arguments}],
+        'stop_reason': 'tool_use',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 0, 'output_tokens': 0},
+    })
+
+
+class Command(BaseCommand):
+    help = 'Load test the Claude-backed API views offline from an LLM cassette'
+
+    # Offline tool - does not need URL/model checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='crew')
+        parser.add_argument('--requests', type=int, default=200, help='Total requests (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight (default: 20)')
+        parser.add_argument('--photo', default=None, help='Photo for the photo endpoints (default: a placeholder)')
+        parser.add_argument('--batch-size', type=int, default=5, help='Photos per analyze-photos request')
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Append synthetic crew and photo responses to the cassette for routes without recordings'
+        )
+        parser.add_argument(
+            '--keep-limiter',
+            action='store_true',
+            help='Apply the LLM_* rate and concurrency limits (by default replayed calls are not limited)'
+        )
+        parser.add_argument(
+            '--keep-caches',
+            action='store_true',
+            help='Leave the crew and photo caches on (by default they are bypassed so every request replays)'
+        )
+
+    def handle(self, *args, **options):
+        # Never reach the network from a load test
+        llm_transport.LLM_TRANSPORT = 'replay'
+        # The in-process test client calls itself 'testserver' (as under manage.py test)
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        cassette = llm_transport.cassette
+
+        if options['seed']:
+            routes = cassette.stats()['routes']
+            crew = [dict(SAMPLE_MEMBER, FirstName=f'Member{i}') for i in range(8)]
+            for tool_name, arguments in ((CREW_TOOL_NAME, {'crew': crew}), (PHOTO_TOOL_NAME, SAMPLE_FEATURES)):
+                route = f'{MODEL}:{tool_name}'
+                if not routes.get(route):
+                    cassette.record(f'synthetic-{tool_name}', route, False, synthetic_message(tool_name, arguments))
+                    self.stdout.write(f'Seeded {route} in {cassette.path}')
+
+        if not options['keep_limiter']:
+            llm_limiter.rate = 0
+            llm_limiter.max_concurrent = 0
+
+        if not options['keep_caches']:
+            crew_cache.max_entries = 0
+            photo_cache.max_entries = 0
+
+        if options['photo']:
+            with open(options['photo'], 'rb') as f:
+                image_base64 = base64.b64encode(f.read()).decode('ascii')
+            mime_type = 'image/png' if options['photo'].lower().endswith('.png') else 'image/jpeg'
+        else:
+            image_base64, mime_type = sample_photo()
+
+        endpoint = options['endpoint']
+
+        def body(index):
+            if endpoint == 'crew':
+                return {'description': f'Load test squadron {index}'}
+            if endpoint == 'crew-stream':
+                return {'description': f'Load test squadron {index}', 'stream': 'ndjson'}
+            photo = {'image': image_base64, 'mimeType': mime_type}
+            if endpoint == 'photo':
+                return photo
+            return {'photos': [photo] * options['batch_size']}
+
+        results = asyncio.run(self.run(endpoint, body, options['requests'], options['concurrency']))
+
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        latencies = sorted(ms for _, ms in results)
+        elapsed = self.elapsed
+
+        self.stdout.write(f'{endpoint}: {len(results)} requests, concurrency {options["concurrency"]}, '
+                          f'replay latency {llm_transport.LLM_REPLAY_LATENCY_MS:.0f} ms')
+        self.stdout.write(f'  status:     {statuses}')
+        self.stdout.write(f'  throughput: {len(results) / elapsed:.1f} req/s over {elapsed:.2f} s')
+        self.stdout.write(
+            f'  latency:    median {statistics.median(latencies):.1f} ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0]:.1f} ms, '
+            f'max {latencies[-1]:.1f} ms'
+        )
+        self.stdout.write(f'  cassette:   {json.dumps(cassette.stats())}')
+
+        failed = sum(count for status, count in statuses.items() if status >= 400 and status != 429)
+        if failed:
+            raise CommandError(f'{failed} requests failed')
+
+    async def run(self, endpoint, body, total, concurrency):
+        """Send total requests, concurrency at a time, and return (status, ms) per request"""
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    ENDPOINTS[endpoint], json.dumps(body(index)), content_type='application/json'
+                )
+                if response.streaming:
+                    async for _chunk in response.streaming_content:
+                        pass
+                return response.status_code, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(index) for index in range(total)))
+        self.elapsed = time.perf_counter() - start
+        return results
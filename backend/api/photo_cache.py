@@ -0,0 +1,156 @@
+"""
+Cache of Claude Vision results for uploaded photos
+Photos are keyed on an exact SHA-256 of the uploaded bytes plus a 64-bit
+difference hash (dHash) of the decoded image, so re-uploads and re-encoded
+copies of the same selfie reuse the detected features instead of making
+another vision call.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+# Maximum number of photos remembered (0 disables the cache)
+PHOTO_CACHE_MAX_ENTRIES = int(os.getenv('PHOTO_CACHE_MAX_ENTRIES', 1000))
+
+# Maximum dHash bit difference (of 64) still treated as the same photo
+PHOTO_CACHE_HAMMING_THRESHOLD = int(os.getenv('PHOTO_CACHE_HAMMING_THRESHOLD', 4))
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of a PIL image
+
+    Grayscale, shrink to (hash_size + 1) x hash_size and record whether each
+    pixel is brighter than its right neighbour.
+
+    Returns:
+        int: hash_size * hash_size bit hash
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def usable_dhash(value, hash_bits=64):
+    """Drop near-constant hashes (flat or featureless images), which would match each other"""
+    if value is None or value.bit_count() <= 4 or value.bit_count() >= hash_bits - 4:
+        return None
+    return value
+
+
+def photo_fingerprint(image_bytes, image=None):
+    """
+    Exact and perceptual fingerprint of an uploaded photo
+
+    Args:
+        image_bytes: Uploaded bytes
+        image: Already decoded image, to avoid decoding twice
+
+    Returns:
+        tuple: (sha256 hex, dHash int or None if Pillow cannot decode the
+               image or it is too featureless for perceptual matching)
+    """
+    sha256 = hashlib.sha256(image_bytes).hexdigest()
+    if image is not None:
+        return sha256, usable_dhash(dhash(image))
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            perceptual = usable_dhash(dhash(image))
+    except Exception as e:
+        print(f'Photo fingerprint: cannot decode image ({e}), exact match only')
+        perceptual = None
+    return sha256, perceptual
+
+
+class PhotoFeatureCache:
+    """
+    Thread-safe LRU of photo fingerprint -> detected features
+
+    Lookups match the exact SHA-256 first, then any entry whose dHash is
+    within the Hamming threshold.
+    """
+
+    def __init__(self, max_entries, threshold):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._items = OrderedDict()  # sha256 -> (dhash, features)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        """Return cached features for a photo fingerprint, or None"""
+        if self.max_entries <= 0:
+            return None
+
+        sha256, perceptual = fingerprint
+        with self._lock:
+            entry = self._items.get(sha256)
+            if entry is not None:
+                self._items.move_to_end(sha256)
+                self.exact_hits += 1
+                return entry[1]
+
+            if perceptual is not None:
+                best_key, best_distance = None, self.threshold + 1
+                for key, (other, _) in self._items.items():
+                    if other is None:
+                        continue
+                    distance = (perceptual ^ other).bit_count()
+                    if distance < best_distance:
+                        best_key, best_distance = key, distance
+                if best_key is not None:
+                    self._items.move_to_end(best_key)
+                    self.near_hits += 1
+                    return self._items[best_key][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint, features):
+        """Remember detected features for a photo (treat them as read-only afterwards)"""
+        if self.max_entries <= 0:
+            return
+
+        sha256, perceptual = fingerprint
+        with self._lock:
+            self._items[sha256] = (perceptual, features)
+            self._items.move_to_end(sha256)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached results and reset counters"""
+        with self._lock:
+            self._items.clear()
+            self.exact_hits = 0
+            self.near_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return cache counters as a JSON-serializable dict"""
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._items),
+                'max_entries': self.max_entries,
+                'hamming_threshold': self.threshold,
+                'exact_hits': self.exact_hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide cache used by the analyze_photo view
+photo_cache = PhotoFeatureCache(PHOTO_CACHE_MAX_ENTRIES, PHOTO_CACHE_HAMMING_THRESHOLD)
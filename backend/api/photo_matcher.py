@@ -1,20 +1,14 @@
 """
 Photo matching logic - maps detected facial features to sprite assets
 """
-import json
-import os
+import threading
+from collections import Counter
 from .character_generator import (
     LAYERS, COLOR_PALETTES,
     get_available_indices, get_available_variants,
     get_matching_hairback_indices
 )
-
-
-def load_sprite_metadata():
-    """Load sprite metadata from JSON file"""
-    metadata_path = os.path.join(os.path.dirname(__file__), 'sprite-metadata.json')
-    with open(metadata_path, 'r') as f:
-        return json.load(f)
+from .sprite_metadata import get_sprite_metadata
 
 
 def match_features_to_sprites(detected_features):
@@ -28,7 +22,7 @@ def match_features_to_sprites(detected_features):
     Returns:
         dict: Character configuration
     """
-    sprite_metadata = load_sprite_metadata()
+    sprite_metadata = get_sprite_metadata()
 
     gender = map_gender(detected_features.get('gender_presentation', 'Male'))
 
@@ -313,10 +307,121 @@ def match_blemishes(other_accessories, sprite_metadata):
     return {'index': -1, 'variant': -1, 'confidence': 1.0}
 
 
+def term_weight(term_lower, sprite_term_lower):
+    """Score for one detected term against one sprite term (both lowercased)"""
+    # Exact match
+    if term_lower == sprite_term_lower:
+        return 2
+    # Sprite term contains detected term
+    if term_lower in sprite_term_lower:
+        return 1
+    # Detected term contains sprite term
+    if sprite_term_lower in term_lower:
+        return 0.5
+    return 0
+
+
+class LayerTagIndex:
+    """
+    Compiled tag matcher for one layer's sprite metadata
+
+    Holds an inverted index of lowercased sprite terms -> (sprite, occurrences)
+    and per-gender candidate lists over the layer's SpriteRecords.
+    A detected term is compared against the layer's distinct terms once
+    (memoized), not against every term of every sprite.
+    """
+
+    # Detected-term memo size before it is reset
+    MAX_MEMO_TERMS = 4096
+
+    def __init__(self, records):
+        self.sprites = [(record.index, record.variant, record.gender_fit) for record in records]
+        self.postings = {}
+        for position, record in enumerate(records):
+            for term, count in Counter(t.lower() for t in record.terms).items():
+                self.postings.setdefault(term, []).append((position, count))
+
+        self._term_matches = {}
+        self._candidates = {}
+
+    def term_matches(self, term_lower):
+        """[(sprite term, weight)] for every layer term a detected term scores against"""
+        matches = self._term_matches.get(term_lower)
+        if matches is None:
+            matches = []
+            for sprite_term in self.postings:
+                weight = term_weight(term_lower, sprite_term)
+                if weight:
+                    matches.append((sprite_term, weight))
+            if len(self._term_matches) >= self.MAX_MEMO_TERMS:
+                self._term_matches = {}
+            self._term_matches[term_lower] = matches
+        return matches
+
+    def candidates(self, gender):
+        """Positions of sprites that fit the gender (all sprites when gender is None)"""
+        key = gender.lower() if gender else None
+        positions = self._candidates.get(key)
+        if positions is None:
+            positions = [
+                position for position, (_, _, gender_fit) in enumerate(self.sprites)
+                if not key or gender_fit == 'both' or gender_fit == key
+            ]
+            self._candidates[key] = positions
+        return positions
+
+    def best_match(self, detected_terms, gender):
+        """
+        Highest scoring sprite (first in metadata order on ties)
+
+        Returns:
+            tuple: (index, variant, score), or None when nothing scores above 0
+        """
+        scores = [0] * len(self.sprites)
+        for term in detected_terms:
+            if not term:
+                continue
+            for sprite_term, weight in self.term_matches(term.lower()):
+                for position, count in self.postings[sprite_term]:
+                    scores[position] += weight * count
+
+        best_position, best_score = None, 0
+        for position in self.candidates(gender):
+            if scores[position] > best_score:
+                best_position, best_score = position, scores[position]
+
+        if best_position is None:
+            return None
+        index, variant, _ = self.sprites[best_position]
+        return index, variant, best_score
+
+
+_tag_index_lock = threading.Lock()
+
+
+def get_layer_tag_index(sprite_metadata, layer_key):
+    """Return the compiled LayerTagIndex for a layer folder, built once per metadata snapshot"""
+    indexes = sprite_metadata.derived.setdefault('tag_indexes', {})
+    index = indexes.get(layer_key)
+    if index is None:
+        with _tag_index_lock:
+            index = indexes.get(layer_key)
+            if index is None:
+                index = LayerTagIndex(sprite_metadata.layer(layer_key))
+                indexes[layer_key] = index
+    return index
+
+
 def match_layer_by_tags(layer_name, detected_terms, gender, sprite_metadata):
     """
     Generic tag-based matching for any layer
     Compares detected terms with sprite metadata tags
+
+    Args:
+        sprite_metadata: SpriteMetadata snapshot (see get_sprite_metadata)
+
+    Scoring per detected term and sprite term: exact match 2, sprite term
+    contains detected term 1, detected term contains sprite term 0.5.
     """
     layer = LAYERS.get(layer_name)
     if not layer:
@@ -324,9 +429,7 @@ def match_layer_by_tags(layer_name, detected_terms, gender, sprite_metadata):
         return {'index': 0, 'variant': 0, 'confidence': 0}
 
     layer_key = layer['folder']
-    layer_sprites = sprite_metadata.get('categories', {}).get(layer_key)
-
-    if not layer_sprites:
+    if not sprite_metadata.layer(layer_key):
         print(f'Sprite metadata for {layer_key} not found')
         # Return default
         available_indices = get_available_indices(layer_name, gender)
@@ -336,66 +439,20 @@ def match_layer_by_tags(layer_name, detected_terms, gender, sprite_metadata):
             'confidence': 0
         }
 
-    best_match = {'filename': None, 'score': 0, 'index': -1, 'variant': -1}
-
-    for filename, metadata in layer_sprites.items():
-        # Skip gender-mismatched sprites
-        if gender and metadata.get('gender_fit') != 'both' and metadata.get('gender_fit') != gender.lower():
-            continue
-
-        # Calculate match score based on tag overlap
-        score = 0
-        sprite_tags = metadata.get('tags', [])
-        characteristics = metadata.get('characteristics', '')
-        sprite_characteristics = [s.strip() for s in characteristics.split(',')] if characteristics else []
-        all_sprite_terms = sprite_tags + sprite_characteristics + [
-            metadata.get('style'),
-            metadata.get('shape'),
-            metadata.get('description')
-        ]
-        all_sprite_terms = [t for t in all_sprite_terms if t]
-
-        for term in detected_terms:
-            if not term:
-                continue
-            term_lower = term.lower()
-
-            for sprite_term in all_sprite_terms:
-                if not sprite_term:
-                    continue
-                sprite_term_lower = sprite_term.lower()
-
-                # Exact match
-                if term_lower == sprite_term_lower:
-                    score += 2
-                # Sprite term contains detected term
-                elif term_lower in sprite_term_lower:
-                    score += 1
-                # Detected term contains sprite term
-                elif sprite_term_lower in term_lower:
-                    score += 0.5
-
-        if score > best_match['score']:
-            # Extract index and variant from filename
-            import re
-            match = re.search(r'(\w+)_(\d+)_(\d+)', filename)
-            if match:
-                best_match = {
-                    'filename': filename,
-                    'score': score,
-                    'index': int(match.group(2)),
-                    'variant': int(match.group(3))
-                }
+    best_match = get_layer_tag_index(sprite_metadata, layer_key).best_match(detected_terms, gender)
 
     # If no good match found (score < 1), use defaults
-    if best_match['score'] < 1:
+    if best_match is None or best_match[2] < 1:
         available_indices = get_available_indices(layer_name, gender)
-        best_match['index'] = available_indices[0] if available_indices else 0
-        best_match['variant'] = 0
-        best_match['score'] = 0
+        return {
+            'index': available_indices[0] if available_indices else 0,
+            'variant': 0,
+            'confidence': 0
+        }
 
+    index, variant, score = best_match
     return {
-        'index': best_match['index'],
-        'variant': best_match['variant'],
-        'confidence': min(best_match['score'] / 3, 1.0)  # Normalize to 0-1
+        'index': index,
+        'variant': variant,
+        'confidence': min(score / 3, 1.0)  # Normalize to 0-1
     }
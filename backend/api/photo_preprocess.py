@@ -0,0 +1,186 @@
+"""
+Photo preprocessing before Claude Vision upload
+Uploaded photos are decoded once, rotated upright from EXIF, cropped to a
+portrait-friendly aspect ratio, downscaled to a maximum edge and re-encoded,
+so phone photos reach Claude at a fraction of their original size.
+"""
+import base64
+import math
+import os
+import time
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# HEIC/HEIF decoding is optional (pip install pillow-heif)
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+
+# Longest edge sent to Claude (larger images are downscaled by the API anyway)
+PHOTO_MAX_EDGE = int(os.getenv('PHOTO_MAX_EDGE', 1568))
+
+# Crop images more elongated than this (long side / short side)
+PHOTO_CROP_MAX_ASPECT = float(os.getenv('PHOTO_CROP_MAX_ASPECT', 1.5))
+
+# Upload encoding: 'jpeg' or 'webp'
+PHOTO_UPLOAD_FORMAT = 'webp' if os.getenv('PHOTO_UPLOAD_FORMAT', 'jpeg').lower() == 'webp' else 'jpeg'
+PHOTO_UPLOAD_QUALITY = int(os.getenv('PHOTO_UPLOAD_QUALITY', 85))
+
+# Uploads with more pixels than this are rejected before decoding
+PHOTO_MAX_PIXELS = int(os.getenv('PHOTO_MAX_PIXELS', 50_000_000))
+
+# Formats Claude Vision accepts as-is
+CLAUDE_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+
+
+class PhotoTooLarge(ValueError):
+    """Upload has more than PHOTO_MAX_PIXELS pixels"""
+
+
+def draft_size(width, height):
+    """
+    Smallest size to decode at that still yields PHOTO_MAX_EDGE after crop_portrait
+
+    Returns:
+        tuple: (width, height), or None if the photo is not larger than needed
+    """
+    long_edge, short_edge = max(width, height), min(width, height)
+    cropped_edge = min(long_edge, short_edge * PHOTO_CROP_MAX_ASPECT)
+    scale = PHOTO_MAX_EDGE / cropped_edge
+    if scale >= 1:
+        return None
+    return (math.ceil(width * scale), math.ceil(height * scale))
+
+
+def decode_photo(image_bytes):
+    """
+    Decode an uploaded photo once, upright (EXIF orientation applied)
+
+    The header is read first: photos over PHOTO_MAX_PIXELS are rejected
+    without decoding, and JPEGs are decoded by libjpeg at a reduced scale
+    (1/2, 1/4 or 1/8) when that still covers PHOTO_MAX_EDGE.
+
+    Returns:
+        PIL Image, or None if the format cannot be decoded here
+
+    Raises:
+        PhotoTooLarge: If the photo has more than PHOTO_MAX_PIXELS pixels
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise PhotoTooLarge(f'Photo is too large ({e})') from e
+    except Exception as e:
+        print(f'Photo preprocessing: cannot decode image ({e})')
+        return None
+
+    width, height = image.size
+    if width * height > PHOTO_MAX_PIXELS:
+        raise PhotoTooLarge(
+            f'Photo is too large ({width}x{height}, at most {PHOTO_MAX_PIXELS // 1_000_000} megapixels)'
+        )
+
+    try:
+        if image.format == 'JPEG':
+            target = draft_size(width, height)
+            if target is not None:
+                image.draft('RGB', target)
+        orientation = image.getexif().get(0x0112, 1)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        # Remember the rotation and the undrafted size, so prepare_photo_upload
+        # does not send the original
+        image.info['exif_orientation'] = orientation
+        image.info['original_size'] = (width, height)
+        return image
+    except Exception as e:
+        print(f'Photo preprocessing: cannot decode image ({e})')
+        return None
+
+
+def crop_portrait(image):
+    """
+    Trim very wide or very tall photos to PHOTO_CROP_MAX_ASPECT
+
+    Wide photos keep the horizontal center; tall photos keep the upper part,
+    where the face sits in a typical portrait or selfie.
+    """
+    width, height = image.size
+    if width > height * PHOTO_CROP_MAX_ASPECT:
+        new_width = int(height * PHOTO_CROP_MAX_ASPECT)
+        left = (width - new_width) // 2
+        return image.crop((left, 0, left + new_width, height))
+    if height > width * PHOTO_CROP_MAX_ASPECT:
+        new_height = int(width * PHOTO_CROP_MAX_ASPECT)
+        top = (height - new_height) // 4
+        return image.crop((0, top, width, top + new_height))
+    return image
+
+
+def prepare_photo_upload(image_bytes, mime_type, image, original_base64=None):
+    """
+    Crop, downscale and re-encode a decoded photo for the vision call
+
+    The original upload is kept when it is already small, unchanged and in a
+    format Claude accepts, or when it cannot be decoded.
+
+    Args:
+        image_bytes: Original upload bytes
+        mime_type: Original MIME type
+        image: Result of decode_photo (may be None)
+        original_base64: The upload as received, reused when it is kept
+
+    Returns:
+        dict: image_base64, mime_type, original_bytes, upload_bytes,
+              bytes_saved, preprocess_ms, size (final width, height or None)
+    """
+    start = time.perf_counter()
+    result = {
+        'image_base64': None,
+        'mime_type': mime_type,
+        'original_bytes': len(image_bytes),
+        'upload_bytes': len(image_bytes),
+        'size': None,
+    }
+
+    data = image_bytes
+    if image is not None:
+        processed = crop_portrait(image)
+        if max(processed.size) > PHOTO_MAX_EDGE:
+            processed = processed.copy()
+            processed.thumbnail((PHOTO_MAX_EDGE, PHOTO_MAX_EDGE), Image.Resampling.LANCZOS)
+
+        if processed.mode != 'RGB':
+            # Flatten transparency onto white rather than black
+            rgba = processed.convert('RGBA')
+            processed = Image.new('RGB', rgba.size, (255, 255, 255))
+            processed.paste(rgba, mask=rgba.getchannel('A'))
+
+        buffer = BytesIO()
+        if PHOTO_UPLOAD_FORMAT == 'webp':
+            processed.save(buffer, format='WEBP', quality=PHOTO_UPLOAD_QUALITY)
+        else:
+            processed.save(buffer, format='JPEG', quality=PHOTO_UPLOAD_QUALITY, optimize=True)
+        encoded = buffer.getvalue()
+
+        unchanged = (
+            processed.size == image.info.get('original_size', image.size)
+            and image.info.get('exif_orientation', 1) == 1
+            and mime_type in CLAUDE_IMAGE_TYPES
+        )
+        if not (unchanged and len(encoded) >= len(image_bytes)):
+            data = encoded
+            result['mime_type'] = f'image/{PHOTO_UPLOAD_FORMAT}'
+        result['size'] = processed.size
+
+    if data is image_bytes and original_base64:
+        result['image_base64'] = original_base64
+    else:
+        result['image_base64'] = base64.b64encode(data).decode('ascii')
+    result['upload_bytes'] = len(data)
+    result['bytes_saved'] = len(image_bytes) - len(data)
+    result['preprocess_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return result
@@ -3,14 +3,30 @@ Server-side postcard generation using Pillow (PIL)
 Renders character portraits onto postcard templates
 """
 import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from types import MappingProxyType
 from PIL import Image, ImageDraw
 from io import BytesIO
 import base64
+from functools import lru_cache
+from .character_generator import get_available_indices, get_available_variants
+from .sprite_atlas import get_atlas_sprite, reset_sprite_atlas
+from .sprite_cache import sprite_cache, tinted_sprite_cache, portrait_cache
 
 # VERSION IDENTIFIER - increment to verify module is loaded
-MODULE_VERSION = "1.0.5"
+MODULE_VERSION = "1.1.3"
 print(f"postcard_generator.py MODULE_VERSION {MODULE_VERSION} loaded")
 
+# Bump when rendered output changes, so postcard request hashes (ETags, URLs) change too
+POSTCARD_RENDER_VERSION = 1
+
 # Postcard dimensions
 CANVAS_WIDTH = 1024
 CANVAS_HEIGHT = 614
@@ -18,6 +34,43 @@ CANVAS_HEIGHT = 614
 # Character canvas size (for rendering individual portraits)
 CHARACTER_SIZE = 256
 
+# Threads used to render postcard slots concurrently (1 = sequential)
+POSTCARD_RENDER_WORKERS = int(os.getenv('POSTCARD_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Output encodings: name -> (PIL format, save options, content type, file extension)
+POSTCARD_ENCODINGS = {
+    'png-fast': ('PNG', {'compress_level': 1}, 'image/png', 'png'),
+    'png': ('PNG', {'compress_level': 6}, 'image/png', 'png'),
+    'png-optimized': ('PNG', {'optimize': True}, 'image/png', 'png'),
+    'webp-lossless': ('WEBP', {'lossless': True, 'quality': 0, 'method': 0}, 'image/webp', 'webp'),
+    'webp': ('WEBP', {'quality': 85, 'method': 4}, 'image/webp', 'webp'),
+    'jpeg': ('JPEG', {'quality': 85}, 'image/jpeg', 'jpg'),
+}
+# optimize=True PNG, as postcards have always been encoded
+DEFAULT_POSTCARD_ENCODING = 'png-optimized'
+
+# Faster same-format encoding to fall back to when one runs over budget
+ENCODING_FALLBACKS = {
+    'png-optimized': 'png',
+    'png': 'png-fast',
+}
+
+# Encode-time budget in ms (0 disables); encodings averaging above it step
+# down to their ENCODING_FALLBACKS entry (see resolve_encoding)
+POSTCARD_ENCODE_BUDGET_MS = float(os.getenv('POSTCARD_ENCODE_BUDGET_MS', 0))
+
+# Seconds before an encoding held back by the budget is tried and measured again
+POSTCARD_ENCODE_REMEASURE_SECONDS = float(os.getenv('POSTCARD_ENCODE_REMEASURE_SECONDS', 60))
+
+# encoding -> (moving average ms, monotonic time of the last sample or re-measure)
+_encode_ms_average = {}
+_encode_ms_lock = threading.Lock()
+
+# Optional on-disk tier for finished portraits (disabled when unset); files
+# live under a per-asset-version subdirectory, see get_asset_version
+PORTRAIT_CACHE_DIR = os.getenv('PORTRAIT_CACHE_DIR', '')
+PORTRAIT_CACHE_FORMAT = 'webp' if os.getenv('PORTRAIT_CACHE_FORMAT', 'png').lower() == 'webp' else 'png'
+
 # Color palettes - MUST match frontend assetData.js exactly! Matches game's color system.
 COLOR_PALETTES = {
     'Skin': [
@@ -97,6 +150,54 @@ LAYERS = {
     'AccessoryFront': {'id': 0, 'useSkinColor': False, 'useHairColor': False, 'useEyeColor': False, 'useAccessoryColor': True},
 }
 
+# Sprite folders - MUST match frontend assetData.js exactly!
+SPRITE_FOLDERS = {
+    'Background': '20_Background_Background',
+    'ClothesBack': '19_ClothesBack_Clothes',
+    'HairBack': '18_HairBack_Hair',
+    'Body': '17_Body_Skin',
+    'Clothes': '16_Clothes_Clothes',
+    'Ears': '15_Ears_Skin',
+    'AccessoryHead': '14_Accessory_Accessory',
+    'Headshape': '13_Headshape_Skin',
+    'DetailUpper': '12_Detail_Skin',
+    'DetailLower': '11_Detail_Skin',
+    'Hair': '10_Hair_Hair',
+    'Mouth': '9_Mouth_Lip',
+    'Beard': '8_Beard_Hair',
+    'Moustache': '7_Moustache_Hair',
+    'Eyes': '5_Eyes_Eye',
+    'Eyebrows': '4_Eyebrows_Hair',
+    'AccessoryFace': '3_Accessory_Accessory',
+    'Nose': '2_Nose_Skin',
+    'Blemish': '1_Blemish_Skin',
+    'AccessoryFront': '3_Accessory_Accessory',  # Same folder as AccessoryFace - all accessories in one folder
+}
+
+# Map layer names to their sprite filename prefixes
+FILENAME_PREFIXES = {
+    'Background': 'bg',
+    'ClothesBack': 'clothesback',
+    'HairBack': 'hairback',
+    'Body': 'body',
+    'Clothes': 'clothes',
+    'Ears': 'ears',
+    'AccessoryHead': 'accessory',
+    'Headshape': 'headshape',
+    'DetailUpper': 'detail',  # Both detail folders use 'detail' prefix
+    'DetailLower': 'detail',  # Both detail folders use 'detail' prefix
+    'Hair': 'hair',
+    'Mouth': 'mouth',
+    'Beard': 'beard',
+    'Moustache': 'moustache',
+    'Eyes': 'eyes',
+    'Eyebrows': 'eyebrows',
+    'AccessoryFace': 'accessory',
+    'Nose': 'nose',
+    'Blemish': 'blemish',
+    'AccessoryFront': 'accessory',
+}
+
 
 def hex_to_rgb(hex_color):
     """Convert hex color to RGB tuple"""
@@ -104,6 +205,23 @@ def hex_to_rgb(hex_color):
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
 
+@lru_cache(maxsize=None)
+def get_tint_lut(hex_color):
+    """
+    Build the Image.point lookup table for a multiply tint
+
+    One 256-entry table per RGBA band: result = (base * blend) // 255 for
+    R, G and B, identity for alpha. Palettes are finite, so each color's
+    table is built once per process.
+    """
+    tint = hex_to_rgb(hex_color)
+    lut = []
+    for channel in tint:
+        lut.extend((a * channel) // 255 for a in range(256))
+    lut.extend(range(256))
+    return lut
+
+
 def apply_color_tint(img, hex_color):
     """
     Apply color tint to an image using multiply blend mode
@@ -113,109 +231,367 @@ def apply_color_tint(img, hex_color):
     if img.mode != 'RGBA':
         img = img.convert('RGBA')
 
-    # Create a color overlay
-    color_overlay = Image.new('RGBA', img.size, hex_to_rgb(hex_color) + (255,))
+    # Multiply blend: result = (base * blend) / 255, original alpha kept
+    return img.point(get_tint_lut(hex_color))
+
+
+# Female-specific filename suffix per layer (e.g. clothes_07_00_F.png, hair_07_00_female.png)
+FEMALE_SUFFIXES = {
+    'Clothes': '_F',
+    'ClothesBack': '_F',
+    'Hair': '_female',
+    'HairBack': '_female',
+}
+
+# Per-process asset indexes, keyed by base path
+_asset_indexes = {}
+_asset_versions = {}
+_asset_index_lock = threading.Lock()
+
+# Requested (layer, index, variant, gender) combinations that had no sprite file
+missing_asset_requests = Counter()
+
+
+def build_asset_index(base_path):
+    """
+    Walk PortraitSprites/ once and map (layer, index, variant, gender) to a path
+
+    Gender is 'Male' or 'Female'. Female keys resolve to the female-specific
+    file where one exists and fall back to the base file otherwise, exactly
+    like the per-request lookup used to.
+
+    Returns:
+        MappingProxyType: immutable {(layer, index, variant, gender): path}
+    """
+    sprites_dir = os.path.join(base_path, 'PortraitSprites')
+
+    folder_files = {}
+    for folder in set(SPRITE_FOLDERS.values()):
+        try:
+            folder_files[folder] = os.listdir(os.path.join(sprites_dir, folder))
+        except OSError:
+            folder_files[folder] = []
+
+    index = {}
+    for layer_name in LAYERS:
+        folder = SPRITE_FOLDERS.get(layer_name)
+        if not folder:
+            continue
+        prefix = FILENAME_PREFIXES.get(layer_name, layer_name.lower())
+        female_suffix = FEMALE_SUFFIXES.get(layer_name)
+        pattern = re.compile(rf'^{re.escape(prefix)}_(\d+)_(\d+)(_F|_female)?\.png$')
+
+        female_paths = {}
+        for filename in folder_files[folder]:
+            match = pattern.match(filename)
+            if not match:
+                continue
+
+            sprite_index, sprite_variant = int(match.group(1)), int(match.group(2))
+            # Only accept the exact zero-padded spelling that lookups produce
+            if match.group(1) != f'{sprite_index:02d}' or match.group(2) != f'{sprite_variant:02d}':
+                continue
+
+            path = os.path.join(sprites_dir, folder, filename)
+            suffix = match.group(3)
+            if suffix is None:
+                index[(layer_name, sprite_index, sprite_variant, 'Male')] = path
+                index.setdefault((layer_name, sprite_index, sprite_variant, 'Female'), path)
+            elif suffix == female_suffix:
+                female_paths[(layer_name, sprite_index, sprite_variant, 'Female')] = path
+
+        # Female-specific files win over the base file
+        index.update(female_paths)
+
+    return MappingProxyType(index)
+
+
+def compute_asset_version(base_path, asset_index):
+    """
+    Short digest of the render version, the base path and the size and
+    mtime of every indexed sprite and postcard template - changes whenever
+    rendered portraits or postcards may
+    """
+    digest = hashlib.sha256(f'{POSTCARD_RENDER_VERSION}|{base_path}'.encode('utf-8'))
+    for path in sorted(set(asset_index.values()) | get_template_paths(base_path)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f'{path}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
 
-    # Apply multiply blend
-    # Multiply blend: result = (base * blend) / 255
-    base = img.split()
-    overlay = color_overlay.split()
 
-    r = Image.eval(base[0], lambda a: int((a * overlay[0].getpixel((0, 0))) / 255))
-    g = Image.eval(base[1], lambda a: int((a * overlay[1].getpixel((0, 0))) / 255))
-    b = Image.eval(base[2], lambda a: int((a * overlay[2].getpixel((0, 0))) / 255))
+def get_asset_index(base_path):
+    """Return the asset index for base_path, building it on first use"""
+    asset_index = _asset_indexes.get(base_path)
+    if asset_index is None:
+        with _asset_index_lock:
+            asset_index = _asset_indexes.get(base_path)
+            if asset_index is None:
+                asset_index = build_asset_index(base_path)
+                _asset_versions[base_path] = compute_asset_version(base_path, asset_index)
+                _asset_indexes[base_path] = asset_index
+                print(f'Asset index built: {len(asset_index)} entries from {base_path}')
+    return asset_index
 
-    # Keep original alpha
-    result = Image.merge('RGBA', (r, g, b, base[3]))
 
-    return result
+def get_asset_version(base_path):
+    """Version of the sprites behind base_path's asset index (see compute_asset_version)"""
+    get_asset_index(base_path)
+    return _asset_versions[base_path]
+
+
+def reload_asset_index(base_path=None):
+    """
+    Rebuild the asset index after sprites change on disk
+
+    Also drops every sprite/portrait cache, the on-disk portrait tier,
+    template canvases and loaded atlases, since they may hold images for
+    files that moved or changed. Postcard request hashes include the asset
+    version, so stored postcards of the old assets are simply never asked
+    for again.
+    """
+    with _asset_index_lock:
+        if base_path is None:
+            _asset_indexes.clear()
+            _asset_versions.clear()
+        else:
+            _asset_indexes.pop(base_path, None)
+            _asset_versions.pop(base_path, None)
+    missing_asset_requests.clear()
+    sprite_cache.clear()
+    tinted_sprite_cache.clear()
+    portrait_cache.clear()
+    clear_portrait_disk_cache()
+    with _base_canvas_lock:
+        _base_canvases.clear()
+    reset_sprite_atlas()
+
+    if base_path is not None:
+        return get_asset_index(base_path)
+    return None
+
+
+def report_missing_assets(base_path):
+    """
+    List sprites that the character generator can pick but that have no file
+
+    Returns:
+        dict: {'indexed': int, 'missing': [...], 'requested_missing': [...]}
+    """
+    asset_index = get_asset_index(base_path)
+    missing = []
+    for layer_name in LAYERS:
+        for sprite_index in get_available_indices(layer_name):
+            for sprite_variant in get_available_variants(layer_name, sprite_index):
+                if ((layer_name, sprite_index, sprite_variant, 'Male') not in asset_index
+                        and (layer_name, sprite_index, sprite_variant, 'Female') not in asset_index):
+                    missing.append(f'{layer_name} {sprite_index:02d}_{sprite_variant:02d}')
+
+    requested_missing = [
+        {'layer': layer, 'index': idx, 'variant': var, 'gender': gender, 'count': count}
+        for (layer, idx, var, gender), count in missing_asset_requests.most_common(50)
+    ]
+    return {
+        'indexed': len(asset_index),
+        'missing': missing,
+        'requested_missing': requested_missing,
+    }
 
 
 def get_asset_path(layer_name, index, variant, gender, base_path):
     """
     Construct the full path to a sprite asset
+
+    Resolved from the in-memory asset index - no filesystem calls.
+    Returns None if no sprite file exists.
+    """
+    key = (layer_name, index, variant, 'Female' if gender == 'Female' else 'Male')
+    path = get_asset_index(base_path).get(key)
+    if path is None:
+        missing_asset_requests[key] += 1
+    return path
+
+
+def get_layer_palette(layer_info):
+    """Return the COLOR_PALETTES key a layer is tinted with, or None if untinted"""
+    if layer_info['useSkinColor']:
+        return 'Skin'
+    if layer_info['useHairColor']:
+        return 'Hair'
+    if layer_info['useEyeColor']:
+        return 'Eye'
+    if layer_info['useAccessoryColor']:
+        return 'Accessory'
+    return None
+
+
+def load_sprite(layer_name, index, variant, gender, size, base_path, tint_color=None):
+    """
+    Load a sprite as a size=(width, height) RGBA image, tinted with tint_color if given
+
+    Lookup order: in-memory caches, then the prebuilt sprite atlas (see
+    sprite_atlas.py), then decoding the PNG. Returns None if the asset does
+    not exist. The returned image is shared and must not be modified in place.
     """
-    layer_info = LAYERS.get(layer_name)
-    if not layer_info:
+    # Only a few layers have female-specific files; share the rest across genders
+    sprite_gender = None
+    if layer_name in FEMALE_SUFFIXES:
+        sprite_gender = 'Female' if gender == 'Female' else 'Male'
+    cache_key = (base_path, layer_name, index, variant, sprite_gender, size, tint_color)
+    cache = tinted_sprite_cache if tint_color else sprite_cache
+
+    img = cache.get(cache_key)
+    if img is not None:
+        return img
+
+    # Get asset path
+    asset_path = get_asset_path(layer_name, index, variant, gender, base_path)
+
+    if not asset_path:
+        print(f'  MISSING: {layer_name} - index={index}, variant={variant}, gender={gender}')
         return None
 
-    layer_id = layer_info['id']
-
-    # Sprite folders - MUST match frontend assetData.js exactly!
-    sprite_folders = {
-        'Background': '20_Background_Background',
-        'ClothesBack': '19_ClothesBack_Clothes',
-        'HairBack': '18_HairBack_Hair',
-        'Body': '17_Body_Skin',
-        'Clothes': '16_Clothes_Clothes',
-        'Ears': '15_Ears_Skin',
-        'AccessoryHead': '14_Accessory_Accessory',
-        'Headshape': '13_Headshape_Skin',
-        'DetailUpper': '12_Detail_Skin',
-        'DetailLower': '11_Detail_Skin',
-        'Hair': '10_Hair_Hair',
-        'Mouth': '9_Mouth_Lip',
-        'Beard': '8_Beard_Hair',
-        'Moustache': '7_Moustache_Hair',
-        'Eyes': '5_Eyes_Eye',
-        'Eyebrows': '4_Eyebrows_Hair',
-        'AccessoryFace': '3_Accessory_Accessory',
-        'Nose': '2_Nose_Skin',
-        'Blemish': '1_Blemish_Skin',
-        'AccessoryFront': '3_Accessory_Accessory',  # Same folder as AccessoryFace - all accessories in one folder
+    # Prebuilt atlas: already resized and tinted, read straight from the mmap
+    img = get_atlas_sprite(base_path, asset_path, tint_color, size)
+
+    if img is None and tint_color:
+        img = load_sprite(layer_name, index, variant, gender, size, base_path)
+        img = apply_color_tint(img, tint_color)
+    elif img is None:
+        # Load image
+        print(f'  ✓ Loading: {layer_name} from {os.path.basename(asset_path)}')
+        with Image.open(asset_path) as source:
+            img = source.convert('RGBA')
+
+        # Resize to target size if needed
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+
+    return cache.put(cache_key, img)
+
+
+def canonicalize_character(character):
+    """
+    Reduce a character dict to exactly what affects its rendered portrait
+
+    Resolves palette colors (with render defaults) and keeps only the parts
+    that are actually drawn, in draw order, after the Mouth/Moustache rule.
+    Two characters with the same canonical form render identically.
+    """
+    color_indices = character.get('colorIndices', {})
+    parts = character.get('parts', {})
+
+    colors = {
+        'Skin': COLOR_PALETTES['Skin'][color_indices.get('Skin', 2)],
+        'Hair': COLOR_PALETTES['Hair'][color_indices.get('Hair', 3)],
+        'Eye': COLOR_PALETTES['Eye'][color_indices.get('Eye', 2)],
+        'Accessory': COLOR_PALETTES['Accessory'][color_indices.get('Accessory', 1)],
     }
 
-    folder = sprite_folders.get(layer_name)
-    if not folder:
-        return None
+    # Sort layers by ID (back to front: 20 to 0)
+    sorted_layers = sorted(LAYERS.items(), key=lambda x: x[1]['id'], reverse=True)
+
+    drawn_parts = []
+    for layer_name, layer_info in sorted_layers:
+        part_data = parts.get(layer_name)
+
+        if not part_data or part_data.get('index') == -1 or part_data.get('variant') == -1:
+            continue
+
+        # Skip mouth if moustache is present
+        if layer_name == 'Mouth':
+            moustache = parts.get('Moustache', {})
+            if moustache.get('index', -1) != -1:
+                continue
+
+        drawn_parts.append([layer_name, part_data.get('index', 0), part_data.get('variant', 0)])
 
-    # Map layer names to their sprite filename prefixes
-    filename_prefixes = {
-        'Background': 'bg',
-        'ClothesBack': 'clothesback',
-        'HairBack': 'hairback',
-        'Body': 'body',
-        'Clothes': 'clothes',
-        'Ears': 'ears',
-        'AccessoryHead': 'accessory',
-        'Headshape': 'headshape',
-        'DetailUpper': 'detail',  # Both detail folders use 'detail' prefix
-        'DetailLower': 'detail',  # Both detail folders use 'detail' prefix
-        'Hair': 'hair',
-        'Mouth': 'mouth',
-        'Beard': 'beard',
-        'Moustache': 'moustache',
-        'Eyes': 'eyes',
-        'Eyebrows': 'eyebrows',
-        'AccessoryFace': 'accessory',
-        'Nose': 'nose',
-        'Blemish': 'blemish',
-        'AccessoryFront': 'accessory',
+    return {
+        'gender': character.get('gender', 'Male'),
+        'colors': colors,
+        'parts': drawn_parts,
     }
 
-    prefix = filename_prefixes.get(layer_name, layer_name.lower())
 
-    # Try gender-specific filename first for female characters
-    if gender == 'Female':
-        # For clothes layers, try _F suffix (e.g., clothes_07_00_F.png)
-        if layer_name in ['Clothes', 'ClothesBack']:
-            female_filename = f"{prefix}_{index:02d}_{variant:02d}_F.png"
-            female_path = os.path.join(base_path, 'PortraitSprites', folder, female_filename)
-            if os.path.exists(female_path):
-                return female_path
+def character_from_canonical(canonical_character):
+    """
+    Rebuild a character dict that renders (and canonicalizes) exactly like
+    a canonical character (see canonicalize_character)
+    """
+    return {
+        'gender': canonical_character['gender'],
+        'colorIndices': {
+            name: COLOR_PALETTES[name].index(color) for name, color in canonical_character['colors'].items()
+        },
+        'parts': {
+            layer_name: {'index': index, 'variant': variant}
+            for layer_name, index, variant in canonical_character['parts']
+        },
+    }
+
 
-        # For hair layers, try _female suffix (e.g., hair_07_00_female.png)
-        if layer_name in ['Hair', 'HairBack']:
-            female_filename = f"{prefix}_{index:02d}_{variant:02d}_female.png"
-            female_path = os.path.join(base_path, 'PortraitSprites', folder, female_filename)
-            if os.path.exists(female_path):
-                return female_path
+def character_hash(canonical_character):
+    """Stable SHA-256 hex digest of a canonical character"""
+    payload = json.dumps(canonical_character, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-    # Fall back to base filename (for male or unisex sprites)
-    filename = f"{prefix}_{index:02d}_{variant:02d}.png"
-    full_path = os.path.join(base_path, 'PortraitSprites', folder, filename)
 
-    return full_path if os.path.exists(full_path) else None
+def postcard_request_hash(color, characters, encoding, quality, base_path):
+    """
+    Stable SHA-256 hex digest identifying a postcard request
+
+    Characters are reduced to their canonical form, so requests that render
+    identically share a hash. The asset version of base_path is included, so
+    changed sprites or templates give new hashes. Used for ETags,
+    hash-addressed postcard URLs and the postcard store.
+    """
+    payload = json.dumps({
+        'version': POSTCARD_RENDER_VERSION,
+        'assets': get_asset_version(base_path),
+        'color': color,
+        'characters': [canonicalize_character(c) for c in characters],
+        'encoding': encoding,
+        'quality': quality,
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_portrait_disk_path(portrait_hash, size, base_path):
+    """
+    Path of a portrait in the on-disk cache tier, or None if disabled
+
+    Portraits are filed under the asset version of base_path, so changed
+    sprites (or a new POSTCARD_RENDER_VERSION) never hit old files.
+    """
+    if not PORTRAIT_CACHE_DIR:
+        return None
+    filename = f'{portrait_hash}_{size[0]}x{size[1]}.{PORTRAIT_CACHE_FORMAT}'
+    return os.path.join(PORTRAIT_CACHE_DIR, get_asset_version(base_path), portrait_hash[:2], filename)
+
+
+def clear_portrait_disk_cache():
+    """Delete every portrait in the on-disk tier"""
+    if not PORTRAIT_CACHE_DIR or not os.path.isdir(PORTRAIT_CACHE_DIR):
+        return
+    for name in os.listdir(PORTRAIT_CACHE_DIR):
+        shutil.rmtree(os.path.join(PORTRAIT_CACHE_DIR, name), ignore_errors=True)
+    print(f'Portrait disk cache cleared: {PORTRAIT_CACHE_DIR}')
+
+
+def save_portrait_to_disk(portrait, disk_path):
+    """Write a portrait to the disk tier atomically; failures are non-fatal"""
+    try:
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        tmp_path = f'{disk_path}.{os.getpid()}.tmp'
+        if PORTRAIT_CACHE_FORMAT == 'webp':
+            portrait.save(tmp_path, format='WEBP', lossless=True)
+        else:
+            portrait.save(tmp_path, format='PNG')
+        os.replace(tmp_path, disk_path)
+    except OSError as e:
+        print(f'Portrait disk cache write failed: {e}')
 
 
 def render_character(character, base_path, size=None):
@@ -223,88 +599,77 @@ def render_character(character, base_path, size=None):
     Render a single character portrait to a PIL Image
     Returns a CHARACTER_SIZE x CHARACTER_SIZE RGBA image (or custom size if specified)
 
+    Sprites are resampled once, straight to the requested size, so callers
+    should pass the final box size rather than resizing the result.
+
+    Finished portraits are memoized by canonical character hash in memory
+    and, if PORTRAIT_CACHE_DIR is set, on disk.
+
     Args:
         character: Character data dict
         base_path: Base path to static files
-        size: Optional custom size (defaults to CHARACTER_SIZE)
+        size: Optional custom size - an int for a square portrait or a
+              (width, height) tuple (defaults to CHARACTER_SIZE)
     """
     if size is None:
         size = CHARACTER_SIZE
-
+    if isinstance(size, int):
+        size = (size, size)
+    size = tuple(size)
+
+    canonical = canonicalize_character(character)
+    portrait_hash = character_hash(canonical)
+    cache_key = (base_path, portrait_hash, size)
+
+    portrait = portrait_cache.get(cache_key)
+    if portrait is not None:
+        print(f'Portrait cache hit (memory): {portrait_hash[:12]}')
+        return portrait.copy()
+
+    disk_path = get_portrait_disk_path(portrait_hash, size, base_path)
+    if disk_path and os.path.exists(disk_path):
+        try:
+            with Image.open(disk_path) as source:
+                portrait = source.convert('RGBA')
+            print(f'Portrait cache hit (disk): {portrait_hash[:12]}')
+            portrait_cache.put(cache_key, portrait)
+            return portrait.copy()
+        except OSError as e:
+            print(f'Portrait disk cache read failed: {e}')
+
+    portrait = compose_character(canonical, base_path, size)
+    portrait_cache.put(cache_key, portrait)
+    if disk_path:
+        save_portrait_to_disk(portrait, disk_path)
+    return portrait.copy()
+
+
+def compose_character(canonical, base_path, size):
+    """
+    Composite the sprite layers of a canonical character (see canonicalize_character)
+    """
     print(f'\n=== RENDERING CHARACTER ===')
     print(f'Base path: {base_path}')
-    print(f'Character keys: {character.keys()}')
-    print(f'Gender: {character.get("gender")}')
-    print(f'Color indices: {character.get("colorIndices")}')
-    print(f'Parts count: {len(character.get("parts", {}))}')
-    if character.get('parts'):
-        print(f'First few parts: {list(character.get("parts", {}).keys())[:5]}')
+    print(f'Gender: {canonical["gender"]}')
+    print(f'Parts drawn: {len(canonical["parts"])}')
 
     # Create transparent canvas
-    canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-
-    # Get color values
-    skin_color = COLOR_PALETTES['Skin'][character.get('colorIndices', {}).get('Skin', 2)]
-    hair_color = COLOR_PALETTES['Hair'][character.get('colorIndices', {}).get('Hair', 3)]
-    eye_color = COLOR_PALETTES['Eye'][character.get('colorIndices', {}).get('Eye', 2)]
-    accessory_color = COLOR_PALETTES['Accessory'][character.get('colorIndices', {}).get('Accessory', 1)]
+    canvas = Image.new('RGBA', size, (0, 0, 0, 0))
 
-    gender = character.get('gender', 'Male')
-    print(f'Using colors - Skin: {skin_color}, Hair: {hair_color}, Eye: {eye_color}')
-
-    # Sort layers by ID (back to front: 20 to 0)
-    sorted_layers = sorted(LAYERS.items(), key=lambda x: x[1]['id'], reverse=True)
+    colors = canonical['colors']
+    gender = canonical['gender']
+    print(f'Using colors - Skin: {colors["Skin"]}, Hair: {colors["Hair"]}, Eye: {colors["Eye"]}')
 
     layers_rendered = 0
-    for layer_name, layer_info in sorted_layers:
-        part_data = character.get('parts', {}).get(layer_name)
-
-        if not part_data or part_data.get('index') == -1 or part_data.get('variant') == -1:
-            continue
-
-        # Skip mouth if moustache is present
-        if layer_name == 'Mouth':
-            moustache = character.get('parts', {}).get('Moustache', {})
-            if moustache.get('index', -1) != -1:
-                continue
-
-        # Get asset path
-        asset_path = get_asset_path(
-            layer_name,
-            part_data.get('index', 0),
-            part_data.get('variant', 0),
-            gender,
-            base_path
-        )
+    for layer_name, index, variant in canonical['parts']:
+        # Pick the color tint for this layer (None = draw untinted)
+        tint_color = colors.get(get_layer_palette(LAYERS[layer_name]))
 
-        if not asset_path:
-            print(f'  ERROR: No path generated for {layer_name} - index={part_data.get("index")}, variant={part_data.get("variant")}')
+        img = load_sprite(layer_name, index, variant, gender, size, base_path, tint_color)
+        if img is None:
             continue
-
-        if not os.path.exists(asset_path):
-            print(f'  MISSING: {layer_name} - index={part_data.get("index")}, variant={part_data.get("variant")}')
-            print(f'    Expected path: {asset_path}')
-            continue
-
-        # Load image
-        print(f'  ✓ Loading: {layer_name} from {os.path.basename(asset_path)}')
-        img = Image.open(asset_path).convert('RGBA')
         layers_rendered += 1
 
-        # Resize to target size if needed
-        if img.size != (size, size):
-            img = img.resize((size, size), Image.Resampling.LANCZOS)
-
-        # Apply color tinting
-        if layer_info['useSkinColor']:
-            img = apply_color_tint(img, skin_color)
-        elif layer_info['useHairColor']:
-            img = apply_color_tint(img, hair_color)
-        elif layer_info['useEyeColor']:
-            img = apply_color_tint(img, eye_color)
-        elif layer_info['useAccessoryColor']:
-            img = apply_color_tint(img, accessory_color)
-
         # Composite onto canvas
         canvas = Image.alpha_composite(canvas, img)
 
@@ -312,47 +677,22 @@ def render_character(character, base_path, size=None):
     return canvas
 
 
-def generate_postcard(color, characters, base_path):
+def get_slot_boxes(color, count):
     """
-    Generate a complete postcard with multiple characters
+    Pixel layout of the character slots for a postcard
 
     Args:
         color: 'blue' or 'orange'
-        characters: List of character objects (max 10)
-        base_path: Base path to static files
+        count: Number of characters on the postcard
 
     Returns:
-        PIL Image of the postcard
+        list: One dict per used slot (max 10) with x, y, render_width,
+              render_height, padding and portrait_size (the exact
+              (width, height) the portrait is rendered at)
     """
-    # Load template - use single-box template if only 1 character
-    if len(characters) == 1 and color == 'blue':
-        template_paths = {
-            'blue': 'PostcardTemplates/goa_postcard_greetingsfromlichfield.png',
-            'orange': 'PostcardTemplates/goa_postcard_greetingsfromlichfieldcrew_noboxes.png'
-        }
-    else:
-        template_paths = {
-            'blue': 'PostcardTemplates/goa_postcard_greetingsfromlichfield_noboxes_720.png',
-            'orange': 'PostcardTemplates/goa_postcard_greetingsfromlichfieldcrew_noboxes.png'
-        }
-
-    template_path = os.path.join(base_path, template_paths.get(color, template_paths['blue']))
-
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Template not found: {template_path}")
-
-    # Load and resize template to canvas size
-    template = Image.open(template_path).convert('RGBA')
-    if template.size != (CANVAS_WIDTH, CANVAS_HEIGHT):
-        template = template.resize((CANVAS_WIDTH, CANVAS_HEIGHT), Image.Resampling.LANCZOS)
-
-    # Create postcard canvas
-    postcard = Image.new('RGBA', (CANVAS_WIDTH, CANVAS_HEIGHT), (255, 255, 255, 255))
-    postcard = Image.alpha_composite(postcard, template)
-
     # Character slot positions
     # If single character, use larger centered slot (different positioning for blue vs orange)
-    if len(characters) == 1:
+    if count == 1:
         if color == 'blue':
             slots = [
                 {'x': 4.8, 'y': 8.8, 'width': 25.4, 'height': 41.5},  # Blue template box: centered in upper-left tan box
@@ -377,15 +717,10 @@ def generate_postcard(color, characters, base_path):
             {'x': 47.0, 'y': 36.0, 'width': 28.0, 'height': 28.0}  # Slot 10 - Extra
         ]
 
-    # Render each character
-    draw = ImageDraw.Draw(postcard)
-
-    for i, character in enumerate(characters[:10]):  # Max 10 characters
-        if i >= len(slots):
-            break
-
-        slot = slots[i]
+    is_single_char = count == 1
 
+    boxes = []
+    for slot in slots[:min(count, 10)]:  # Max 10 characters
         # Calculate slot position in pixels
         slot_x = int((slot['x'] / 100) * CANVAS_WIDTH)
         slot_y = int((slot['y'] / 100) * CANVAS_HEIGHT)
@@ -394,63 +729,353 @@ def generate_postcard(color, characters, base_path):
 
         # For single character templates (both blue and orange), don't draw background/border
         # For multiple characters, use square slots with background/border
-        is_single_char = len(characters) == 1
-        print(f"\n=== CHARACTER {i} RENDERING ===")
-        print(f"Characters count: {len(characters)}, Color: {color}")
-        print(f"Is single character mode: {is_single_char}")
-
         if is_single_char:
             # Don't draw background/border - template already has it
             # Use full rectangular dimensions
             render_width = slot_width
             render_height = slot_height
             padding = 0  # No padding - fit exactly to template box
-            print(f"Single character mode: NO background/border, NO padding")
         else:
             # Make slot square (use width as dimension)
-            square_size = slot_width
-
-            # Draw background box
-            bg_color = (237, 231, 221, 255)  # #EDE7DD
-            draw.rectangle(
-                [slot_x, slot_y, slot_x + square_size, slot_y + square_size],
-                fill=bg_color
-            )
-
-            # Draw border
-            border_color = (200, 191, 176, 255)  # #C8BFB0
-            draw.rectangle(
-                [slot_x, slot_y, slot_x + square_size, slot_y + square_size],
-                outline=border_color,
-                width=3
-            )
-
-            render_width = square_size
-            render_height = square_size
+            render_width = slot_width
+            render_height = slot_width
             padding = 4
 
-        # Render character
-        character_img = render_character(character, base_path)
-
-        # Resize character to fit slot with padding
-        character_img = character_img.resize(
-            (render_width - padding * 2, render_height - padding * 2),
-            Image.Resampling.LANCZOS
+        # A frame can be baked into the cached base canvas only if it does
+        # not cover any earlier slot (whose portrait is pasted before it)
+        framed = not is_single_char
+        prebaked = framed and not any(
+            slot_x <= other['x'] + other['render_width'] and other['x'] <= slot_x + render_width
+            and slot_y <= other['y'] + other['render_height'] and other['y'] <= slot_y + render_height
+            for other in boxes
         )
 
+        boxes.append({
+            'x': slot_x,
+            'y': slot_y,
+            'render_width': render_width,
+            'render_height': render_height,
+            'padding': padding,
+            'portrait_size': (render_width - padding * 2, render_height - padding * 2),
+            'framed': framed,
+            'prebaked': prebaked,
+        })
+
+    return boxes
+
+
+def draw_slot_frame(draw, box):
+    """Draw a multi-character slot's background box and border"""
+    slot_x = box['x']
+    slot_y = box['y']
+    square_size = box['render_width']
+
+    # Draw background box
+    bg_color = (237, 231, 221, 255)  # #EDE7DD
+    draw.rectangle(
+        [slot_x, slot_y, slot_x + square_size, slot_y + square_size],
+        fill=bg_color
+    )
+
+    # Draw border
+    border_color = (200, 191, 176, 255)  # #C8BFB0
+    draw.rectangle(
+        [slot_x, slot_y, slot_x + square_size, slot_y + square_size],
+        outline=border_color,
+        width=3
+    )
+
+
+def get_template_path(color, count, base_path):
+    """Template file for a postcard color and character count"""
+    # Load template - use single-box template if only 1 character
+    if count == 1 and color == 'blue':
+        template_paths = {
+            'blue': 'PostcardTemplates/goa_postcard_greetingsfromlichfield.png',
+            'orange': 'PostcardTemplates/goa_postcard_greetingsfromlichfieldcrew_noboxes.png'
+        }
+    else:
+        template_paths = {
+            'blue': 'PostcardTemplates/goa_postcard_greetingsfromlichfield_noboxes_720.png',
+            'orange': 'PostcardTemplates/goa_postcard_greetingsfromlichfieldcrew_noboxes.png'
+        }
+
+    return os.path.join(base_path, template_paths.get(color, template_paths['blue']))
+
+
+def get_template_paths(base_path):
+    """Every template file a postcard may be drawn on"""
+    return {get_template_path(color, count, base_path) for color in ('blue', 'orange') for count in (1, 2)}
+
+
+# Prebuilt base canvases, keyed by (base_path, color, slot count)
+_base_canvases = {}
+_base_canvas_lock = threading.Lock()
+
+
+def build_base_canvas(color, count, base_path):
+    """
+    Template composited on white with every non-overlapping slot frame drawn
+    """
+    template_path = get_template_path(color, count, base_path)
+
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template not found: {template_path}")
+
+    # Load and resize template to canvas size
+    with Image.open(template_path) as source:
+        template = source.convert('RGBA')
+    if template.size != (CANVAS_WIDTH, CANVAS_HEIGHT):
+        template = template.resize((CANVAS_WIDTH, CANVAS_HEIGHT), Image.Resampling.LANCZOS)
+
+    # Create postcard canvas
+    canvas = Image.new('RGBA', (CANVAS_WIDTH, CANVAS_HEIGHT), (255, 255, 255, 255))
+    canvas = Image.alpha_composite(canvas, template)
+
+    draw = ImageDraw.Draw(canvas)
+    for box in get_slot_boxes(color, count):
+        if box['prebaked']:
+            draw_slot_frame(draw, box)
+
+    return canvas
+
+
+def get_base_canvas(color, count, base_path):
+    """
+    Return the cached base canvas for a postcard variant, building it once
+
+    The result is shared - callers must copy() it before drawing on it.
+    """
+    key = (base_path, color, min(count, 10))
+    canvas = _base_canvases.get(key)
+    if canvas is None:
+        with _base_canvas_lock:
+            canvas = _base_canvases.get(key)
+            if canvas is None:
+                canvas = build_base_canvas(color, count, base_path)
+                _base_canvases[key] = canvas
+    return canvas
+
+
+def warm_base_canvases(base_path):
+    """Prebuild every base canvas variant (e.g. at startup)"""
+    for color in ('blue', 'orange'):
+        for count in range(1, 11):
+            get_base_canvas(color, count, base_path)
+
+
+def get_render_sizes():
+    """All distinct portrait sizes generate_postcard renders at"""
+    sizes = set()
+    for color in ('blue', 'orange'):
+        for count in range(1, 11):
+            sizes.update(box['portrait_size'] for box in get_slot_boxes(color, count))
+    return sorted(sizes)
+
+
+def generate_postcard(color, characters, base_path):
+    """
+    Generate a complete postcard with multiple characters
+
+    Args:
+        color: 'blue' or 'orange'
+        characters: List of character objects (max 10)
+        base_path: Base path to static files
+
+    Returns:
+        PIL Image of the postcard
+    """
+    postcard, _ = generate_postcard_timed(color, characters, base_path)
+    return postcard
+
+
+def generate_postcard_timed(color, characters, base_path):
+    """
+    Generate a postcard (see generate_postcard) and report where the time went
+
+    Returns:
+        tuple: (PIL Image, timings dict with template/render/composite/total
+                milliseconds and per-slot render times)
+    """
+    total_start = time.perf_counter()
+    timings = {'slots': []}
+
+    # Start from a copy of the prebuilt template canvas (slot frames included)
+    template_start = time.perf_counter()
+    postcard = get_base_canvas(color, len(characters), base_path).copy()
+    timings['template_ms'] = round((time.perf_counter() - template_start) * 1000, 2)
+
+    # Lay out slots first; the drawing below depends only on the slot order
+    is_single_char = len(characters) == 1
+    print(f"Characters count: {len(characters)}, Color: {color}")
+    print(f"Is single character mode: {is_single_char}")
+
+    slot_jobs = [
+        {**box, 'character': character}
+        for box, character in zip(get_slot_boxes(color, len(characters)), characters)
+    ]
+
+    # Render all portraits concurrently (Pillow releases the GIL for
+    # decode, resize and alpha_composite)
+    render_start = time.perf_counter()
+    rendered = list(map_slots(lambda job: render_slot(job, base_path), slot_jobs))
+    timings['render_ms'] = round((time.perf_counter() - render_start) * 1000, 2)
+
+    # Composite in slot order so overlapping slots always stack the same way
+    composite_start = time.perf_counter()
+    draw = ImageDraw.Draw(postcard)
+
+    for i, (job, (character_img, slot_timing)) in enumerate(zip(slot_jobs, rendered)):
+        slot_x = job['x']
+        slot_y = job['y']
+        padding = job['padding']
+
+        # Frames overlapping an earlier slot are drawn here, in order
+        if job['framed'] and not job['prebaked']:
+            draw_slot_frame(draw, job)
+
         # Paste character onto postcard
         postcard.paste(
             character_img,
             (slot_x + padding, slot_y + padding),
             character_img  # Use as alpha mask
         )
+        timings['slots'].append({'slot': i, **slot_timing})
+
+    timings['composite_ms'] = round((time.perf_counter() - composite_start) * 1000, 2)
+    timings['total_ms'] = round((time.perf_counter() - total_start) * 1000, 2)
+    timings['workers'] = min(POSTCARD_RENDER_WORKERS, len(slot_jobs))
+
+    return postcard, timings
 
-    return postcard
 
+def render_slot(job, base_path):
+    """
+    Render one slot's portrait directly at the slot's portrait size
+
+    Returns:
+        tuple: (RGBA image, {'render_ms': float})
+    """
+    start = time.perf_counter()
+    character_img = render_character(job['character'], base_path, job['portrait_size'])
+    return character_img, {'render_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+
+def map_slots(func, jobs):
+    """
+    Run func over jobs on the shared render thread pool, preserving order
+
+    Falls back to a plain loop for a single job or POSTCARD_RENDER_WORKERS=1.
+    """
+    global _render_executor
+
+    if POSTCARD_RENDER_WORKERS <= 1 or len(jobs) <= 1:
+        return [func(job) for job in jobs]
+
+    if _render_executor is None:
+        with _render_executor_lock:
+            if _render_executor is None:
+                _render_executor = ThreadPoolExecutor(
+                    max_workers=POSTCARD_RENDER_WORKERS,
+                    thread_name_prefix='portrait-render'
+                )
+    return list(_render_executor.map(func, jobs))
+
+
+def resolve_encoding(encoding):
+    """
+    Apply the encode-time budget: step down to a faster variant of the same
+    format while the requested encoding's recent average exceeds the budget
+
+    An encoding over budget is not measured while it is skipped, so once its
+    last measurement is POSTCARD_ENCODE_REMEASURE_SECONDS old, one request
+    encodes with it again and its new timing decides whether it recovers.
+    """
+    if POSTCARD_ENCODE_BUDGET_MS <= 0:
+        return encoding
+
+    now = time.monotonic()
+    with _encode_ms_lock:
+        while encoding in ENCODING_FALLBACKS:
+            stats = _encode_ms_average.get(encoding)
+            if stats is None or stats[0] <= POSTCARD_ENCODE_BUDGET_MS:
+                break
+            average, measured_at = stats
+            if now - measured_at >= POSTCARD_ENCODE_REMEASURE_SECONDS:
+                # This request re-measures; others keep stepping down meanwhile
+                _encode_ms_average[encoding] = (average, now)
+                break
+            encoding = ENCODING_FALLBACKS[encoding]
+    return encoding
+
+
+def record_encode_ms(encoding, encode_ms):
+    """
+    Fold an encode time into the encoding's moving average
+
+    A sample for an encoding that was over budget (a re-measure) replaces
+    the old average, so one fast encode is enough to recover.
+    """
+    with _encode_ms_lock:
+        previous = _encode_ms_average.get(encoding)
+        if previous is None or previous[0] > POSTCARD_ENCODE_BUDGET_MS:
+            average = encode_ms
+        else:
+            average = previous[0] * 0.8 + encode_ms * 0.2
+        _encode_ms_average[encoding] = (average, time.monotonic())
+
+
+def encode_postcard(postcard_image, encoding=DEFAULT_POSTCARD_ENCODING, quality=None, apply_budget=True):
+    """
+    Encode a postcard image - the single encode routine for every output path
+
+    Args:
+        postcard_image: PIL Image
+        encoding: Key of POSTCARD_ENCODINGS
+        quality: Optional 1-100 quality for lossy encodings (compression
+                 effort for webp-lossless)
+        apply_budget: Step down per resolve_encoding; False when the caller
+                      already resolved the encoding
+
+    Returns:
+        dict: data (bytes), content_type, extension, encoding (after the
+              budget fallback), encode_ms
+    """
+    if encoding not in POSTCARD_ENCODINGS:
+        raise ValueError(f'Unknown encoding: {encoding}')
+
+    if apply_budget:
+        encoding = resolve_encoding(encoding)
+    pil_format, options, content_type, extension = POSTCARD_ENCODINGS[encoding]
+    options = dict(options)
+    if quality is not None and 'quality' in options:
+        options['quality'] = quality
+
+    start = time.perf_counter()
+
+    image = postcard_image
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
 
-def postcard_to_base64(postcard_image):
-    """Convert PIL Image to base64 PNG string"""
     buffer = BytesIO()
-    postcard_image.save(buffer, format='PNG', optimize=True)
-    buffer.seek(0)
-    return base64.b64encode(buffer.read()).decode('utf-8')
+    image.save(buffer, format=pil_format, **options)
+    encode_ms = round((time.perf_counter() - start) * 1000, 2)
+    record_encode_ms(encoding, encode_ms)
+
+    return {
+        'data': buffer.getvalue(),
+        'content_type': content_type,
+        'extension': extension,
+        'encoding': encoding,
+        'encode_ms': encode_ms,
+    }
+
+
+def postcard_to_base64(postcard_image, encoding=DEFAULT_POSTCARD_ENCODING, quality=None):
+    """Convert PIL Image to a base64 string (PNG by default)"""
+    encoded = encode_postcard(postcard_image, encoding, quality)
+    return base64.b64encode(encoded['data']).decode('utf-8')
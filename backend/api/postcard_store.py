@@ -0,0 +1,167 @@
+"""
+Content-addressed store for finished postcards
+Encoded postcards are kept under their request hash (see
+postcard_generator.postcard_request_hash), so a repeat view or a shared link
+costs a file read instead of a full render and composite.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PostcardStore(ABC):
+    """
+    Interface for postcard storage backends
+
+    Keys are request hashes plus the file extension of the encoding.
+    """
+
+    @abstractmethod
+    def get(self, request_hash, extension):
+        """Return the stored bytes, or None"""
+
+    @abstractmethod
+    def put(self, request_hash, extension, data):
+        """Store encoded postcard bytes"""
+
+    def local_path(self, request_hash, extension):
+        """Filesystem path of a stored postcard for sendfile serving, or None"""
+        return None
+
+    def stats(self):
+        """Return store counters as a JSON-serializable dict"""
+        return {}
+
+
+class FileSystemPostcardStore(PostcardStore):
+    """
+    Postcards as files under a root directory, evicting least recently
+    used files (by mtime, refreshed on reads) once over a byte budget
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._current_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, request_hash, extension):
+        return os.path.join(self.root, request_hash[:2], f'{request_hash}.{extension}')
+
+    def _scan(self):
+        """List (mtime, size, path) of every stored file"""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _ensure_size(self):
+        if self._current_bytes is None:
+            self._current_bytes = sum(size for _, size, _ in self._scan())
+
+    def local_path(self, request_hash, extension):
+        path = self._path(request_hash, extension)
+        try:
+            # Touch on read so eviction keeps recently viewed postcards
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, request_hash, extension):
+        path = self.local_path(request_hash, extension)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, request_hash, extension, data):
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(request_hash, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._lock:
+            self._ensure_size()
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        # Write and swap in, so readers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._current_bytes += len(data) - replaced
+            if self._current_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete oldest files until under budget (rescans, since other workers write too)"""
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._current_bytes = total
+
+    def stats(self):
+        with self._lock:
+            self._ensure_size()
+            return {
+                'backend': 'filesystem',
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_postcard_store():
+    """
+    Return the configured store (POSTCARD_STORE_BACKEND), or None when
+    POSTCARD_STORE_DIR is empty
+    """
+    global _store
+    if _store is not None or not settings.POSTCARD_STORE_DIR:
+        return _store
+
+    with _store_lock:
+        if _store is None:
+            backend = import_string(settings.POSTCARD_STORE_BACKEND)
+            _store = backend(settings.POSTCARD_STORE_DIR, settings.POSTCARD_STORE_MAX_BYTES)
+            print(f'Postcard store: {settings.POSTCARD_STORE_BACKEND} at {settings.POSTCARD_STORE_DIR}')
+    return _store
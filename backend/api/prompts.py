@@ -0,0 +1,161 @@
+"""
+Claude prompts for crew generation and photo analysis
+The static instructions live in a system block marked for prompt caching;
+only the description (or the photo) is sent as the per-request user turn.
+Anthropic caches the system prefix for 5 minutes once it is at least the
+model's minimum cacheable length (1024 tokens for Sonnet) - below that the
+cache_control marker is ignored and the call is billed as usual.
+
+In structured mode (the default) Claude must answer by calling a tool whose
+input schema comes from api/schemas.py; tool definitions are part of the
+cached prefix. The text format instructions are kept for
+CLAUDE_STRUCTURED_OUTPUT=0.
+"""
+import os
+from .schemas import CREW_TOOL, PHOTO_TOOL, CREW_TOOL_NAME, PHOTO_TOOL_NAME
+
+# Mark the system blocks for Anthropic prompt caching (0 disables)
+CLAUDE_PROMPT_CACHING = os.getenv('CLAUDE_PROMPT_CACHING', '1') != '0'
+
+# Force tool use with typed arguments instead of free-text JSON (0 disables)
+CLAUDE_STRUCTURED_OUTPUT = os.getenv('CLAUDE_STRUCTURED_OUTPUT', '1') != '0'
+
+CREW_INSTRUCTIONS = """You are a crew generator for a WW2 aviation game. The user gives a description of a squadron or crew; generate a crew based on it.
+
+Requirements:
+- Generate an appropriate number of crew members (if not specified, generate 5-10)
+- MAXIMUM 10 crew members total - never generate more than 10
+- All birth dates must be before 1922 (valid format: YYYY-MM-DD)
+- Use authentic names appropriate for the nationality/squadron mentioned
+- Class must be either "AirCrew" or "BaseCrew"
+- For AirCrew: Role must be one of: Pilot, Gunner, Navigator, BombAimer, FlightEngineer, RadioOperator
+- For BaseCrew: Job must be one of: AAFCook, FieldMechanic, FieldEngineer, RAFMedic, AAFLabour
+- Skill ranks must be 0-6 (only for AirCrew)
+- Gender must be "Male" or "Female"
+- Create brief but authentic biographies (2-3 sentences)
+- Add "Ethnicity" field: Based on the nationality/description, specify the ethnicity/appearance
+  Valid values: "European", "African", "Asian", "MiddleEastern", "Hispanic", "Mixed"
+  Examples: Polish → European, Tuskegee Airmen → African, Japanese → Asian"""
+
+CREW_TEXT_FORMAT = """IMPORTANT: Return ONLY valid JSON, no markdown formatting, no code blocks, no explanations.
+
+Return a JSON array of members with this EXACT structure:
+[{"FirstName": "Jan", "LastName": "Kowalski", "Nickname": "Eagle", "BirthDate": "1918-05-15", "Gender": "Male", "Ethnicity": "European", "Class": "AirCrew", "Role": "Pilot", "Job": "None", "Biography": {"en": "Brief biography here..."}, "SkillRanks": {"Flying": 4, "Shooting": 3, "Bombing": 2, "Endurance": 5, "Engineering": 2, "Navigating": 3}}]"""
+
+CREW_TOOL_FORMAT = f"""Submit the crew by calling the {CREW_TOOL_NAME} tool."""
+
+PHOTO_INSTRUCTIONS = """Analyze the portrait photo the user sends and extract facial features in structured JSON format.
+
+REQUIREMENTS:
+- Detect ONE person's face (if multiple, analyze the most prominent)
+- Return detailed, descriptive terms (not measurements)
+- Use terms like: angular, soft, rounded, square, oval, delicate, prominent, etc.
+- If there is no face, set face_detected to false and leave the other fields out"""
+
+PHOTO_TEXT_FORMAT = """Return ONLY the JSON, no markdown, no explanations, with this EXACT structure:
+{"face_detected": true,
+ "gender_presentation": "Male|Female|Ambiguous",
+ "face_shape": "oval|round|square|heart|diamond|rectangular|angular",
+ "face_characteristics": ["angular jaw", "defined chin", "soft curves"],
+ "skin_tone": "very light|light|light medium|medium|olive|brown|dark brown",
+ "hair": {"present": true, "length": "bald|very short|short|medium|long", "style": "spiky|wavy|straight|curly|swept|slicked|messy|ponytail|bob", "color": "black|dark brown|brown|light brown|blonde|red|auburn|gray|white", "characteristics": ["messy", "styled", "natural"]},
+ "facial_hair": {"beard": "none|stubble|goatee|full", "mustache": "none|thin|handlebar|chevron|walrus"},
+ "nose": {"size": "small|medium|large", "shape": "rounded|angular|curved|straight|button|hook|upturned", "bridge": "low|medium|high", "characteristics": ["delicate", "prominent", "feminine", "masculine"]},
+ "eyes": {"shape": "almond|round|narrow|wide", "size": "small|medium|large", "color": "blue|green|brown|hazel|gray|amber"},
+ "mouth": {"size": "small|medium|large", "shape": "full|thin|neutral", "expression": "neutral|smiling|frowning"},
+ "accessories": {"glasses": "none|round|rectangular|monocle", "other": ["beauty mark", "scar", "etc"]},
+ "age_markers": {"apparent_age": "young|middle|mature|elderly", "wrinkles": "none|minimal|moderate|prominent", "details": ["crow's feet", "smile lines", "forehead lines"]},
+ "overall_characteristics": ["youthful", "strong", "delicate", "angular", "soft"]}"""
+
+PHOTO_TOOL_FORMAT = f"""Report the features by calling the {PHOTO_TOOL_NAME} tool."""
+
+
+def system_blocks(text):
+    """System prompt as a content block list, marked cacheable when prompt caching is on"""
+    block = {'type': 'text', 'text': text}
+    if CLAUDE_PROMPT_CACHING:
+        block['cache_control'] = {'type': 'ephemeral'}
+    return [block]
+
+
+def structured_request(instructions, text_format, tool_format, tool, structured):
+    """system (and, in structured mode, tools/tool_choice) keyword arguments"""
+    if structured is None:
+        structured = CLAUDE_STRUCTURED_OUTPUT
+    if not structured:
+        return {'system': system_blocks(f'{instructions}\n\n{text_format}')}
+    return {
+        'system': system_blocks(f'{instructions}\n\n{tool_format}'),
+        'tools': [tool],
+        'tool_choice': {'type': 'tool', 'name': tool['name']},
+    }
+
+
+def crew_request(description, structured=None):
+    """
+    Prompt arguments for a crew generation call
+
+    Args:
+        description: Crew description from the user
+        structured: Force the submit_crew tool (default CLAUDE_STRUCTURED_OUTPUT)
+
+    Returns:
+        dict: system, messages and (structured) tools/tool_choice keyword
+              arguments for messages.create/stream
+    """
+    return {
+        **structured_request(CREW_INSTRUCTIONS, CREW_TEXT_FORMAT, CREW_TOOL_FORMAT, CREW_TOOL, structured),
+        'messages': [
+            {
+                'role': 'user',
+                'content': f'Generate the crew for this description: "{description}"'
+            }
+        ],
+    }
+
+
+def photo_request(image_base64, mime_type, structured=None):
+    """
+    Prompt arguments for a photo analysis call
+
+    Args:
+        image_base64: Photo as base64
+        mime_type: Photo MIME type
+        structured: Force the record_features tool (default CLAUDE_STRUCTURED_OUTPUT)
+
+    Returns:
+        dict: system, messages and (structured) tools/tool_choice keyword
+              arguments for messages.create
+    """
+    return {
+        **structured_request(PHOTO_INSTRUCTIONS, PHOTO_TEXT_FORMAT, PHOTO_TOOL_FORMAT, PHOTO_TOOL, structured),
+        'messages': [
+            {
+                'role': 'user',
+                'content': [
+                    {
+                        'type': 'image',
+                        'source': {
+                            'type': 'base64',
+                            'media_type': mime_type,
+                            'data': image_base64
+                        }
+                    },
+                    {
+                        'type': 'text',
+                        'text': 'Analyze this photo.'
+                    }
+                ]
+            }
+        ],
+    }
+
+
+def usage_summary(usage):
+    """One-line token usage for logs, including prompt cache reads and writes"""
+    if usage is None:
+        return 'usage unknown'
+    return (f'{usage.input_tokens} input tokens '
+            f'({getattr(usage, "cache_read_input_tokens", 0) or 0} cache read, '
+            f'{getattr(usage, "cache_creation_input_tokens", 0) or 0} cache write), '
+            f'{usage.output_tokens} output tokens')
@@ -0,0 +1,233 @@
+"""
+Typed output schemas for Claude calls
+Crew members and photo features are defined as pydantic models. Their JSON
+schemas become the input_schema of the tools Claude is made to call, and
+the tool arguments Claude returns are validated by the same models, so no
+regex search over free text is needed.
+"""
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+# Members kept from one crew response
+MAX_CREW_MEMBERS = 10
+
+CREW_TOOL_NAME = 'submit_crew'
+PHOTO_TOOL_NAME = 'record_features'
+
+
+class MemberBiography(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    en: str = Field(description='Brief but authentic biography, 2-3 sentences')
+
+
+class MemberSkillRanks(BaseModel):
+    Flying: int = Field(0, ge=0, le=6)
+    Shooting: int = Field(0, ge=0, le=6)
+    Bombing: int = Field(0, ge=0, le=6)
+    Endurance: int = Field(0, ge=0, le=6)
+    Engineering: int = Field(0, ge=0, le=6)
+    Navigating: int = Field(0, ge=0, le=6)
+
+
+class CrewMember(BaseModel):
+    """One crew member"""
+    model_config = ConfigDict(extra='allow', populate_by_name=True)
+
+    FirstName: str
+    LastName: str
+    Nickname: str = ''
+    BirthDate: str = Field(description='YYYY-MM-DD, before 1922', pattern=r'^\d{4}-\d{2}-\d{2}$')
+    Gender: Literal['Male', 'Female']
+    Ethnicity: Literal['European', 'African', 'Asian', 'MiddleEastern', 'Hispanic', 'Mixed']
+    Class_: Literal['AirCrew', 'BaseCrew'] = Field(alias='Class')
+    # Missing roles default to Pilot, as enrich_member always did
+    Role: str = Field('Pilot', description='AirCrew: Pilot, Gunner, Navigator, BombAimer, FlightEngineer '
+                                          'or RadioOperator; BaseCrew: None')
+    Job: str = Field('None', description='BaseCrew: AAFCook, FieldMechanic, FieldEngineer, RAFMedic '
+                                         'or AAFLabour; AirCrew: None')
+    Biography: MemberBiography
+    SkillRanks: MemberSkillRanks = Field(default_factory=MemberSkillRanks, description='AirCrew only, each 0-6')
+
+
+class Crew(BaseModel):
+    crew: List[CrewMember] = Field(max_length=MAX_CREW_MEMBERS, description='5-10 members unless the '
+                                                                           'description says otherwise')
+
+
+class Hair(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    present: bool = True
+    length: Optional[str] = Field(None, description='bald|very short|short|medium|long')
+    style: Optional[str] = Field(None, description='spiky|wavy|straight|curly|swept|slicked|messy|ponytail|bob')
+    color: Optional[str] = Field(None, description='black|dark brown|brown|light brown|blonde|red|auburn|gray|white')
+    characteristics: List[str] = Field(default_factory=list, description='e.g. messy, styled, natural')
+
+
+class FacialHair(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    beard: str = Field('none', description='none|stubble|goatee|full')
+    mustache: str = Field('none', description='none|thin|handlebar|chevron|walrus')
+
+
+class Nose(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    size: Optional[str] = Field(None, description='small|medium|large')
+    shape: Optional[str] = Field(None, description='rounded|angular|curved|straight|button|hook|upturned')
+    bridge: Optional[str] = Field(None, description='low|medium|high')
+    characteristics: List[str] = Field(default_factory=list, description='e.g. delicate, prominent, feminine, masculine')
+
+
+class Eyes(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    shape: Optional[str] = Field(None, description='almond|round|narrow|wide')
+    size: Optional[str] = Field(None, description='small|medium|large')
+    color: Optional[str] = Field(None, description='blue|green|brown|hazel|gray|amber')
+
+
+class Mouth(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    size: Optional[str] = Field(None, description='small|medium|large')
+    shape: Optional[str] = Field(None, description='full|thin|neutral')
+    expression: Optional[str] = Field(None, description='neutral|smiling|frowning')
+
+
+class Accessories(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    glasses: str = Field('none', description='none|round|rectangular|monocle')
+    other: List[str] = Field(default_factory=list, description='e.g. beauty mark, scar')
+
+
+class AgeMarkers(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    apparent_age: Optional[str] = Field(None, description='young|middle|mature|elderly')
+    wrinkles: Optional[str] = Field(None, description='none|minimal|moderate|prominent')
+    details: List[str] = Field(default_factory=list, description="e.g. crow's feet, smile lines, forehead lines")
+
+
+class PhotoFeatures(BaseModel):
+    """Facial features of the most prominent face in a photo"""
+    model_config = ConfigDict(extra='allow')
+
+    face_detected: bool
+    gender_presentation: Optional[str] = Field(None, description='Male|Female|Ambiguous')
+    face_shape: Optional[str] = Field(None, description='oval|round|square|heart|diamond|rectangular|angular')
+    face_characteristics: List[str] = Field(default_factory=list, description='e.g. angular jaw, defined chin, soft curves')
+    skin_tone: Optional[str] = Field(None, description='very light|light|light medium|medium|olive|brown|dark brown')
+    hair: Optional[Hair] = None
+    facial_hair: Optional[FacialHair] = None
+    nose: Optional[Nose] = None
+    eyes: Optional[Eyes] = None
+    mouth: Optional[Mouth] = None
+    accessories: Optional[Accessories] = None
+    age_markers: Optional[AgeMarkers] = None
+    overall_characteristics: List[str] = Field(default_factory=list, description='e.g. youthful, strong, delicate, angular, soft')
+
+
+# Validators are built once at import and reused for every response
+crew_member_adapter = TypeAdapter(CrewMember)
+photo_features_adapter = TypeAdapter(PhotoFeatures)
+
+
+def tool_schema(model):
+    """
+    JSON schema of a model for a tool's input_schema
+
+    Nested models are inlined (no $defs/$ref) and titles dropped, which keeps
+    the tool definition short.
+    """
+    schema = model.model_json_schema(by_alias=True)
+    definitions = schema.pop('$defs', {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            if '$ref' in node:
+                return inline(definitions[node['$ref'].rsplit('/', 1)[-1]])
+            return {key: inline(value) for key, value in node.items() if key != 'title'}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return inline(schema)
+
+
+CREW_TOOL = {
+    'name': CREW_TOOL_NAME,
+    'description': 'Submit the generated crew',
+    'input_schema': tool_schema(Crew),
+}
+
+PHOTO_TOOL = {
+    'name': PHOTO_TOOL_NAME,
+    'description': 'Record the facial features detected in the photo',
+    'input_schema': tool_schema(PhotoFeatures),
+}
+
+
+def validate_crew_member(member):
+    """
+    Validate one crew member from Claude
+
+    Returns:
+        dict: The member with defaults filled in, or None if it is invalid
+    """
+    try:
+        return crew_member_adapter.validate_python(member).model_dump(by_alias=True)
+    except ValidationError as e:
+        print(f'Skipping invalid crew member: {e.error_count()} errors, first: {e.errors()[0]["msg"]}')
+        return None
+
+
+def parse_crew_tool_input(tool_input):
+    """
+    Crew members from submit_crew arguments
+
+    Invalid members are dropped rather than failing the whole crew.
+
+    Returns:
+        list: Validated crew member dicts (at most MAX_CREW_MEMBERS)
+
+    Raises:
+        ValueError: If the arguments contain no crew list
+    """
+    members = tool_input.get('crew') if isinstance(tool_input, dict) else None
+    if not isinstance(members, list):
+        raise ValueError('Tool input has no crew list')
+
+    crew_data = []
+    for member in members[:MAX_CREW_MEMBERS]:
+        member = validate_crew_member(member)
+        if member is not None:
+            crew_data.append(member)
+    return crew_data
+
+
+def parse_photo_tool_input(tool_input):
+    """
+    Detected features from record_features arguments
+
+    Returns:
+        dict: Validated features (unset optional fields omitted)
+
+    Raises:
+        ValueError: If the arguments do not match PhotoFeatures
+    """
+    try:
+        return photo_features_adapter.validate_python(tool_input).model_dump(exclude_none=True)
+    except ValidationError as e:
+        raise ValueError(f'Invalid photo features: {e}') from e
+
+
+def find_tool_input(message, name):
+    """Arguments of the named tool_use block in a Claude message, or None"""
+    for block in message.content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == name:
+            return block.input
+    return None
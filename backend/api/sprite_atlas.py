@@ -0,0 +1,291 @@
+"""
+Precomputed tinted-sprite atlas
+Every sprite x palette color x render size is tinted and resized once at
+deploy time and packed per sprite folder into a raw RGBA blob
+(<folder>.<digest>.rgba) plus a JSON offset index (<folder>.json) naming
+that blob. At request time sprites are wrapped straight from the
+memory-mapped blob - no PNG decode, resize or tint.
+
+The index also records a SHA-256 of every source PNG; an atlas whose
+sources changed since the build is ignored and sprites render from the PNGs.
+"""
+import hashlib
+import json
+import mmap
+import os
+import threading
+from PIL import Image
+
+ATLAS_VERSION = 2
+
+# Atlas directory: private data, not under STATIC_ROOT (it is large, and
+# collectstatic --clear would delete it)
+SPRITE_ATLAS_DIR = os.getenv(
+    'SPRITE_ATLAS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sprite_atlas')
+)
+
+# Set SPRITE_ATLAS_ENABLED=0 to always render from the PNG sprites
+SPRITE_ATLAS_ENABLED = os.getenv('SPRITE_ATLAS_ENABLED', '1') != '0'
+
+
+def get_atlas_dir():
+    """Directory holding the atlas files"""
+    return SPRITE_ATLAS_DIR
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stale_sources(sources, folder_path):
+    """Source PNGs that are missing or changed since the atlas was built"""
+    stale = []
+    for filename, digest in sources.items():
+        try:
+            if file_digest(os.path.join(folder_path, filename)) != digest:
+                stale.append(filename)
+        except OSError:
+            stale.append(filename)
+    return stale
+
+
+def atlas_entry_key(filename, tint_color, size):
+    """Index key for one sprite file at one tint color and size"""
+    width, height = size
+    return f"{filename}|{(tint_color or '').upper()}|{width}x{height}"
+
+
+class FolderAtlas:
+    """Read-only view of one folder's atlas blob and offset index"""
+
+    def __init__(self, index_path):
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != ATLAS_VERSION:
+            raise ValueError(f'Unsupported atlas version in {index_path}')
+
+        self.entries = index['entries']
+        self.sources = index['sources']
+        blob_path = os.path.join(os.path.dirname(index_path), index['blob'])
+        with open(blob_path, 'rb') as f:
+            # The blob is named by its content digest, so it always belongs
+            # to this index; the size check catches a truncated copy
+            size = os.fstat(f.fileno()).st_size
+            if size != index['blob_bytes']:
+                raise ValueError(f'{blob_path} is {size} bytes, index expects {index["blob_bytes"]}')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._view = memoryview(self._mmap)
+
+    def get(self, filename, tint_color, size):
+        """Return the sprite as an RGBA image backed by the mmap, or None"""
+        entry = self.entries.get(atlas_entry_key(filename, tint_color, size))
+        if entry is None:
+            return None
+
+        offset, width, height = entry
+        length = width * height * 4
+        return Image.frombuffer(
+            'RGBA', (width, height), self._view[offset:offset + length], 'raw', 'RGBA', 0, 1
+        )
+
+
+_atlases = {}
+_atlases_lock = threading.Lock()
+
+
+def get_folder_atlas(base_path, folder):
+    """Load (once per process) the atlas for a sprite folder, or None if not built"""
+    key = (base_path, folder)
+    if key in _atlases:
+        return _atlases[key]
+
+    with _atlases_lock:
+        if key in _atlases:
+            return _atlases[key]
+
+        index_path = os.path.join(get_atlas_dir(), f'{folder}.json')
+
+        atlas = None
+        if os.path.exists(index_path):
+            try:
+                atlas = FolderAtlas(index_path)
+                stale = stale_sources(atlas.sources, os.path.join(base_path, 'PortraitSprites', folder))
+                if stale:
+                    print(f'Sprite atlas stale for {folder}: {len(stale)} source PNGs changed '
+                          f'(e.g. {stale[0]}), using the PNGs - rebuild with build_sprite_atlas')
+                    atlas = None
+                else:
+                    print(f'Sprite atlas loaded: {folder} ({len(atlas.entries)} entries)')
+            except (OSError, ValueError, KeyError) as e:
+                print(f'Sprite atlas unusable for {folder}: {e}')
+                atlas = None
+
+        # Cache misses too, so a missing atlas is only probed once
+        _atlases[key] = atlas
+        return atlas
+
+
+def get_atlas_sprite(base_path, asset_path, tint_color, size):
+    """
+    Look up a pre-tinted, pre-resized sprite in the atlas
+
+    Args:
+        base_path: Base path to static files
+        asset_path: Resolved sprite path (as returned by get_asset_path)
+        tint_color: Hex tint color, or None for untinted layers
+        size: (width, height) render size
+
+    Returns:
+        PIL RGBA image sharing memory with the atlas, or None on a miss
+    """
+    if not SPRITE_ATLAS_ENABLED:
+        return None
+
+    folder = os.path.basename(os.path.dirname(asset_path))
+    atlas = get_folder_atlas(base_path, folder)
+    if atlas is None:
+        return None
+    return atlas.get(os.path.basename(asset_path), tint_color, size)
+
+
+def reset_sprite_atlas():
+    """Forget loaded atlases so the next lookup re-reads them from disk"""
+    with _atlases_lock:
+        _atlases.clear()
+
+
+def write_folder_atlas(atlas_dir, folder, sprites, sources=None):
+    """
+    Pack sprites into <folder>.<digest>.rgba + <folder>.json
+
+    The blob is written under a name derived from its content and the index
+    (which names the blob) is swapped in last, so workers opening the atlas
+    mid-build see either the old index and blob or the new ones. The blob the
+    previous index named is kept for workers that just read that index;
+    older blobs are deleted.
+
+    Args:
+        atlas_dir: Output directory
+        folder: Sprite folder name (used as the atlas file name)
+        sprites: Iterable of (filename, tint_color, RGBA image)
+        sources: {source filename: SHA-256} recorded for the staleness check
+
+    Returns:
+        tuple: (entry count, blob size in bytes)
+    """
+    os.makedirs(atlas_dir, exist_ok=True)
+    index_path = os.path.join(atlas_dir, f'{folder}.json')
+    tmp_blob_path = os.path.join(atlas_dir, f'{folder}.{os.getpid()}.rgba.tmp')
+
+    entries = {}
+    offset = 0
+    digest = hashlib.sha256()
+    with open(tmp_blob_path, 'wb') as blob:
+        for filename, tint_color, img in sprites:
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+            data = img.tobytes()
+            blob.write(data)
+            digest.update(data)
+            entries[atlas_entry_key(filename, tint_color, img.size)] = [offset, img.width, img.height]
+            offset += len(data)
+
+    blob_name = f'{folder}.{digest.hexdigest()[:16]}.rgba'
+    os.replace(tmp_blob_path, os.path.join(atlas_dir, blob_name))
+
+    previous_blob = None
+    try:
+        with open(index_path, 'r') as f:
+            previous_blob = json.load(f).get('blob')
+    except (OSError, ValueError):
+        pass
+
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump({
+            'version': ATLAS_VERSION,
+            'folder': folder,
+            'blob': blob_name,
+            'blob_bytes': offset,
+            'sources': sources or {},
+            'entries': entries,
+        }, f)
+    os.replace(index_path + '.tmp', index_path)
+
+    for name in os.listdir(atlas_dir):
+        if name.startswith(f'{folder}.') and name.endswith('.rgba') and name not in (blob_name, previous_blob):
+            try:
+                os.remove(os.path.join(atlas_dir, name))
+            except OSError as e:
+                print(f'  Cannot remove old atlas blob {name}: {e}')
+    return len(entries), offset
+
+
+def build_sprite_atlas(base_path, sizes, output_dir=None, folders=None):
+    """
+    Pre-tint every sprite for every palette entry and pack one atlas per folder
+
+    Args:
+        base_path: Base path to static files (containing PortraitSprites/)
+        sizes: Iterable of (width, height) render sizes
+        output_dir: Atlas directory (defaults to SPRITE_ATLAS_DIR)
+        folders: Optional subset of sprite folder names to build
+
+    Returns:
+        dict: {folder: {'entries': int, 'bytes': int}}
+    """
+    from . import postcard_generator
+
+    atlas_dir = output_dir or get_atlas_dir()
+    sizes = sorted(set(tuple(s) for s in sizes))
+
+    # Collect (prefix, palette) per folder; AccessoryFace/Front share a folder
+    folder_specs = {}
+    for layer_name, layer_info in postcard_generator.LAYERS.items():
+        folder = postcard_generator.SPRITE_FOLDERS.get(layer_name)
+        if not folder or (folders and folder not in folders):
+            continue
+        prefix = postcard_generator.FILENAME_PREFIXES.get(layer_name, layer_name.lower())
+        palette = postcard_generator.get_layer_palette(layer_info)
+        folder_specs[folder] = (prefix, palette)
+
+    def folder_sprites(folder_path, filenames, palette):
+        tint_colors = postcard_generator.COLOR_PALETTES[palette] if palette else [None]
+        for filename in filenames:
+            with Image.open(os.path.join(folder_path, filename)) as source:
+                decoded = source.convert('RGBA')
+            for size in sizes:
+                resized = decoded
+                if resized.size != size:
+                    resized = decoded.resize(size, Image.Resampling.LANCZOS)
+                for tint_color in tint_colors:
+                    if tint_color is None:
+                        yield filename, None, resized
+                    else:
+                        yield filename, tint_color, postcard_generator.apply_color_tint(resized, tint_color)
+
+    results = {}
+    for folder, (prefix, palette) in sorted(folder_specs.items()):
+        folder_path = os.path.join(base_path, 'PortraitSprites', folder)
+        if not os.path.isdir(folder_path):
+            print(f'  Skipping {folder}: folder not found')
+            continue
+
+        filenames = sorted(
+            f for f in os.listdir(folder_path)
+            if f.startswith(f'{prefix}_') and f.endswith('.png')
+        )
+        sources = {filename: file_digest(os.path.join(folder_path, filename)) for filename in filenames}
+        count, nbytes = write_folder_atlas(
+            atlas_dir, folder, folder_sprites(folder_path, filenames, palette), sources
+        )
+        results[folder] = {'entries': count, 'bytes': nbytes}
+        print(f'  {folder}: {count} entries, {nbytes / (1024 * 1024):.1f} MB')
+
+    reset_sprite_atlas()
+    return results
@@ -0,0 +1,105 @@
+"""
+In-memory cache for decoded sprite images
+Keeps already-decoded, already-resized RGBA sprites so a warm worker
+does not touch PNG decoding on every portrait render
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Default byte budget for decoded sprites (256x256 RGBA sprite = 256 KB)
+SPRITE_CACHE_MAX_BYTES = int(os.getenv('SPRITE_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+
+# Byte budget for color-tinted sprites (one entry per sprite and palette color)
+TINT_CACHE_MAX_BYTES = int(os.getenv('TINT_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+
+# Byte budget for finished character portraits
+PORTRAIT_CACHE_MAX_BYTES = int(os.getenv('PORTRAIT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def image_nbytes(img):
+    """Approximate in-memory size of a PIL image in bytes"""
+    return img.width * img.height * len(img.getbands())
+
+
+class ImageCache:
+    """
+    Thread-safe LRU cache of PIL images with a total byte budget
+
+    Cached images are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached image for key (marking it recently used), or None"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, img):
+        """Store an image, evicting least recently used entries over budget"""
+        nbytes = image_nbytes(img)
+        if nbytes > self.max_bytes:
+            return img
+
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+            self._items[key] = (img, nbytes)
+            self.current_bytes += nbytes
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+        return img
+
+    def clear(self):
+        """Drop all cached images and reset counters"""
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return cache counters as a JSON-serializable dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide cache of decoded sprites, keyed by
+# (base_path, layer, index, variant, gender, size)
+sprite_cache = ImageCache(SPRITE_CACHE_MAX_BYTES)
+
+# Tinted sprites, keyed by the sprite key plus the hex tint color
+tinted_sprite_cache = ImageCache(TINT_CACHE_MAX_BYTES)
+
+# Finished portraits, keyed by (base_path, canonical character hash, size)
+portrait_cache = ImageCache(PORTRAIT_CACHE_MAX_BYTES)
@@ -0,0 +1,190 @@
+"""
+Sprite metadata store
+Parses sprite-metadata.json once, validates it against the LAYERS folders
+and exposes typed per-layer records. The file is re-read only when its
+mtime or size changes (and re-parsed only when its content hash changes),
+so photo requests no longer parse the JSON every time.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+from .character_generator import LAYERS
+
+SPRITE_METADATA_PATH = os.path.join(os.path.dirname(__file__), 'sprite-metadata.json')
+
+# Seconds between mtime checks (0 = check on every access)
+SPRITE_METADATA_CHECK_INTERVAL = float(os.getenv('SPRITE_METADATA_CHECK_INTERVAL', 2))
+
+# Sprite filenames: <prefix>_<index>_<variant>.png
+SPRITE_FILENAME_RE = re.compile(r'(\w+)_(\d+)_(\d+)')
+
+GENDER_FITS = ('male', 'female', 'both')
+
+
+class SpriteRecord(NamedTuple):
+    """One sprite's metadata, with the filename already parsed"""
+    filename: str
+    index: int
+    variant: int
+    gender_fit: str
+    terms: tuple       # tags, characteristics, style, shape, description
+    data: dict         # raw metadata entry
+
+
+def sprite_terms(metadata):
+    """All terms a sprite can be matched on: tags, characteristics, style, shape, description"""
+    characteristics = metadata.get('characteristics', '')
+    sprite_characteristics = [s.strip() for s in characteristics.split(',')] if characteristics else []
+    all_sprite_terms = metadata.get('tags', []) + sprite_characteristics + [
+        metadata.get('style'),
+        metadata.get('shape'),
+        metadata.get('description')
+    ]
+    return [t for t in all_sprite_terms if t]
+
+
+class SpriteMetadata:
+    """
+    Immutable snapshot of one version of sprite-metadata.json
+
+    Attributes:
+        raw: Parsed JSON document
+        layers: {layer folder: [SpriteRecord, ...]} in file order
+        issues: Validation problems found while building the records
+        sha256: Content hash of the file
+        derived: Per-snapshot cache for structures built from the records
+                 (e.g. compiled tag indexes); dropped with the snapshot on reload
+    """
+
+    def __init__(self, raw, sha256):
+        self.raw = raw
+        self.sha256 = sha256
+        self.layers = {}
+        self.issues = []
+        self.derived = {}
+        self._build()
+
+    def _build(self):
+        categories = self.raw.get('categories')
+        if not isinstance(categories, dict):
+            self.issues.append('Missing "categories" object')
+            return
+
+        known_folders = {layer['folder'] for layer in LAYERS.values()}
+        for folder in sorted(set(categories) - known_folders):
+            self.issues.append(f'{folder}: not a LAYERS folder')
+
+        for folder, sprites in categories.items():
+            if not isinstance(sprites, dict):
+                self.issues.append(f'{folder}: expected an object of sprites')
+                continue
+
+            records = []
+            for filename, data in sprites.items():
+                match = SPRITE_FILENAME_RE.search(filename)
+                if not match:
+                    self.issues.append(f'{folder}/{filename}: filename has no index/variant')
+                    continue
+                if not isinstance(data, dict):
+                    self.issues.append(f'{folder}/{filename}: expected an object')
+                    continue
+                if data.get('gender_fit') not in GENDER_FITS:
+                    self.issues.append(f'{folder}/{filename}: gender_fit {data.get("gender_fit")!r}')
+                if not isinstance(data.get('tags', []), list):
+                    self.issues.append(f'{folder}/{filename}: tags must be a list')
+                    continue
+
+                records.append(SpriteRecord(
+                    filename=filename,
+                    index=int(match.group(2)),
+                    variant=int(match.group(3)),
+                    gender_fit=data.get('gender_fit'),
+                    terms=tuple(sprite_terms(data)),
+                    data=data,
+                ))
+            self.layers[folder] = records
+
+    def layer(self, folder):
+        """Records for a layer folder (empty list when the folder has no metadata)"""
+        return self.layers.get(folder, [])
+
+    def summary(self):
+        """JSON-serializable description for health checks"""
+        return {
+            'sha256': self.sha256[:12],
+            'layers': len(self.layers),
+            'sprites': sum(len(records) for records in self.layers.values()),
+            'issues': self.issues[:20],
+            'issue_count': len(self.issues),
+        }
+
+
+class SpriteMetadataStore:
+    """Thread-safe holder of the current SpriteMetadata, reloaded on file change"""
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stat_key = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    def get(self):
+        """Return the current snapshot, reloading first if the file changed"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+                stat_key = (stat.st_mtime_ns, stat.st_size)
+            except OSError as e:
+                if self._snapshot is None:
+                    raise
+                print(f'Sprite metadata: cannot stat {self.path} ({e}), keeping loaded version')
+                return self._snapshot
+
+            if stat_key != self._stat_key:
+                self._load(stat_key)
+            return self._snapshot
+
+    def _load(self, stat_key):
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        self._stat_key = stat_key
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        if self._snapshot is not None and self._snapshot.sha256 == sha256:
+            return
+
+        try:
+            raw = json.loads(content)
+        except ValueError as e:
+            if self._snapshot is None:
+                raise
+            print(f'Sprite metadata: invalid JSON ({e}), keeping loaded version')
+            return
+
+        snapshot = SpriteMetadata(raw, sha256)
+        self._snapshot = snapshot
+        self.reloads += 1
+        summary = snapshot.summary()
+        print(f'Sprite metadata loaded: {summary["sprites"]} sprites, '
+              f'{summary["issue_count"]} validation issues (sha256 {summary["sha256"]})')
+
+
+# Process-wide store for api/sprite-metadata.json
+sprite_metadata_store = SpriteMetadataStore(SPRITE_METADATA_PATH, SPRITE_METADATA_CHECK_INTERVAL)
+
+
+def get_sprite_metadata():
+    """Return the current SpriteMetadata snapshot"""
+    return sprite_metadata_store.get()
@@ -1,14 +1,22 @@
 """
 URL routing for API endpoints
 """
-from django.urls import path
+from django.urls import path, re_path
 from . import views
-from .views_postcard import generate_postcard_api
+from .views_postcard import generate_postcard_api, postcard_by_hash_api, stored_postcard_api
 
 urlpatterns = [
     path('generate-crew', views.generate_crew, name='generate_crew'),
     path('analyze-photo', views.analyze_photo, name='analyze_photo'),
+    path('analyze-photos', views.analyze_photos, name='analyze_photos'),
+    path('generate-characters', views.generate_characters_api, name='generate_characters'),
     path('generate-postcard', generate_postcard_api, name='generate_postcard'),
+    path('generate-postcard/<str:request_hash>', postcard_by_hash_api, name='postcard_by_hash'),
+    re_path(
+        r'^postcard/(?P<request_hash>[0-9a-f]{64})\.(?P<extension>[a-z]+)$',
+        stored_postcard_api,
+        name='stored_postcard'
+    ),
     path('version-check', views.version_check, name='version_check'),
     path('health', views.health_check, name='health_check'),
 ]
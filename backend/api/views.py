@@ -6,21 +6,103 @@ import json
 import re
 import uuid
 import base64
-from django.http import JsonResponse
+import binascii
+import asyncio
+import math
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from asgiref.sync import sync_to_async
 import anthropic
 from dotenv import load_dotenv
-from .character_generator import generate_random_character
+from .character_generator import generate_random_character, generate_characters
 from .photo_matcher import match_features_to_sprites
 from . import postcard_generator
+from .sprite_cache import sprite_cache, tinted_sprite_cache, portrait_cache
+from .postcard_store import get_postcard_store
+from .crew_cache import crew_cache
+from .crew_stream import CrewArrayParser, format_event, STREAM_CONTENT_TYPES
+from .photo_cache import photo_cache, photo_fingerprint
+from .photo_preprocess import decode_photo, prepare_photo_upload, PhotoTooLarge
+from .sprite_metadata import get_sprite_metadata
+from .llm_limiter import llm_limiter, LLMOverloaded
+from .llm_transport import create_async_client, transport_stats
+from .prompts import crew_request, photo_request, usage_summary, CLAUDE_STRUCTURED_OUTPUT
+from .schemas import (
+    CREW_TOOL_NAME, PHOTO_TOOL_NAME, find_tool_input, parse_crew_tool_input,
+    parse_photo_tool_input, validate_crew_member
+)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Anthropic client
+# Anthropic API key (clients are created per event loop, see get_async_client)
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+
+# One AsyncAnthropic client per event loop. Under ASGI there is a single loop
+# and so a single shared connection pool; under WSGI every request runs in a
+# fresh loop and must not reuse connections bound to a closed one.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the Claude client for the running event loop (see api/llm_transport.py)"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = create_async_client(ANTHROPIC_API_KEY)
+        _async_clients[loop] = async_client
+    return async_client
+
+
+def provider_retry_after(error, default=5):
+    """Seconds to back off after a provider rate limit, from its retry-after header"""
+    try:
+        return max(1, math.ceil(float(error.response.headers.get('retry-after'))))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+@asynccontextmanager
+async def claude_call():
+    """
+    Hold an llm_limiter slot for one Claude call
+
+    Raises LLMOverloaded when no slot is available. A 429 from the provider
+    pauses the limiter for the advertised retry-after before re-raising.
+    """
+    async with llm_limiter.slot():
+        try:
+            yield
+        except anthropic.RateLimitError as e:
+            llm_limiter.pause(provider_retry_after(e))
+            raise
+
+
+def overloaded_response(error, retry_after):
+    """429 response telling the client when to retry"""
+    response = JsonResponse(
+        {
+            'error': error,
+            'details': 'Too many requests are waiting for Claude, please retry shortly',
+            'retryAfter': retry_after
+        },
+        status=429
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+# Batch photo analysis: photos per request, and vision calls in flight per batch
+PHOTO_BATCH_MAX_PHOTOS = int(os.getenv('PHOTO_BATCH_MAX_PHOTOS', 10))
+PHOTO_BATCH_CONCURRENCY = max(1, int(os.getenv('PHOTO_BATCH_CONCURRENCY', 4)))
+
+# Characters per /api/generate-characters request
+CHARACTER_BATCH_MAX = int(os.getenv('CHARACTER_BATCH_MAX', 10000))
 
 # Ethnicity to skin color range mapping
 ETHNICITY_TO_SKIN_RANGE = {
@@ -33,17 +115,251 @@ ETHNICITY_TO_SKIN_RANGE = {
 }
 
 
+def parse_crew_response(response_text):
+    """
+    Parse the crew JSON array out of Claude's full response text
+
+    Returns:
+        list: Crew member dicts (at most 10)
+    """
+    # Parse JSON from response
+    crew_data = None
+    try:
+        # Try direct JSON parse first
+        crew_data = json.loads(response_text)
+        print('Successfully parsed JSON directly')
+    except json.JSONDecodeError as e:
+        print(f'Direct JSON parse failed: {e}')
+        # Try to extract from markdown code blocks
+        json_match = re.search(r'```(?:json)?\s*(\[[\s\S]*?\])\s*```', response_text)
+        if json_match:
+            crew_data = json.loads(json_match.group(1))
+            print('Extracted JSON from markdown code block')
+        else:
+            # Try to find any JSON array
+            array_match = re.search(r'\[[\s\S]*\]', response_text)
+            if array_match:
+                crew_data = json.loads(array_match.group(0))
+                print('Extracted JSON array from response')
+            else:
+                print(f'Could not extract JSON. Response text: {response_text[:500]}')
+                raise ValueError('Could not extract valid JSON from response')
+
+    # Validate it's an array
+    if not isinstance(crew_data, list):
+        print(f'Response is not an array: {type(crew_data)}')
+        raise ValueError('Response is not an array')
+
+    # Limit to maximum 10 crew members
+    if len(crew_data) > 10:
+        print(f'Limiting crew from {len(crew_data)} to 10 members')
+        crew_data = crew_data[:10]
+
+    print(f'Successfully parsed crew data, count: {len(crew_data)}')
+
+    return crew_data
+
+
+def message_text(message):
+    """Concatenated text blocks of a Claude message"""
+    return ''.join(block.text for block in message.content if getattr(block, 'type', None) == 'text')
+
+
+def crew_from_message(message):
+    """
+    Crew members from a Claude response
+
+    Uses the validated submit_crew arguments when Claude called the tool,
+    otherwise parses the text (CLAUDE_STRUCTURED_OUTPUT=0).
+
+    Returns:
+        list: Crew member dicts (at most 10)
+    """
+    arguments = find_tool_input(message, CREW_TOOL_NAME)
+    if arguments is not None:
+        crew_data = parse_crew_tool_input(arguments)
+        print(f'Validated {CREW_TOOL_NAME} arguments, count: {len(crew_data)}')
+        return crew_data
+
+    text = message_text(message)
+    print(f'Response text length: {len(text)}')
+    return parse_crew_response(text)
+
+
+def enrich_member(member):
+    """
+    Give a crew member from Claude a random appearance and the metadata structure
+
+    Returns:
+        dict: {'character': ..., 'metadata': ...}
+    """
+    # Get gender and ethnicity
+    gender = member.get('Gender', 'Male')
+    ethnicity = member.get('Ethnicity', 'European')
+
+    # Get appropriate skin color range based on ethnicity
+    skin_color_range = ETHNICITY_TO_SKIN_RANGE.get(ethnicity, (0, 6))
+
+    print(f'Generating {ethnicity} character with skin range: {skin_color_range}')
+
+    # Generate random character appearance
+    random_character = generate_random_character(gender, skin_color_range)
+
+    # Create metadata structure
+    metadata = {
+        'Id': str(uuid.uuid4()),
+        'CreatorName': member.get('CreatorName', ''),
+        'FirstName': member.get('FirstName', 'Unknown'),
+        'LastName': member.get('LastName', ''),
+        'Nickname': member.get('Nickname', ''),
+        'BirthDate': member.get('BirthDate', '1920-01-01'),
+        'Gender': gender,
+        'Class': member.get('Class', 'AirCrew'),
+        'Job': member.get('Job', 'None'),
+        'Role': member.get('Role', 'Pilot'),
+        'Biography': member.get('Biography', {'en': ''}),
+        'SkillRanks': member.get('SkillRanks', {
+            'Flying': 0,
+            'Shooting': 0,
+            'Bombing': 0,
+            'Endurance': 0,
+            'Engineering': 0,
+            'Navigating': 0
+        })
+    }
+
+    return {
+        'character': random_character,
+        'metadata': metadata
+    }
+
+
+async def fetch_crew_data(description):
+    """
+    Ask Claude for a crew matching the description
+
+    Returns:
+        list: Parsed crew member dicts (at most 10), without appearances
+    """
+    # Call Anthropic API
+    print('Calling Claude API...')
+    async with claude_call():
+        message = await get_async_client().messages.create(
+            model='claude-sonnet-4-5',
+            max_tokens=4096,
+            timeout=60.0,  # 60 second timeout
+            **crew_request(description)
+        )
+
+    print(f'Claude API response received: {usage_summary(message.usage)}')
+
+    return crew_from_message(message)
+
+
+async def stream_crew_events(description, replace_existing, stream_format):
+    """
+    Async generator of crew events for the streaming mode of generate_crew
+
+    Members are parsed out of Claude's streamed tool arguments (or text) as
+    each object closes, enriched and emitted right away, followed by a final
+    'done' event (or an 'error' event). Cached crews are emitted at once.
+    """
+    count = 0
+    try:
+        crew_data = crew_cache.get(description)
+        cached = crew_data is not None
+
+        if cached:
+            print(f'Streaming cached crew data, count: {len(crew_data)}')
+            for member in crew_data:
+                yield format_event(stream_format, 'member', {'index': count, **enrich_member(member)})
+                count += 1
+        else:
+            parser = CrewArrayParser()
+            members = []
+            structured = CLAUDE_STRUCTURED_OUTPUT
+
+            print('Streaming from Claude API...')
+            async with claude_call(), get_async_client().messages.stream(
+                model='claude-sonnet-4-5',
+                max_tokens=4096,
+                timeout=60.0,  # 60 second timeout
+                **crew_request(description, structured)
+            ) as stream:
+                async for event in stream:
+                    # submit_crew arguments arrive as partial JSON, text mode as text
+                    if event.type == 'input_json':
+                        chunk = event.partial_json
+                    elif event.type == 'text':
+                        chunk = event.text
+                    else:
+                        continue
+
+                    for member in parser.feed(chunk):
+                        if structured:
+                            member = validate_crew_member(member)
+                            if member is None:
+                                continue
+                        members.append(member)
+                        yield format_event(stream_format, 'member', {'index': count, **enrich_member(member)})
+                        count += 1
+                        if count >= 10:
+                            break
+                    if count >= 10 or parser.finished:
+                        break
+
+                # Nothing came out incrementally - fall back to the full response
+                if not members:
+                    members = crew_from_message(await stream.get_final_message())
+                    for member in members:
+                        yield format_event(stream_format, 'member', {'index': count, **enrich_member(member)})
+                        count += 1
+
+            print(f'Streamed crew members, count: {count}')
+            if members:
+                crew_cache.put(description, members)
+
+        yield format_event(stream_format, 'done', {
+            'count': count,
+            'replaceExisting': replace_existing,
+            'cached': cached
+        })
+
+    except Exception as e:
+        # Headers are already sent, so errors become an event
+        print(f'Crew streaming error: {e}')
+        payload = {
+            'error': 'Failed to generate crew',
+            'details': str(e),
+            'type': 'APIError' if isinstance(e, anthropic.APIError) else type(e).__name__
+        }
+        if isinstance(e, LLMOverloaded):
+            payload['retryAfter'] = e.retry_after
+        elif isinstance(e, anthropic.RateLimitError):
+            payload['retryAfter'] = provider_retry_after(e)
+        yield format_event(stream_format, 'error', payload)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def generate_crew(request):
+async def generate_crew(request):
     """
     Generate crew members using AI based on description
+
+    Async view: while Claude is generating, the worker is free to serve
+    other requests (run under ASGI to benefit, see README).
+
+    With "stream": "ndjson" or "sse" in the body, members are sent one by
+    one as Claude generates them (see stream_crew_events). That needs ASGI:
+    under WSGI Django consumes an async stream completely before sending
+    it, so the plain JSON response is returned instead.
     """
     try:
         # Parse request body
         body = json.loads(request.body)
         description = body.get('description', '').strip()
         replace_existing = body.get('replaceExisting', False)
+        stream_format = body.get('stream')
 
         # Validate description
         if not description:
@@ -52,161 +368,56 @@ def generate_crew(request):
                 status=400
             )
 
-        print(f'Starting crew generation for description: {description}')
-        print(f'API Key exists: {bool(ANTHROPIC_API_KEY)}')
+        if stream_format and (not isinstance(stream_format, str) or stream_format not in STREAM_CONTENT_TYPES):
+            return JsonResponse(
+                {'error': 'Stream must be "ndjson" or "sse"'},
+                status=400
+            )
 
-        # AI prompt for crew generation
-        prompt = f"""You are a crew generator for a WW2 aviation game. Generate a crew based on this description: "{description}"
-
-IMPORTANT: Return ONLY valid JSON, no markdown formatting, no code blocks, no explanations.
-
-Requirements:
-- Generate an appropriate number of crew members (if not specified, generate 5-10)
-- MAXIMUM 10 crew members total - never generate more than 10
-- All birth dates must be before 1922 (valid format: YYYY-MM-DD)
-- Use authentic names appropriate for the nationality/squadron mentioned
-- Class must be either "AirCrew" or "BaseCrew"
-- For AirCrew: Role must be one of: Pilot, Gunner, Navigator, BombAimer, FlightEngineer, RadioOperator
-- For BaseCrew: Job must be one of: AAFCook, FieldMechanic, FieldEngineer, RAFMedic, AAFLabour
-- Skill ranks must be 0-6 (only for AirCrew)
-- Gender must be "Male" or "Female"
-- Create brief but authentic biographies (2-3 sentences)
-- Add "Ethnicity" field: Based on the nationality/description, specify the ethnicity/appearance
-  Valid values: "European", "African", "Asian", "MiddleEastern", "Hispanic", "Mixed"
-  Examples: Polish → European, Tuskegee Airmen → African, Japanese → Asian
-
-Return a JSON array with this EXACT structure:
-[
-  {{
-    "FirstName": "Jan",
-    "LastName": "Kowalski",
-    "Nickname": "Eagle",
-    "BirthDate": "1918-05-15",
-    "Gender": "Male",
-    "Ethnicity": "European",
-    "Class": "AirCrew",
-    "Role": "Pilot",
-    "Job": "None",
-    "Biography": {{
-      "en": "Brief biography here..."
-    }},
-    "SkillRanks": {{
-      "Flying": 4,
-      "Shooting": 3,
-      "Bombing": 2,
-      "Endurance": 5,
-      "Engineering": 2,
-      "Navigating": 3
-    }}
-  }}
-]
-
-Generate the crew now:"""
-
-        # Call Anthropic API
-        print('Calling Claude API...')
-        message = client.messages.create(
-            model='claude-sonnet-4-5',
-            max_tokens=4096,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            timeout=60.0  # 60 second timeout
-        )
+        if stream_format and not isinstance(request, ASGIRequest):
+            print('Streaming needs ASGI, returning the whole crew at once')
+            stream_format = None
 
-        print('Claude API response received')
+        print(f'Starting crew generation for description: {description}')
+        print(f'API Key exists: {bool(ANTHROPIC_API_KEY)}')
 
-        # Extract text from response
-        response_text = message.content[0].text
-        print(f'Response text length: {len(response_text)}')
+        if stream_format:
+            # Once streaming starts the status is fixed, so turn callers away
+            # up front while the Claude queue is full
+            retry_after = llm_limiter.check()
+            if retry_after is not None:
+                return overloaded_response('Failed to generate crew', retry_after)
 
-        # Parse JSON from response
-        crew_data = None
-        try:
-            # Try direct JSON parse first
-            crew_data = json.loads(response_text)
-            print('Successfully parsed JSON directly')
-        except json.JSONDecodeError as e:
-            print(f'Direct JSON parse failed: {e}')
-            # Try to extract from markdown code blocks
-            json_match = re.search(r'```(?:json)?\s*(\[[\s\S]*?\])\s*```', response_text)
-            if json_match:
-                crew_data = json.loads(json_match.group(1))
-                print('Extracted JSON from markdown code block')
-            else:
-                # Try to find any JSON array
-                array_match = re.search(r'\[[\s\S]*\]', response_text)
-                if array_match:
-                    crew_data = json.loads(array_match.group(0))
-                    print('Extracted JSON array from response')
-                else:
-                    print(f'Could not extract JSON. Response text: {response_text[:500]}')
-                    raise ValueError('Could not extract valid JSON from response')
-
-        # Validate it's an array
-        if not isinstance(crew_data, list):
-            print(f'Response is not an array: {type(crew_data)}')
-            raise ValueError('Response is not an array')
-
-        # Limit to maximum 10 crew members
-        if len(crew_data) > 10:
-            print(f'Limiting crew from {len(crew_data)} to 10 members')
-            crew_data = crew_data[:10]
-
-        print(f'Successfully parsed crew data, count: {len(crew_data)}')
+            response = StreamingHttpResponse(
+                stream_crew_events(description, replace_existing, stream_format),
+                content_type=STREAM_CONTENT_TYPES[stream_format]
+            )
+            response['Cache-Control'] = 'no-cache'
+            # Keep nginx from buffering the stream
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        # Crew data comes from the cache when this description was seen before;
+        # appearances below are randomized per request either way
+        crew_data = crew_cache.get(description)
+        cached = crew_data is not None
+        if cached:
+            print(f'Using cached crew data, count: {len(crew_data)}')
+        else:
+            crew_data = await fetch_crew_data(description)
+            if crew_data:
+                crew_cache.put(description, crew_data)
 
         # Enrich crew data with random character appearance
-        enriched_crew = []
-        for member in crew_data:
-            # Get gender and ethnicity
-            gender = member.get('Gender', 'Male')
-            ethnicity = member.get('Ethnicity', 'European')
-
-            # Get appropriate skin color range based on ethnicity
-            skin_color_range = ETHNICITY_TO_SKIN_RANGE.get(ethnicity, (0, 6))
-
-            print(f'Generating {ethnicity} character with skin range: {skin_color_range}')
-
-            # Generate random character appearance
-            random_character = generate_random_character(gender, skin_color_range)
-
-            # Create metadata structure
-            metadata = {
-                'Id': str(uuid.uuid4()),
-                'CreatorName': member.get('CreatorName', ''),
-                'FirstName': member.get('FirstName', 'Unknown'),
-                'LastName': member.get('LastName', ''),
-                'Nickname': member.get('Nickname', ''),
-                'BirthDate': member.get('BirthDate', '1920-01-01'),
-                'Gender': gender,
-                'Class': member.get('Class', 'AirCrew'),
-                'Job': member.get('Job', 'None'),
-                'Role': member.get('Role', 'Pilot'),
-                'Biography': member.get('Biography', {'en': ''}),
-                'SkillRanks': member.get('SkillRanks', {
-                    'Flying': 0,
-                    'Shooting': 0,
-                    'Bombing': 0,
-                    'Endurance': 0,
-                    'Engineering': 0,
-                    'Navigating': 0
-                })
-            }
-
-            enriched_crew.append({
-                'character': random_character,
-                'metadata': metadata
-            })
+        enriched_crew = [enrich_member(member) for member in crew_data]
 
         print(f'Returning enriched crew, count: {len(enriched_crew)}')
 
         return JsonResponse({
             'crew': enriched_crew,
             'count': len(enriched_crew),
-            'replaceExisting': replace_existing
+            'replaceExisting': replace_existing,
+            'cached': cached
         })
 
     except json.JSONDecodeError as e:
@@ -219,6 +430,14 @@ Generate the crew now:"""
             status=400
         )
 
+    except LLMOverloaded as e:
+        print(f'Crew generation not admitted: {e}')
+        return overloaded_response('Failed to generate crew', e.retry_after)
+
+    except anthropic.RateLimitError as e:
+        print(f'Anthropic rate limit: {e}')
+        return overloaded_response('Failed to generate crew', provider_retry_after(e))
+
     except anthropic.APIError as e:
         print(f'Anthropic API error: {e}')
         return JsonResponse(
@@ -245,6 +464,63 @@ Generate the crew now:"""
         )
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def generate_characters_api(request):
+    """
+    Generate a batch of random characters without calling Claude
+
+    Query parameters:
+        count: Number of characters (default 1, max CHARACTER_BATCH_MAX)
+        gender: 'Male' or 'Female' for the whole batch (default: mixed)
+        femaleRatio: Share of female characters, 0-1 (default 0.5)
+        ethnicity: Comma-separated ETHNICITY_TO_SKIN_RANGE keys to draw skin
+                   tones from (default: all skin tones)
+        seed: Integer seed for a reproducible batch
+
+    Returns:
+        JSON: {"characters": [...], "count": n, "seed": seed}
+    """
+    try:
+        count = int(request.GET.get('count', 1))
+        seed = request.GET.get('seed')
+        seed = int(seed) if seed not in (None, '') else random.randrange(2 ** 32)
+        female_ratio = float(request.GET.get('femaleRatio', 0.5))
+    except ValueError:
+        return JsonResponse({'error': 'count, seed and femaleRatio must be numbers'}, status=400)
+
+    if not 1 <= count <= CHARACTER_BATCH_MAX:
+        return JsonResponse({'error': f'count must be between 1 and {CHARACTER_BATCH_MAX}'}, status=400)
+    if not 0 <= female_ratio <= 1:
+        return JsonResponse({'error': 'femaleRatio must be between 0 and 1'}, status=400)
+
+    gender = request.GET.get('gender')
+    if gender is not None and gender not in ('Male', 'Female'):
+        return JsonResponse({'error': 'gender must be Male or Female'}, status=400)
+    gender_mix = gender or {'Male': 1 - female_ratio, 'Female': female_ratio}
+
+    skin_ranges = None
+    ethnicities = [e for e in request.GET.get('ethnicity', '').split(',') if e]
+    if ethnicities:
+        unknown = [e for e in ethnicities if e not in ETHNICITY_TO_SKIN_RANGE]
+        if unknown:
+            return JsonResponse({
+                'error': f'Unknown ethnicity: {", ".join(unknown)}',
+                'valid': list(ETHNICITY_TO_SKIN_RANGE)
+            }, status=400)
+        skin_ranges = [ETHNICITY_TO_SKIN_RANGE[e] for e in ethnicities]
+
+    start = time.perf_counter()
+    characters = generate_characters(count, gender_mix, skin_ranges, seed)
+    print(f'Generated {count} characters in {(time.perf_counter() - start) * 1000:.1f} ms (seed {seed})')
+
+    return JsonResponse({
+        'characters': characters,
+        'count': count,
+        'seed': seed
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def version_check(request):
@@ -289,6 +565,18 @@ def health_check(request):
         'postcard_generator.py',
         'character_generator.py',
         'photo_matcher.py',
+        'sprite_atlas.py',
+        'sprite_cache.py',
+        'postcard_store.py',
+        'crew_cache.py',
+        'crew_stream.py',
+        'photo_cache.py',
+        'photo_preprocess.py',
+        'sprite_metadata.py',
+        'llm_limiter.py',
+        'prompts.py',
+        'schemas.py',
+        'llm_transport.py',
         'sprite-metadata.json',
         'urls.py'
     ]
@@ -353,6 +641,9 @@ def health_check(request):
             health['issues'].append(f'STATIC_ROOT directory does not exist: {static_root}')
             health['status'] = 'unhealthy'
 
+        # Sprites the generator can pick that have no file on disk
+        health['checks']['assets'] = postcard_generator.report_missing_assets(static_root)
+
     # Check module versions
     health['checks']['versions'] = {
         'postcard_generator': getattr(postcard_generator, 'MODULE_VERSION', 'UNKNOWN'),
@@ -360,6 +651,30 @@ def health_check(request):
         'django_settings_module': os.getenv('DJANGO_SETTINGS_MODULE', 'not set')
     }
 
+    # In-process render caches
+    health['checks']['caches'] = {
+        'sprites': sprite_cache.stats(),
+        'tinted_sprites': tinted_sprite_cache.stats(),
+        'portraits': portrait_cache.stats(),
+        'crews': crew_cache.stats(),
+        'photos': photo_cache.stats()
+    }
+
+    # Sprite metadata used for photo matching (validated against LAYERS)
+    try:
+        health['checks']['sprite_metadata'] = get_sprite_metadata().summary()
+    except Exception as e:
+        health['checks']['sprite_metadata'] = {'error': str(e)}
+        health['issues'].append(f'Sprite metadata: {e}')
+
+    # Claude admission control: queue depth and wait times for sizing workers
+    health['checks']['llm_limiter'] = llm_limiter.stats()
+    health['checks']['llm_transport'] = transport_stats()
+
+    # On-disk postcard store
+    store = get_postcard_store()
+    health['checks']['postcard_store'] = store.stats() if store is not None else {'enabled': False}
+
     # Check current working directory and Python path
     health['checks']['system'] = {
         'cwd': os.getcwd(),
@@ -370,187 +685,174 @@ def health_check(request):
     return JsonResponse(health, status=200 if health['status'] == 'healthy' else 500)
 
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def analyze_photo(request):
+async def fetch_photo_features(image_base64, mime_type):
     """
-    Analyze photo and generate matching character
+    Ask Claude Vision for the facial features in a photo
+
+    Returns:
+        dict: Detected features (see PhotoFeatures in api/schemas.py)
     """
+    # Call Claude Vision API
+    print('Calling Claude Vision API...')
+    async with claude_call():
+        message = await get_async_client().messages.create(
+            model='claude-sonnet-4-5',
+            max_tokens=2048,
+            timeout=30.0,  # 30 second timeout
+            **photo_request(image_base64, mime_type)
+        )
+
+    print(f'Claude API response received: {usage_summary(message.usage)}')
+
+    arguments = find_tool_input(message, PHOTO_TOOL_NAME)
+    if arguments is not None:
+        print(f'Validated {PHOTO_TOOL_NAME} arguments')
+        return parse_photo_tool_input(arguments)
+
+    text = message_text(message)
+    print(f'Response text length: {len(text)}')
+    return parse_photo_response(text)
+
+
+def parse_photo_response(response_text):
+    """
+    Parse the detected features JSON object out of Claude's response text
+
+    Returns:
+        dict: Detected features
+    """
+    detected_features = None
     try:
-        # Parse request body
-        body = json.loads(request.body)
-        image_base64 = body.get('image', '').strip()
-        mime_type = body.get('mimeType', 'image/jpeg')
+        # Try direct parse first
+        detected_features = json.loads(response_text)
+        print('Successfully parsed JSON directly')
+    except json.JSONDecodeError as e:
+        print(f'Direct JSON parse failed: {e}')
+        # Try to extract from markdown code blocks
+        json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', response_text)
+        if json_match:
+            detected_features = json.loads(json_match.group(1))
+            print('Extracted JSON from markdown code block')
+        else:
+            # Try to find any JSON object
+            object_match = re.search(r'\{[\s\S]*\}', response_text)
+            if object_match:
+                detected_features = json.loads(object_match.group(0))
+                print('Extracted JSON object from response')
+            else:
+                print(f'Could not extract JSON. Response text: {response_text[:500]}')
+                raise ValueError('Could not extract valid JSON from response')
 
-        # Validate inputs
-        if not image_base64 or not mime_type:
-            return JsonResponse(
-                {'error': 'Image data and mimeType are required'},
-                status=400
-            )
+    return detected_features
 
-        # Validate MIME type
-        valid_types = ['image/jpeg', 'image/png', 'image/heic', 'image/webp']
-        if mime_type not in valid_types:
-            return JsonResponse(
-                {'error': 'Invalid image format. Allowed: JPEG, PNG, HEIC, WebP'},
-                status=400
-            )
 
-        print('Starting photo analysis...')
-        print(f'Image size: {len(image_base64)} bytes (base64)')
-        print(f'MIME type: {mime_type}')
-
-        # Create Claude Vision API prompt
-        prompt = """Analyze this portrait photo and extract facial features in structured JSON format.
-
-REQUIREMENTS:
-- Detect ONE person's face (if multiple, analyze the most prominent)
-- Return detailed, descriptive terms (not measurements)
-- Use terms like: angular, soft, rounded, square, oval, delicate, prominent, etc.
-
-Return JSON with this EXACT structure:
-{
-  "face_detected": true,
-  "gender_presentation": "Male|Female|Ambiguous",
-  "face_shape": "oval|round|square|heart|diamond|rectangular|angular",
-  "face_characteristics": ["angular jaw", "defined chin", "soft curves"],
-
-  "skin_tone": "very light|light|light medium|medium|olive|brown|dark brown",
-
-  "hair": {
-    "present": true,
-    "length": "bald|very short|short|medium|long",
-    "style": "spiky|wavy|straight|curly|swept|slicked|messy|ponytail|bob",
-    "color": "black|dark brown|brown|light brown|blonde|red|auburn|gray|white",
-    "characteristics": ["messy", "styled", "natural"]
-  },
-
-  "facial_hair": {
-    "beard": "none|stubble|goatee|full",
-    "mustache": "none|thin|handlebar|chevron|walrus"
-  },
-
-  "nose": {
-    "size": "small|medium|large",
-    "shape": "rounded|angular|curved|straight|button|hook|upturned",
-    "bridge": "low|medium|high",
-    "characteristics": ["delicate", "prominent", "feminine", "masculine"]
-  },
-
-  "eyes": {
-    "shape": "almond|round|narrow|wide",
-    "size": "small|medium|large",
-    "color": "blue|green|brown|hazel|gray|amber"
-  },
-
-  "mouth": {
-    "size": "small|medium|large",
-    "shape": "full|thin|neutral",
-    "expression": "neutral|smiling|frowning"
-  },
-
-  "accessories": {
-    "glasses": "none|round|rectangular|monocle",
-    "other": ["beauty mark", "scar", "etc"]
-  },
-
-  "age_markers": {
-    "apparent_age": "young|middle|mature|elderly",
-    "wrinkles": "none|minimal|moderate|prominent",
-    "details": ["crow's feet", "smile lines", "forehead lines"]
-  },
-
-  "overall_characteristics": ["youthful", "strong", "delicate", "angular", "soft"]
-}
+async def analyze_photo_data(image_base64, mime_type):
+    """
+    Analyze one uploaded photo and match it to sprites
 
-Analyze the photo now and return ONLY the JSON, no markdown, no explanations."""
+    Shared by analyze_photo and analyze_photos. Detected features come from
+    the photo cache for re-uploads and near-identical copies; otherwise from
+    Claude Vision on the preprocessed photo.
 
-        # Call Claude Vision API
-        print('Calling Claude Vision API...')
-        message = client.messages.create(
-            model='claude-sonnet-4-5',
-            max_tokens=2048,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [
-                        {
-                            'type': 'image',
-                            'source': {
-                                'type': 'base64',
-                                'media_type': mime_type,
-                                'data': image_base64
-                            }
-                        },
-                        {
-                            'type': 'text',
-                            'text': prompt
-                        }
-                    ]
-                }
-            ],
-            timeout=30.0  # 30 second timeout
-        )
+    Args:
+        image_base64: Photo as base64
+        mime_type: Photo MIME type
 
-        print('Claude API response received')
+    Returns:
+        tuple: (response dict, HTTP status) - the character and analysis on
+               success, or an error dict with a 400 status for invalid input
+               and photos without a face (413 for photos over PHOTO_MAX_PIXELS)
 
-        # Extract and parse JSON response
-        response_text = message.content[0].text
-        print(f'Response text length: {len(response_text)}')
+    Raises:
+        anthropic.APIError, ValueError: When the vision call fails
+    """
+    # Validate inputs
+    if not image_base64 or not mime_type:
+        return {'error': 'Image data and mimeType are required'}, 400
 
-        detected_features = None
-        try:
-            # Try direct parse first
-            detected_features = json.loads(response_text)
-            print('Successfully parsed JSON directly')
-        except json.JSONDecodeError as e:
-            print(f'Direct JSON parse failed: {e}')
-            # Try to extract from markdown code blocks
-            json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', response_text)
-            if json_match:
-                detected_features = json.loads(json_match.group(1))
-                print('Extracted JSON from markdown code block')
-            else:
-                # Try to find any JSON object
-                object_match = re.search(r'\{[\s\S]*\}', response_text)
-                if object_match:
-                    detected_features = json.loads(object_match.group(0))
-                    print('Extracted JSON object from response')
-                else:
-                    print(f'Could not extract JSON. Response text: {response_text[:500]}')
-                    raise ValueError('Could not extract valid JSON from response')
-
-        # Validate face detection
-        if not detected_features.get('face_detected'):
-            return JsonResponse(
-                {
-                    'error': 'No face detected in photo',
-                    'details': 'Please upload a clear portrait photo showing one person\'s face'
-                },
-                status=400
-            )
+    # Validate MIME type
+    valid_types = ['image/jpeg', 'image/png', 'image/heic', 'image/webp']
+    if mime_type not in valid_types:
+        return {'error': 'Invalid image format. Allowed: JPEG, PNG, HEIC, WebP'}, 400
 
-        print('Face detected successfully')
-        print(f'Gender: {detected_features.get("gender_presentation")}')
-        print(f'Face shape: {detected_features.get("face_shape")}')
-        print(f'Skin tone: {detected_features.get("skin_tone")}')
+    print('Starting photo analysis...')
+    print(f'Image size: {len(image_base64)} bytes (base64)')
+    print(f'MIME type: {mime_type}')
 
-        # Match features to sprites
-        print('Matching features to sprites...')
-        character = match_features_to_sprites(detected_features)
+    try:
+        image_bytes = base64.b64decode(image_base64, validate=True)
+    except binascii.Error:
+        return {'error': 'Image data must be valid base64'}, 400
 
-        print('Character generated successfully')
-        print(f'Gender: {character["gender"]}')
-        print(f'Parts count: {len(character["parts"])}')
+    # Decode once (in a worker thread); the decoded image feeds both the
+    # fingerprint and the downscaled upload
+    try:
+        image = await sync_to_async(decode_photo, thread_sensitive=False)(image_bytes)
+    except PhotoTooLarge as e:
+        return {'error': str(e)}, 413
+    fingerprint = await sync_to_async(photo_fingerprint, thread_sensitive=False)(image_bytes, image)
+    detected_features = photo_cache.get(fingerprint)
+    cached = detected_features is not None
+    preprocess = None
+    if cached:
+        print('Using cached photo analysis')
+    else:
+        upload = await sync_to_async(prepare_photo_upload, thread_sensitive=False)(
+            image_bytes, mime_type, image, image_base64
+        )
+        preprocess = {key: value for key, value in upload.items() if key != 'image_base64'}
+        print(f'Photo preprocessed: {upload["original_bytes"]} -> {upload["upload_bytes"]} bytes '
+              f'({upload["bytes_saved"]} saved) in {upload["preprocess_ms"]}ms')
+        detected_features = await fetch_photo_features(upload['image_base64'], upload['mime_type'])
+        photo_cache.put(fingerprint, detected_features)
+
+    # Validate face detection
+    if not detected_features.get('face_detected'):
+        return {
+            'error': 'No face detected in photo',
+            'details': 'Please upload a clear portrait photo showing one person\'s face'
+        }, 400
+
+    print('Face detected successfully')
+    print(f'Gender: {detected_features.get("gender_presentation")}')
+    print(f'Face shape: {detected_features.get("face_shape")}')
+    print(f'Skin tone: {detected_features.get("skin_tone")}')
+
+    # Match features to sprites
+    print('Matching features to sprites...')
+    character = match_features_to_sprites(detected_features)
+
+    print('Character generated successfully')
+    print(f'Gender: {character["gender"]}')
+    print(f'Parts count: {len(character["parts"])}')
+
+    return {
+        'character': character,
+        'analysis': {
+            'detectedFeatures': detected_features,
+            'matchConfidence': character.get('matchConfidence', {}),
+            'cached': cached,
+            'preprocess': preprocess
+        }
+    }, 200
 
-        return JsonResponse({
-            'character': character,
-            'analysis': {
-                'detectedFeatures': detected_features,
-                'matchConfidence': character.get('matchConfidence', {})
-            }
-        })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def analyze_photo(request):
+    """
+    Analyze photo and generate matching character
+
+    Async view, like generate_crew.
+    """
+    try:
+        # Parse request body
+        body = json.loads(request.body)
+        image_base64 = body.get('image', '').strip()
+        mime_type = body.get('mimeType', 'image/jpeg')
+
+        result, status = await analyze_photo_data(image_base64, mime_type)
+        return JsonResponse(result, status=status)
 
     except json.JSONDecodeError as e:
         print(f'JSON parse error: {e}')
@@ -562,6 +864,14 @@ Analyze the photo now and return ONLY the JSON, no markdown, no explanations."""
             status=400
         )
 
+    except LLMOverloaded as e:
+        print(f'Photo analysis not admitted: {e}')
+        return overloaded_response('Failed to analyze photo', e.retry_after)
+
+    except anthropic.RateLimitError as e:
+        print(f'Anthropic rate limit: {e}')
+        return overloaded_response('Failed to analyze photo', provider_retry_after(e))
+
     except anthropic.APIError as e:
         print(f'Anthropic API error: {e}')
         return JsonResponse(
@@ -586,3 +896,125 @@ Analyze the photo now and return ONLY the JSON, no markdown, no explanations."""
             },
             status=500
         )
+
+
+async def analyze_photo_item(index, item, semaphore):
+    """
+    Analyze one entry of an analyze_photos batch
+
+    Failures are returned as the item's result instead of raised, so one bad
+    photo does not fail the whole crew.
+
+    Returns:
+        dict: {'index', 'status', ...analyze_photo_data result or error}
+    """
+    if not isinstance(item, dict):
+        return {'index': index, 'status': 400, 'error': 'Each photo must be an object with image and mimeType'}
+
+    image_base64 = item.get('image') or ''
+    mime_type = item.get('mimeType', 'image/jpeg')
+    if not isinstance(image_base64, str) or not isinstance(mime_type, str):
+        return {'index': index, 'status': 400, 'error': 'image and mimeType must be strings'}
+    image_base64 = image_base64.strip()
+    try:
+        async with semaphore:
+            result, status = await analyze_photo_data(image_base64, mime_type)
+    except LLMOverloaded as e:
+        print(f'Photo {index} not admitted: {e}')
+        result, status = {'error': 'Failed to analyze photo', 'details': str(e), 'retryAfter': e.retry_after}, 429
+    except anthropic.RateLimitError as e:
+        print(f'Anthropic rate limit (photo {index}): {e}')
+        result, status = {
+            'error': 'Failed to analyze photo', 'details': str(e), 'retryAfter': provider_retry_after(e)
+        }, 429
+    except anthropic.APIError as e:
+        print(f'Anthropic API error (photo {index}): {e}')
+        result, status = {'error': 'Failed to analyze photo', 'details': str(e), 'type': 'APIError'}, 500
+    except Exception as e:
+        print(f'Photo analysis error (photo {index}): {e}')
+        result, status = {'error': 'Failed to analyze photo', 'details': str(e), 'type': type(e).__name__}, 500
+    return {'index': index, 'status': status, **result}
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def analyze_photos(request):
+    """
+    Analyze a batch of photos (e.g. a whole crew) in one request
+
+    Request body: {"photos": [{"image": <base64>, "mimeType": ...}, ...]}
+
+    Photos are analyzed concurrently, at most PHOTO_BATCH_CONCURRENCY at a
+    time. Identical uploads in a batch share one analysis. Every photo gets
+    its own entry in "results" (in request order) with a status and either
+    the character and analysis or an error, like analyze_photo.
+    """
+    try:
+        body = json.loads(request.body)
+        photos = body.get('photos')
+
+        if not isinstance(photos, list) or not photos:
+            return JsonResponse(
+                {'error': 'photos must be a non-empty list of {image, mimeType} objects'},
+                status=400
+            )
+
+        if len(photos) > PHOTO_BATCH_MAX_PHOTOS:
+            return JsonResponse(
+                {'error': f'At most {PHOTO_BATCH_MAX_PHOTOS} photos per batch'},
+                status=400
+            )
+
+        print(f'Starting batch photo analysis: {len(photos)} photos')
+
+        # Identical uploads (same image and type) are analyzed once
+        semaphore = asyncio.Semaphore(PHOTO_BATCH_CONCURRENCY)
+        tasks = {}
+        keys = []
+        for index, item in enumerate(photos):
+            key = (item.get('image'), item.get('mimeType')) if isinstance(item, dict) else None
+            # Malformed entries are never shared (and may not be hashable)
+            if key is None or not all(isinstance(part, (str, type(None))) for part in key):
+                key = ('', index)
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(analyze_photo_item(index, item, semaphore))
+            keys.append(key)
+
+        await asyncio.gather(*tasks.values())
+
+        results = []
+        for index, key in enumerate(keys):
+            results.append({**tasks[key].result(), 'index': index})
+
+        succeeded = sum(1 for result in results if result['status'] == 200)
+        print(f'Batch photo analysis done: {succeeded}/{len(results)} succeeded')
+
+        return JsonResponse({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        })
+
+    except json.JSONDecodeError as e:
+        print(f'JSON parse error: {e}')
+        return JsonResponse(
+            {
+                'error': 'Invalid JSON in request',
+                'details': str(e)
+            },
+            status=400
+        )
+
+    except Exception as e:
+        print(f'Batch photo analysis error: {e}')
+        import traceback
+        traceback.print_exc()
+
+        return JsonResponse(
+            {
+                'error': 'Failed to analyze photos',
+                'details': str(e),
+                'type': type(e).__name__
+            },
+            status=500
+        )
@@ -2,13 +2,307 @@
 API view for server-side postcard generation
 """
 import os
+import re
 import json
-from django.http import HttpResponse, JsonResponse
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
-from .postcard_generator import postcard_to_base64
-from .postcard_generator_v2 import generate_postcard_v2
+from .postcard_generator import (
+    canonicalize_character, character_from_canonical, encode_postcard, generate_postcard_timed,
+    postcard_request_hash, resolve_encoding, POSTCARD_ENCODINGS, DEFAULT_POSTCARD_ENCODING,
+)
+from .postcard_store import get_postcard_store
+
+# Hash-addressed postcard URLs never change content, so they may be cached for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# How many recent postcard requests are kept in memory for their hash URL
+# (all of them are also written to the postcard store, see remember_postcard_spec)
+POSTCARD_SPEC_REGISTRY_SIZE = int(os.getenv('POSTCARD_SPEC_REGISTRY_SIZE', 1024))
+
+# request hash -> (color, canonical characters, encoding, quality), most recent last
+_postcard_specs = OrderedDict()
+_postcard_specs_lock = threading.Lock()
+
+REQUEST_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Store "extension" of the request spec saved next to a stored postcard
+SPEC_EXTENSION = 'json'
+
+
+def server_timing_header(timings):
+    """Format postcard timings as a Server-Timing header value"""
+    metrics = [
+        f"template;dur={timings.get('template_ms', 0)}",
+        f"render;dur={timings.get('render_ms', 0)}",
+        f"composite;dur={timings.get('composite_ms', 0)}",
+        f"total;dur={timings.get('total_ms', 0)}",
+    ]
+    if 'encode_ms' in timings:
+        metrics.insert(3, f"encode;dur={timings['encode_ms']}")
+    if 'store_ms' in timings:
+        metrics.insert(0, f"store;dur={timings['store_ms']}")
+    for slot in timings.get('slots', []):
+        metrics.append(f"slot{slot['slot']};dur={slot['render_ms']}")
+    return ', '.join(metrics)
+
+
+def add_timing_headers(response, timings):
+    """Attach per-slot render timings to a postcard response"""
+    response['Server-Timing'] = server_timing_header(timings)
+    response['X-Postcard-Render-Workers'] = str(timings.get('workers', 1))
+    if 'encoding' in timings:
+        response['X-Postcard-Encoding'] = timings['encoding']
+    return response
+
+
+def content_digest(data):
+    """Short SHA-256 hex digest of an encoded postcard"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def content_etag(data, variant=''):
+    """Strong ETag for an encoded postcard, distinct per response representation"""
+    return f'"{content_digest(data)}{variant}"'
+
+
+def request_etag(request_hash, variant=''):
+    """Strong ETag for a postcard request, distinct per response representation"""
+    return f'"{request_hash}{variant}"'
+
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match covers the given ETag"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # Weak comparison, as If-None-Match requires
+    return etag in candidates or f'W/{etag}' in candidates
+
+
+def remember_postcard_spec(request_hash, spec):
+    """
+    Record a rendered postcard request so its hash URL can render it later
+
+    The spec, with characters in canonical form (see canonicalize_character),
+    is kept in this worker's registry and written to the postcard store, so
+    other workers (and this one after a restart) can serve the hash URL too.
+
+    Returns:
+        bool: True if the spec is in the postcard store
+    """
+    with _postcard_specs_lock:
+        _postcard_specs[request_hash] = spec
+        _postcard_specs.move_to_end(request_hash)
+        while len(_postcard_specs) > POSTCARD_SPEC_REGISTRY_SIZE:
+            _postcard_specs.popitem(last=False)
+
+    store = get_postcard_store()
+    if store is None:
+        return False
+    if store.local_path(request_hash, SPEC_EXTENSION) is not None:
+        return True
+    color, characters, encoding, quality = spec
+    data = json.dumps({
+        'color': color,
+        'characters': characters,
+        'encoding': encoding,
+        'quality': quality,
+    }, separators=(',', ':')).encode('utf-8')
+    try:
+        store.put(request_hash, SPEC_EXTENSION, data)
+    except OSError as e:
+        print(f'Postcard spec write failed: {e}')
+        return False
+    return True
+
+
+def get_postcard_spec(request_hash):
+    """Return the recorded (color, characters, encoding, quality), ready to render, or None"""
+    with _postcard_specs_lock:
+        spec = _postcard_specs.get(request_hash)
+
+    if spec is None:
+        # Recorded by another worker or before a restart
+        store = get_postcard_store()
+        data = store.get(request_hash, SPEC_EXTENSION) if store is not None else None
+        if data is None:
+            return None
+        try:
+            stored = json.loads(data)
+            spec = (stored['color'], stored['characters'], stored['encoding'], stored.get('quality'))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f'Ignoring unreadable postcard spec {request_hash}: {e}')
+            return None
+        if spec[2] not in POSTCARD_ENCODINGS:
+            return None
+
+        with _postcard_specs_lock:
+            _postcard_specs[request_hash] = spec
+            while len(_postcard_specs) > POSTCARD_SPEC_REGISTRY_SIZE:
+                _postcard_specs.popitem(last=False)
+
+    color, characters, encoding, quality = spec
+    try:
+        characters = [character_from_canonical(c) for c in characters]
+    except (ValueError, KeyError, TypeError) as e:
+        print(f'Ignoring unreadable postcard spec {request_hash}: {e}')
+        return None
+    return color, characters, encoding, quality
+
+
+def current_postcard_spec(request_hash):
+    """
+    Return the recorded request behind a hash if rendering it now gives the
+    same hash, or None (unknown, or the assets changed since)
+    """
+    spec = get_postcard_spec(request_hash)
+    if spec is None:
+        return None
+    if postcard_request_hash(*spec, settings.STATIC_ROOT) != request_hash:
+        print(f'Postcard {request_hash[:12]} was rendered from older assets')
+        return None
+    return spec
+
+
+def stored_postcard_extension(request_hash):
+    """Extension of a postcard image in the store under this hash, or None"""
+    store = get_postcard_store()
+    if store is None:
+        return None
+    for extension in dict.fromkeys(ext for _, _, _, ext in POSTCARD_ENCODINGS.values()):
+        if store.local_path(request_hash, extension) is not None:
+            return extension
+    return None
+
+
+def binary_response(encoded, filename, etag=None):
+    """
+    Direct image response
+
+    The encoded bytes are handed to HttpResponse as-is (bytes are not copied
+    again), with an explicit Content-Length and ETag (content hash by default).
+    """
+    data = encoded['data']
+    response = HttpResponse(data, content_type=encoded['content_type'])
+    response['Content-Length'] = str(len(data))
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag or content_etag(data)
+    return response
+
+
+def base64_response(encoded, etag=None):
+    """
+    JSON response with the image as base64
+
+    The JSON document is joined from prefix / base64 bytes / suffix, so the
+    base64 payload is never decoded to str or re-escaped by the JSON encoder.
+    """
+    data = encoded['data']
+    prefix = json.dumps({
+        'success': True,
+        'format': encoded['extension'],
+        'content_type': encoded['content_type'],
+    })[:-1].encode('utf-8') + b', "image": "'
+    payload = base64.b64encode(data)
+    suffix = b'"}'
+
+    body = b''.join((prefix, payload, suffix))
+    response = HttpResponse(body, content_type='application/json')
+    response['Content-Length'] = str(len(body))
+    response['ETag'] = etag or content_etag(data, '-b64')
+    return response
+
+
+def multipart_response(encoded, filename, metadata, etag=None):
+    """
+    multipart/mixed response: a JSON metadata part followed by the raw image
+
+    For clients that want metadata and the image in one round trip without
+    the base64 size overhead.
+    """
+    data = encoded['data']
+    # Boundary derived from the content keeps the body (and its ETag) deterministic
+    boundary = f'postcard-{content_digest(data)}'
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Type: application/json\r\n\r\n'
+        f'{json.dumps(metadata)}\r\n'
+        f'--{boundary}\r\n'
+        f'Content-Type: {encoded["content_type"]}\r\n'
+        f'Content-Disposition: attachment; filename="{filename}"\r\n'
+        f'Content-Length: {len(data)}\r\n\r\n'
+    ).encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    body = b''.join((head, data, tail))
+    response = HttpResponse(body, content_type=f'multipart/mixed; boundary={boundary}')
+    response['Content-Length'] = str(len(body))
+    response['ETag'] = etag or content_etag(data, '-multipart')
+    return response
+
+
+def stored_postcard_url(request_hash, extension):
+    """Shareable URL of a postcard in the postcard store"""
+    return f'/api/postcard/{request_hash}.{extension}'
+
+
+def render_encoded_postcard(color, characters, encoding, quality, request_hash=None):
+    """
+    Render and encode a postcard once
+
+    With a request hash, the postcard store is checked first and fresh
+    renders are written to it.
+
+    Returns:
+        tuple: (encoded dict from encode_postcard, timings dict)
+    """
+    store = get_postcard_store() if request_hash else None
+    _, _, content_type, extension = POSTCARD_ENCODINGS[encoding]
+
+    if store is not None:
+        start = time.perf_counter()
+        data = store.get(request_hash, extension)
+        if data is not None:
+            store_ms = round((time.perf_counter() - start) * 1000, 2)
+            encoded = {
+                'data': data,
+                'content_type': content_type,
+                'extension': extension,
+                'encoding': encoding,
+                'encode_ms': 0,
+            }
+            return encoded, {'store_ms': store_ms, 'total_ms': store_ms, 'encoding': encoding, 'workers': 0}
+
+    # Get base path for static files
+    base_path = settings.STATIC_ROOT
+
+    # Generate postcard (slots render concurrently)
+    postcard_image, timings = generate_postcard_timed(color, characters, base_path)
+
+    print(f'Postcard generated successfully in {timings["total_ms"]}ms')
+
+    # Encode once; the caller already applied the encode budget, and the
+    # request hash (and so the ETag) names this exact encoding
+    encoded = encode_postcard(postcard_image, encoding, quality, apply_budget=False)
+    timings['encode_ms'] = encoded['encode_ms']
+    timings['encoding'] = encoded['encoding']
+
+    if store is not None:
+        try:
+            store.put(request_hash, extension, encoded['data'])
+        except OSError as e:
+            print(f'Postcard store write failed: {e}')
+    return encoded, timings
 
 
 @csrf_exempt
@@ -20,17 +314,34 @@ def generate_postcard_api(request):
     Request body:
     {
         "color": "blue" | "orange",
-        "characters": [<character objects>]
+        "characters": [<character objects>],
+        "format": "image" | "base64" | "multipart",  (optional, default "image")
+        "encoding": "png" | "png-fast" | "png-optimized" |
+                    "webp-lossless" | "webp" | "jpeg",  (optional, default "png-optimized")
+        "quality": 1-100                     (optional, lossy encodings)
     }
 
-    Returns: PNG image or base64 encoded PNG
+    Returns: Encoded image or base64 encoded image
+
+    Responses carry a strong ETag derived from the normalized request and
+    the encoding actually used (after the encode budget); a matching
+    If-None-Match gets 304 without rendering. When the request is saved in
+    the postcard store, Content-Location points at the cacheable GET URL
+    for the same postcard.
     """
     try:
         # Parse request body
         body = json.loads(request.body)
         color = body.get('color', 'blue')
         characters = body.get('characters', [])
-        return_format = body.get('format', 'image')  # 'image' or 'base64'
+        return_format = body.get('format', 'image')  # 'image', 'base64' or 'multipart'
+        encoding = body.get('encoding', DEFAULT_POSTCARD_ENCODING)
+        quality = body.get('quality')
+
+        # An encoding name passed as format means a direct image in that encoding
+        if return_format in POSTCARD_ENCODINGS:
+            encoding = return_format
+            return_format = 'image'
 
         # Validate inputs
         if color not in ['blue', 'orange']:
@@ -39,6 +350,25 @@ def generate_postcard_api(request):
                 status=400
             )
 
+        if return_format not in ['image', 'base64', 'multipart']:
+            return JsonResponse(
+                {'error': 'Format must be "image", "base64" or "multipart"'},
+                status=400
+            )
+
+        if encoding not in POSTCARD_ENCODINGS:
+            return JsonResponse(
+                {'error': f'Encoding must be one of: {", ".join(POSTCARD_ENCODINGS)}'},
+                status=400
+            )
+
+        if quality is not None and (isinstance(quality, bool) or not isinstance(quality, int)
+                                    or not 1 <= quality <= 100):
+            return JsonResponse(
+                {'error': 'Quality must be an integer between 1 and 100'},
+                status=400
+            )
+
         if not characters or not isinstance(characters, list):
             return JsonResponse(
                 {'error': 'Characters array is required'},
@@ -51,36 +381,47 @@ def generate_postcard_api(request):
                 status=400
             )
 
+        # Settle the encoding first, so the hash names the bytes that will be sent
+        encoding = resolve_encoding(encoding)
+
+        # Conditional request: answer from the request hash, before rendering
+        request_hash = postcard_request_hash(color, characters, encoding, quality, settings.STATIC_ROOT)
+        variant = {'image': '', 'base64': '-b64', 'multipart': '-multipart'}[return_format]
+        etag = request_etag(request_hash, variant)
+
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
         print(f'Generating postcard: color={color}, characters={len(characters)}')
         print(f'Character data: {characters[0] if characters else "none"}')
 
-        # Get base path for static files
-        base_path = settings.STATIC_ROOT
-
-        # Generate postcard using V2 generator
-        postcard_image = generate_postcard_v2(color, characters, base_path)
+        encoded, timings = render_encoded_postcard(color, characters, encoding, quality, request_hash)
+        filename = f'postcard_{color}_{len(characters)}crew.{encoded["extension"]}'
 
-        print('Postcard generated successfully')
+        # Only rendered requests are recorded, and only what affects the image
+        canonical = [canonicalize_character(c) for c in characters]
+        shareable = remember_postcard_spec(request_hash, (color, canonical, encoding, quality))
 
         # Return based on format
         if return_format == 'base64':
-            # Return as JSON with base64 encoded image
-            base64_str = postcard_to_base64(postcard_image)
-            return JsonResponse({
+            response = base64_response(encoded, etag)
+        elif return_format == 'multipart':
+            response = multipart_response(encoded, filename, {
                 'success': True,
-                'image': base64_str,
-                'format': 'png'
-            })
+                'format': encoded['extension'],
+                'content_type': encoded['content_type'],
+                'hash': request_hash,
+            }, etag)
         else:
-            # Return as direct PNG image
-            from io import BytesIO
-            buffer = BytesIO()
-            postcard_image.save(buffer, format='PNG', optimize=True)
-            buffer.seek(0)
-
-            response = HttpResponse(buffer.read(), content_type='image/png')
-            response['Content-Disposition'] = f'attachment; filename="postcard_{color}_{len(characters)}crew.png"'
-            return response
+            response = binary_response(encoded, filename, etag)
+        response['X-Postcard-Hash'] = request_hash
+        if shareable:
+            response['Content-Location'] = f'/api/generate-postcard/{request_hash}'
+        if get_postcard_store() is not None:
+            response['X-Postcard-URL'] = stored_postcard_url(request_hash, encoded['extension'])
+        return add_timing_headers(response, timings)
 
     except FileNotFoundError as e:
         print(f'File not found: {e}')
@@ -115,3 +456,117 @@ def generate_postcard_api(request):
             },
             status=500
         )
+
+
+@require_http_methods(["GET", "HEAD"])
+def postcard_by_hash_api(request, request_hash):
+    """
+    Serve a postcard by its request hash (as returned in X-Postcard-Hash)
+
+    The URL fully determines the image, so responses are marked immutable
+    for browsers and CDNs. The request behind the hash comes from this
+    worker's registry or the postcard store, and is rendered again only
+    while the assets are unchanged; failing that, a postcard still in the
+    store is served as stored. Unknown hashes return 404.
+    """
+    if not REQUEST_HASH_RE.match(request_hash):
+        return JsonResponse({'error': 'Invalid postcard hash'}, status=400)
+
+    etag = request_etag(request_hash)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    spec = current_postcard_spec(request_hash)
+    if spec is None:
+        extension = stored_postcard_extension(request_hash)
+        if extension is None:
+            return JsonResponse({'error': 'Unknown postcard hash'}, status=404)
+        return stored_postcard_api(request, request_hash, extension)
+
+    color, characters, encoding, quality = spec
+    try:
+        encoded, timings = render_encoded_postcard(color, characters, encoding, quality, request_hash)
+    except FileNotFoundError as e:
+        print(f'File not found: {e}')
+        return JsonResponse({'error': 'Template or sprite file not found', 'details': str(e)}, status=404)
+
+    filename = f'postcard_{color}_{len(characters)}crew.{encoded["extension"]}'
+    response = binary_response(encoded, filename, etag)
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return add_timing_headers(response, timings)
+
+
+def sendfile_response(path, content_type):
+    """
+    Hand a stored file to the web server (POSTCARD_SENDFILE_HEADER), or
+    stream it from Django when no sendfile header is configured
+    """
+    header = settings.POSTCARD_SENDFILE_HEADER
+    if header == 'X-Accel-Redirect':
+        relative = os.path.relpath(path, settings.POSTCARD_STORE_DIR).replace(os.sep, '/')
+        response = HttpResponse(content_type=content_type)
+        response[header] = settings.POSTCARD_SENDFILE_PREFIX.rstrip('/') + '/' + relative
+    elif header:
+        response = HttpResponse(content_type=content_type)
+        response[header] = path
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def stored_postcard_api(request, request_hash, extension):
+    """
+    Serve a postcard from the postcard store: /api/postcard/<hash>.<ext>
+
+    Postcards missing from the store (evicted, or never stored) are rendered
+    again when the request behind the hash is known and the assets are
+    unchanged.
+    """
+    if not REQUEST_HASH_RE.match(request_hash):
+        return JsonResponse({'error': 'Invalid postcard hash'}, status=400)
+
+    content_types = {ext: content_type for _, _, content_type, ext in POSTCARD_ENCODINGS.values()}
+    if extension not in content_types:
+        return JsonResponse({'error': 'Unknown postcard file type'}, status=404)
+
+    etag = request_etag(request_hash)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    store = get_postcard_store()
+    if store is None:
+        return JsonResponse({'error': 'Postcard store is disabled'}, status=404)
+
+    response = None
+    path = store.local_path(request_hash, extension)
+    if path is not None:
+        try:
+            response = sendfile_response(path, content_types[extension])
+        except FileNotFoundError:
+            # Evicted between the lookup and the open; render it again below
+            print(f'Stored postcard {request_hash[:12]} was evicted while being served')
+    if response is None:
+        spec = current_postcard_spec(request_hash)
+        if spec is None or POSTCARD_ENCODINGS[spec[2]][3] != extension:
+            return JsonResponse({'error': 'Postcard not found'}, status=404)
+
+        color, characters, encoding, quality = spec
+        try:
+            encoded, timings = render_encoded_postcard(color, characters, encoding, quality, request_hash)
+        except FileNotFoundError as e:
+            print(f'File not found: {e}')
+            return JsonResponse({'error': 'Template or sprite file not found', 'details': str(e)}, status=404)
+        response = add_timing_headers(binary_response(encoded, f'postcard_{request_hash[:12]}.{extension}'), timings)
+
+    response['Content-Disposition'] = f'inline; filename="postcard_{request_hash[:12]}.{extension}"'
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
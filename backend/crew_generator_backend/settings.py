@@ -155,3 +155,32 @@ CORS_ALLOWED_ORIGINS = [
 
 # Allow credentials (cookies, authorization headers)
 CORS_ALLOW_CREDENTIALS = True
+
+# Response headers the frontend may read cross-origin
+CORS_EXPOSE_HEADERS = [
+    'Content-Disposition',
+    'Server-Timing',
+    'X-Postcard-Render-Workers',
+    'X-Postcard-Encoding',
+    'X-Postcard-Hash',
+    'X-Postcard-URL',
+    'ETag',
+    'Content-Location',
+    'Retry-After',
+]
+
+# Postcard store - finished postcards kept on disk by request hash and served
+# from /api/postcard/<hash>.<ext>. Set POSTCARD_STORE_DIR to '' to disable.
+POSTCARD_STORE_BACKEND = os.getenv('POSTCARD_STORE_BACKEND', 'api.postcard_store.FileSystemPostcardStore')
+POSTCARD_STORE_DIR = os.getenv('POSTCARD_STORE_DIR', os.path.join(BASE_DIR, 'postcard_store'))
+POSTCARD_STORE_MAX_BYTES = int(os.getenv('POSTCARD_STORE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Let the web server send stored postcards: 'X-Sendfile' (Apache mod_xsendfile)
+# or 'X-Accel-Redirect' (nginx, internal location mapped to POSTCARD_STORE_DIR).
+# Empty serves files from Django.
+POSTCARD_SENDFILE_HEADER = os.getenv('POSTCARD_SENDFILE_HEADER', '')
+POSTCARD_SENDFILE_PREFIX = os.getenv('POSTCARD_SENDFILE_PREFIX', '/protected/postcards/')
+
+# Largest request body held in memory. Django's 2.5 MB default fits a single
+# photo for /api/analyze-photo but not a batch for /api/analyze-photos.
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('DATA_UPLOAD_MAX_MEMORY_SIZE', 25 * 1024 * 1024))
@@ -0,0 +1,111 @@
+"""
+Crew generation view tests
+Run with: python -m pytest -q tests/test_crew.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+import django
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crew_generator_backend.settings')
+django.setup()
+
+from django.conf import settings
+from django.test import AsyncClient, Client
+from api import views
+from api.crew_cache import CrewCache
+from api.schemas import validate_crew_member
+
+CREW = [
+    {'FirstName': 'Jan', 'LastName': 'Zumbach', 'Gender': 'Male', 'Ethnicity': 'European', 'Class': 'AirCrew'},
+    {'FirstName': 'Witold', 'LastName': 'Urbanowicz', 'Gender': 'Male', 'Ethnicity': 'European', 'Class': 'AirCrew'},
+]
+
+
+@pytest.fixture
+def crew_client(monkeypatch):
+    """Test client with a fresh crew cache, whose Claude calls return CREW"""
+    monkeypatch.setattr(settings, 'ALLOWED_HOSTS', [*settings.ALLOWED_HOSTS, 'testserver'])
+    monkeypatch.setattr(views, 'crew_cache', CrewCache(10, 60, 1))
+    calls = []
+
+    async def fetch(description):
+        calls.append(description)
+        return [dict(member) for member in CREW]
+
+    monkeypatch.setattr(views, 'fetch_crew_data', fetch)
+    client = Client()
+    client.calls = calls
+    return client
+
+
+def post_crew(client, body):
+    return client.post('/api/generate-crew', json.dumps(body), content_type='application/json')
+
+
+@pytest.mark.parametrize('stream', [['ndjson'], {'format': 'sse'}, 'xml'])
+def test_unknown_stream_format_is_rejected(crew_client, stream):
+    response = post_crew(crew_client, {'description': '303 Squadron', 'stream': stream})
+
+    assert response.status_code == 400
+    assert crew_client.calls == []
+
+
+def test_stream_under_wsgi_returns_the_whole_crew(crew_client):
+    response = post_crew(crew_client, {'description': '303 Squadron', 'stream': 'ndjson'})
+
+    assert response.status_code == 200
+    assert not response.streaming
+    assert response['Content-Type'] == 'application/json'
+    assert response.json()['count'] == 2
+
+
+def test_stream_under_asgi_sends_members_as_events(crew_client):
+    views.crew_cache.put('303 Squadron', [dict(member) for member in CREW])
+
+    async def run():
+        response = await AsyncClient().post(
+            '/api/generate-crew', json.dumps({'description': '303 Squadron', 'stream': 'ndjson'}),
+            content_type='application/json',
+        )
+        assert response.streaming
+        return [json.loads(line) async for line in response.streaming_content]
+
+    events = asyncio.run(run())
+    assert [event['type'] for event in events] == ['member', 'member', 'done']
+    assert events[-1]['count'] == 2 and events[-1]['cached'] is True
+
+
+def test_empty_crew_is_not_cached(crew_client, monkeypatch):
+    async def fetch(description):
+        crew_client.calls.append(description)
+        return []
+
+    monkeypatch.setattr(views, 'fetch_crew_data', fetch)
+    for _ in range(2):
+        response = post_crew(crew_client, {'description': '303 Squadron'})
+        assert response.json()['count'] == 0 and response.json()['cached'] is False
+
+    assert len(crew_client.calls) == 2
+    assert views.crew_cache.stats()['entries'] == 0
+
+
+def test_crew_cache_rejects_empty_crews():
+    cache = CrewCache(10, 60, 1)
+    cache.put('303 Squadron', [])
+
+    assert cache.get('303 Squadron') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_validated_member_without_role_is_a_pilot():
+    member = dict(CREW[0], BirthDate='1915-09-14', Biography={'en': 'Fighter pilot.'})
+
+    assert validate_crew_member(member)['Role'] == 'Pilot'
+    assert views.enrich_member(validate_crew_member(member))['metadata']['Role'] == 'Pilot'
+    assert validate_crew_member(dict(member, Role='Gunner'))['Role'] == 'Gunner'
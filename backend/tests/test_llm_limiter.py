@@ -0,0 +1,178 @@
+"""
+Admission control tests for the Claude call limiter
+Run with: python -m pytest -q tests/test_llm_limiter.py
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.llm_limiter import LLMLimiter, LLMOverloaded
+
+
+def limiter(rate_per_minute=0, burst=1, max_concurrent=2, max_queue=4, queue_timeout=5):
+    return LLMLimiter(rate_per_minute, burst, max_concurrent, max_queue, queue_timeout)
+
+
+def test_concurrency_never_exceeds_the_cap():
+    async def run():
+        llm = limiter(max_concurrent=3, max_queue=20)
+        running = 0
+        peak = 0
+
+        async def call():
+            nonlocal running, peak
+            async with llm.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(15)))
+        return llm, peak
+
+    llm, peak = asyncio.run(run())
+    assert peak == 3
+    stats = llm.stats()
+    assert stats['admitted'] == 15 and stats['active'] == 0 and stats['peak_active'] == 3
+    assert stats['queued'] == 12 and stats['rejected'] == 0
+
+
+def test_queue_is_first_in_first_out():
+    async def run():
+        llm = limiter(max_concurrent=1, max_queue=10)
+        order = []
+
+        async def call(number):
+            async with llm.slot():
+                order.append(number)
+                await asyncio.sleep(0.005)
+
+        tasks = []
+        for number in range(6):
+            tasks.append(asyncio.create_task(call(number)))
+            await asyncio.sleep(0)  # queue in creation order
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == list(range(6))
+
+
+def test_full_queue_rejects_at_once():
+    async def run():
+        llm = limiter(max_concurrent=1, max_queue=2)
+        await llm.acquire()
+        waiting = [asyncio.create_task(llm.acquire()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        assert llm.check() is not None
+        with pytest.raises(LLMOverloaded) as overloaded:
+            await llm.acquire()
+        assert overloaded.value.reason == 'queue full'
+        assert overloaded.value.retry_after >= 1
+
+        for _ in range(3):
+            llm.release()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*waiting)
+        return llm.stats()
+
+    stats = asyncio.run(run())
+    assert stats['rejected'] == 1 and stats['admitted'] == 3 and stats['peak_queue_depth'] == 2
+
+
+def test_queued_caller_times_out():
+    async def run():
+        llm = limiter(max_concurrent=1, queue_timeout=0.05)
+        await llm.acquire()
+        start = time.monotonic()
+        with pytest.raises(LLMOverloaded) as overloaded:
+            await llm.acquire()
+        return llm, overloaded.value, time.monotonic() - start
+
+    llm, error, waited = asyncio.run(run())
+    assert error.reason == 'queue timeout'
+    assert 0.05 <= waited < 1
+    assert llm.stats()['timed_out'] == 1 and llm.stats()['queue_depth'] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        llm = limiter(max_concurrent=1)
+        await llm.acquire()
+        first = asyncio.create_task(llm.acquire())
+        second = asyncio.create_task(llm.acquire())
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        llm.release()
+        await asyncio.wait_for(second, 1)
+        return llm.stats()
+
+    stats = asyncio.run(run())
+    assert stats['queue_depth'] == 0 and stats['active'] == 1
+
+
+def test_token_bucket_spaces_out_calls_after_the_burst():
+    async def run():
+        # 1200/min = one call every 50 ms, after a burst of 2
+        llm = limiter(rate_per_minute=1200, burst=2, max_concurrent=0, max_queue=10)
+        started = []
+
+        async def call():
+            async with llm.slot():
+                started.append(time.monotonic())
+
+        await asyncio.gather(*(call() for _ in range(5)))
+        return started
+
+    started = asyncio.run(run())
+    assert started[1] - started[0] < 0.04
+    # Three more calls need three refills
+    assert started[-1] - started[0] >= 0.14
+
+
+def test_pause_holds_new_calls():
+    async def run():
+        llm = limiter(max_concurrent=0, burst=5)
+        llm.pause(0.1)
+        start = time.monotonic()
+        async with llm.slot():
+            return time.monotonic() - start, llm.stats()
+
+    waited, stats = asyncio.run(run())
+    assert waited >= 0.09
+    assert stats['provider_limited'] == 1
+
+
+def test_one_limiter_covers_loops_in_several_threads():
+    llm = limiter(max_concurrent=2, max_queue=20)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with llm.slot():
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            with lock:
+                running -= 1
+
+    threads = [threading.Thread(target=lambda: asyncio.run(call())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert peak == 2
+    assert llm.stats()['admitted'] == 8 and llm.stats()['active'] == 0
@@ -0,0 +1,59 @@
+"""
+Record/replay transport tests
+Run with: python -m pytest -q tests/test_llm_transport.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+
+from anthropic.types import Message
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.llm_transport import Cassette, RecordingMessages
+
+
+def tool_message():
+    return Message.model_validate({
+        'id': 'msg_test',
+        'type': 'message',
+        'role': 'assistant',
+        'model': 'claude-sonnet-4-5',
+        'content': [{'type': 'tool_use', 'id': 'toolu_test', 'name': 'submit_crew', 'input': {'crew': []}}],
+        'stop_reason': 'tool_use',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 0, 'output_tokens': 0},
+    })
+
+
+class FakeMessages:
+    async def create(self, **kwargs):
+        return tool_message()
+
+
+def test_recording_writes_off_the_event_loop(tmp_path):
+    cassette = Cassette(str(tmp_path / 'cassette.jsonl'))
+    record = cassette.record
+    writer_threads = []
+
+    def tracking_record(*args):
+        writer_threads.append(threading.get_ident())
+        record(*args)
+
+    cassette.record = tracking_record
+
+    async def run():
+        messages = RecordingMessages(FakeMessages(), cassette)
+        await messages.create(model='claude-sonnet-4-5', tool_choice={'type': 'tool', 'name': 'submit_crew'})
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+
+    assert writer_threads and loop_thread not in writer_threads
+    with open(tmp_path / 'cassette.jsonl') as f:
+        entry = json.loads(f.readline())
+    assert entry['route'] == 'claude-sonnet-4-5:submit_crew'
+    assert cassette.stats()['recorded'] == 1
@@ -0,0 +1,182 @@
+"""
+Photo upload, analysis batching and sprite matching tests
+Run with: python -m pytest -q tests/test_photos.py
+"""
+import base64
+import json
+import os
+import random
+import re
+import sys
+from io import BytesIO
+
+import django
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crew_generator_backend.settings')
+django.setup()
+
+from django.conf import settings
+from django.test import Client
+from api import photo_preprocess, views
+from api.character_generator import LAYERS, get_available_indices
+from api.photo_matcher import match_layer_by_tags
+from api.sprite_metadata import SPRITE_METADATA_PATH, get_sprite_metadata
+
+
+@pytest.fixture
+def photo_client(monkeypatch):
+    """Test client whose photo analysis never reaches Claude"""
+    monkeypatch.setattr(settings, 'ALLOWED_HOSTS', [*settings.ALLOWED_HOSTS, 'testserver'])
+    calls = []
+
+    async def analyze(image_base64, mime_type):
+        calls.append((image_base64, mime_type))
+        return {'success': True, 'character': {'image': image_base64}}, 200
+
+    monkeypatch.setattr(views, 'analyze_photo_data', analyze)
+    client = Client()
+    client.calls = calls
+    return client
+
+
+def post_photos(client, photos):
+    return client.post('/api/analyze-photos', json.dumps({'photos': photos}), content_type='application/json')
+
+
+def test_batch_with_malformed_items_reports_them_per_item(photo_client):
+    response = post_photos(photo_client, [
+        {'image': 'aGVsbG8=', 'mimeType': 'image/png'},
+        {'image': ['not', 'a', 'string'], 'mimeType': 'image/png'},
+        {'image': 'aGVsbG8=', 'mimeType': {'type': 'image/png'}},
+        'not an object',
+    ])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [result['status'] for result in data['results']] == [200, 400, 400, 400]
+    assert [result['index'] for result in data['results']] == [0, 1, 2, 3]
+    assert data['succeeded'] == 1 and data['failed'] == 3
+    assert photo_client.calls == [('aGVsbG8=', 'image/png')]
+
+
+def test_batch_analyzes_identical_uploads_once(photo_client):
+    photo = {'image': 'aGVsbG8=', 'mimeType': 'image/jpeg'}
+    response = post_photos(photo_client, [photo, dict(photo), {'image': 'd29ybGQ=', 'mimeType': 'image/jpeg'}])
+
+    data = response.json()
+    assert data['succeeded'] == 3
+    assert [result['index'] for result in data['results']] == [0, 1, 2]
+    assert len(photo_client.calls) == 2
+
+
+def jpeg_bytes(size):
+    image = Image.new('RGB', size, (180, 140, 120))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale():
+    image = photo_preprocess.decode_photo(jpeg_bytes((4000, 3000)))
+
+    # libjpeg 1/2 scale still covers PHOTO_MAX_EDGE (1568)
+    assert image.size == (2000, 1500)
+    assert image.info['original_size'] == (4000, 3000)
+
+    upload = photo_preprocess.prepare_photo_upload(jpeg_bytes((4000, 3000)), 'image/jpeg', image)
+    assert max(upload['size']) == photo_preprocess.PHOTO_MAX_EDGE
+
+
+def test_small_jpeg_is_decoded_at_full_size():
+    assert photo_preprocess.decode_photo(jpeg_bytes((800, 600))).size == (800, 600)
+
+
+def test_photo_over_pixel_cap_is_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(photo_preprocess, 'PHOTO_MAX_PIXELS', 1_000_000)
+
+    with pytest.raises(photo_preprocess.PhotoTooLarge):
+        photo_preprocess.decode_photo(jpeg_bytes((1200, 1000)))
+
+
+def test_analyze_photo_answers_413_over_pixel_cap(monkeypatch):
+    monkeypatch.setattr(settings, 'ALLOWED_HOSTS', [*settings.ALLOWED_HOSTS, 'testserver'])
+    monkeypatch.setattr(photo_preprocess, 'PHOTO_MAX_PIXELS', 1_000_000)
+    body = {'image': base64.b64encode(jpeg_bytes((1200, 1000))).decode('ascii'), 'mimeType': 'image/jpeg'}
+
+    response = Client().post('/api/analyze-photo', json.dumps(body), content_type='application/json')
+
+    assert response.status_code == 413
+
+
+def reference_match_layer_by_tags(layer_name, detected_terms, gender, raw_metadata):
+    """match_layer_by_tags as it was before the compiled tag indexes (scans every sprite term)"""
+    layer_sprites = raw_metadata.get('categories', {}).get(LAYERS[layer_name]['folder'])
+    best_match = {'score': 0, 'index': -1, 'variant': -1}
+    for filename, metadata in (layer_sprites or {}).items():
+        if gender and metadata.get('gender_fit') != 'both' and metadata.get('gender_fit') != gender.lower():
+            continue
+        score = 0
+        characteristics = metadata.get('characteristics', '')
+        sprite_terms = metadata.get('tags', []) + (
+            [s.strip() for s in characteristics.split(',')] if characteristics else []
+        ) + [metadata.get('style'), metadata.get('shape'), metadata.get('description')]
+        for term in detected_terms:
+            if not term:
+                continue
+            for sprite_term in (t for t in sprite_terms if t):
+                if term.lower() == sprite_term.lower():
+                    score += 2
+                elif term.lower() in sprite_term.lower():
+                    score += 1
+                elif sprite_term.lower() in term.lower():
+                    score += 0.5
+        if score > best_match['score']:
+            match = re.search(r'(\w+)_(\d+)_(\d+)', filename)
+            if match:
+                best_match = {'score': score, 'index': int(match.group(2)), 'variant': int(match.group(3))}
+    if best_match['score'] < 1:
+        available_indices = get_available_indices(layer_name, gender)
+        best_match = {'score': 0, 'index': available_indices[0] if available_indices else 0, 'variant': 0}
+    return {
+        'index': best_match['index'],
+        'variant': best_match['variant'],
+        'confidence': min(best_match['score'] / 3, 1.0)
+    }
+
+
+def test_compiled_tag_matcher_matches_reference_on_sampled_inputs():
+    with open(SPRITE_METADATA_PATH) as f:
+        raw_metadata = json.load(f)
+    sprite_metadata = get_sprite_metadata()
+
+    vocabulary = sorted({
+        term for sprites in raw_metadata['categories'].values() for metadata in sprites.values()
+        for term in metadata.get('tags', []) + [metadata.get('style') or '', metadata.get('shape') or '']
+        if term
+    })
+    layers = [name for name, layer in LAYERS.items() if layer['folder'] in raw_metadata['categories']]
+    rng = random.Random(18)
+
+    for _ in range(2000):
+        terms = []
+        for _ in range(rng.randint(0, 5)):
+            term = rng.choice(vocabulary)
+            kind = rng.random()
+            if kind < 0.2:
+                term = term[:max(1, len(term) // 2)]  # fragment of a sprite term
+            elif kind < 0.4:
+                term = f'{term} {rng.choice(vocabulary)}'  # contains sprite terms
+            elif kind < 0.5:
+                term = term.upper()
+            terms.append(term)
+        if rng.random() < 0.1:
+            terms.append('')
+        layer_name = rng.choice(layers)
+        gender = rng.choice(['Male', 'Female', None])
+
+        assert match_layer_by_tags(layer_name, terms, gender, sprite_metadata) == \
+            reference_match_layer_by_tags(layer_name, terms, gender, raw_metadata), (layer_name, terms, gender)
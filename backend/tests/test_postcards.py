@@ -0,0 +1,283 @@
+"""
+Postcard encoding, caching and serving tests
+Run with: python -m pytest -q tests/test_postcards.py
+"""
+import base64
+import json
+import os
+import shutil
+import sys
+import time
+
+import django
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crew_generator_backend.settings')
+django.setup()
+
+from django.conf import settings
+from django.test import Client
+from api import postcard_generator, postcard_store, views_postcard
+from api.character_generator import generate_random_character
+
+
+@pytest.fixture
+def encode_budget(monkeypatch):
+    """A 250 ms encode budget with empty encode timings"""
+    monkeypatch.setattr(postcard_generator, 'POSTCARD_ENCODE_BUDGET_MS', 250.0)
+    monkeypatch.setattr(postcard_generator, 'POSTCARD_ENCODE_REMEASURE_SECONDS', 60.0)
+    monkeypatch.setattr(postcard_generator, '_encode_ms_average', {})
+    return postcard_generator
+
+
+def test_default_encoding_is_optimized_png(monkeypatch):
+    """Without a budget the default stays optimize=True PNG"""
+    monkeypatch.setattr(postcard_generator, 'POSTCARD_ENCODE_BUDGET_MS', 0.0)
+    monkeypatch.setattr(postcard_generator, '_encode_ms_average', {'png-optimized': (10_000.0, time.monotonic())})
+
+    encoded = postcard_generator.encode_postcard(Image.new('RGBA', (64, 32), (10, 20, 30, 255)))
+
+    assert encoded['encoding'] == 'png-optimized'
+    assert encoded['content_type'] == 'image/png'
+
+
+def test_encoding_over_budget_steps_down(encode_budget):
+    encode_budget.record_encode_ms('png-optimized', 516)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png'
+
+    encode_budget.record_encode_ms('png', 300)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png-fast'
+    # Encodings without a fallback are never changed
+    assert encode_budget.resolve_encoding('webp') == 'webp'
+
+
+def test_downgraded_encoding_recovers(encode_budget):
+    encode_budget.record_encode_ms('png-optimized', 516)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png'
+
+    # Once the measurement is stale, one request re-measures the requested encoding...
+    encode_budget._encode_ms_average['png-optimized'] = (516.0, time.monotonic() - 61)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png-optimized'
+    # ...while concurrent requests keep stepping down
+    assert encode_budget.resolve_encoding('png-optimized') == 'png'
+
+    # A fast re-measure brings it back at once
+    encode_budget.record_encode_ms('png-optimized', 180)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png-optimized'
+
+
+def test_slow_remeasure_stays_downgraded(encode_budget):
+    encode_budget._encode_ms_average['png-optimized'] = (516.0, time.monotonic() - 61)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png-optimized'
+
+    encode_budget.record_encode_ms('png-optimized', 480)
+    assert encode_budget.resolve_encoding('png-optimized') == 'png'
+
+
+def test_encode_without_budget_uses_resolved_encoding(encode_budget):
+    encode_budget.record_encode_ms('png-optimized', 516)
+    image = Image.new('RGBA', (64, 32), (10, 20, 30, 255))
+
+    assert encode_budget.encode_postcard(image, 'png-optimized')['encoding'] == 'png'
+    assert encode_budget.encode_postcard(image, 'png-optimized', apply_budget=False)['encoding'] == 'png-optimized'
+
+
+@pytest.fixture
+def postcard_client(monkeypatch, tmp_path):
+    """Test client with a fresh postcard store and a stand-in renderer (no static files needed)"""
+    monkeypatch.setattr(settings, 'ALLOWED_HOSTS', [*settings.ALLOWED_HOSTS, 'testserver'])
+    monkeypatch.setattr(postcard_store, '_store', postcard_store.FileSystemPostcardStore(str(tmp_path), 10 * 1024 * 1024))
+    monkeypatch.setattr(views_postcard, '_postcard_specs', type(views_postcard._postcard_specs)())
+    monkeypatch.setattr(postcard_generator, '_encode_ms_average', {})
+
+    def render(color, characters, base_path):
+        shade = 40 if color == 'blue' else 200
+        image = Image.new('RGBA', (postcard_generator.CANVAS_WIDTH, postcard_generator.CANVAS_HEIGHT),
+                          (shade, 80, 120 + len(characters), 255))
+        return image, {'total_ms': 1, 'workers': 1, 'slots': []}
+
+    monkeypatch.setattr(views_postcard, 'generate_postcard_timed', render)
+    return Client()
+
+
+def post_postcard(client, body):
+    return client.post('/api/generate-postcard', json.dumps(body), content_type='application/json')
+
+
+def test_etag_names_the_encoding_actually_used(postcard_client, encode_budget):
+    characters = [generate_random_character('Male'), generate_random_character('Female')]
+    encode_budget.record_encode_ms('png-optimized', 516)
+
+    response = post_postcard(postcard_client, {'color': 'blue', 'characters': characters})
+
+    assert response.status_code == 200
+    assert response['X-Postcard-Encoding'] == 'png'
+    request_hash = postcard_generator.postcard_request_hash('blue', characters, 'png', None, settings.STATIC_ROOT)
+    assert response['ETag'] == views_postcard.request_etag(request_hash)
+    assert response['ETag'] != views_postcard.request_etag(
+        postcard_generator.postcard_request_hash('blue', characters, 'png-optimized', None, settings.STATIC_ROOT)
+    )
+
+
+def test_hash_url_works_without_this_workers_registry(postcard_client):
+    characters = [generate_random_character('Male')]
+    response = post_postcard(postcard_client, {'color': 'orange', 'characters': characters})
+    assert response.status_code == 200
+    url = response['Content-Location']
+
+    # Another worker, or this one after a restart
+    views_postcard._postcard_specs.clear()
+    by_hash = postcard_client.get(url)
+
+    assert by_hash.status_code == 200
+    assert by_hash.content == response.content
+    assert by_hash['ETag'] == response['ETag']
+    assert 'immutable' in by_hash['Cache-Control']
+
+
+def test_hash_url_falls_back_to_the_stored_postcard(postcard_client, tmp_path):
+    response = post_postcard(postcard_client, {'color': 'blue', 'characters': [generate_random_character()]})
+    request_hash = response['X-Postcard-Hash']
+
+    views_postcard._postcard_specs.clear()
+    os.remove(os.path.join(tmp_path, request_hash[:2], f'{request_hash}.json'))
+    by_hash = postcard_client.get(response['Content-Location'])
+
+    assert by_hash.status_code == 200
+    assert b''.join(by_hash.streaming_content) == response.content
+
+
+def test_spec_is_stored_canonical_and_only_after_rendering(postcard_client, tmp_path):
+    character = dict(generate_random_character('Male'), backstory='x' * 100_000)
+    response = post_postcard(postcard_client, {'color': 'orange', 'characters': [character]})
+    request_hash = response['X-Postcard-Hash']
+    spec_path = os.path.join(tmp_path, request_hash[:2], f'{request_hash}.json')
+
+    with open(spec_path) as f:
+        stored = json.load(f)
+    assert stored['characters'] == [postcard_generator.canonicalize_character(character)]
+    assert os.path.getsize(spec_path) < 2000
+
+    # Conditional requests answered 304 record nothing
+    views_postcard._postcard_specs.clear()
+    os.remove(spec_path)
+    not_modified = postcard_client.post(
+        '/api/generate-postcard', json.dumps({'color': 'orange', 'characters': [character]}),
+        content_type='application/json', headers={'If-None-Match': response['ETag']},
+    )
+    assert not_modified.status_code == 304
+    assert not os.path.exists(spec_path)
+    assert not views_postcard._postcard_specs
+
+
+def test_canonical_character_round_trips():
+    for gender in ('Male', 'Female'):
+        character = generate_random_character(gender)
+        canonical = postcard_generator.canonicalize_character(character)
+        rebuilt = postcard_generator.character_from_canonical(canonical)
+        assert postcard_generator.canonicalize_character(rebuilt) == canonical
+
+
+def test_changed_assets_give_new_hashes(postcard_client, monkeypatch, tmp_path):
+    characters = [generate_random_character('Female')]
+    before = post_postcard(postcard_client, {'color': 'blue', 'characters': characters})
+
+    # Sprites or templates changed and the asset index was reloaded
+    monkeypatch.setitem(postcard_generator._asset_versions, settings.STATIC_ROOT, 'changed-assets')
+    after = post_postcard(postcard_client, {'color': 'blue', 'characters': characters})
+
+    assert after['X-Postcard-Hash'] != before['X-Postcard-Hash']
+    assert after['ETag'] != before['ETag']
+
+    # The old URL keeps serving the old postcard, and is never rendered from the new assets
+    old_url = before['Content-Location']
+    assert b''.join(postcard_client.get(old_url).streaming_content) == before.content
+    old_hash = before['X-Postcard-Hash']
+    os.remove(os.path.join(tmp_path, old_hash[:2], f'{old_hash}.png'))
+    assert postcard_client.get(old_url).status_code == 404
+
+
+def test_unknown_hash_is_not_found(postcard_client):
+    assert postcard_client.get(f'/api/generate-postcard/{"0" * 64}').status_code == 404
+
+
+def test_postcard_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        postcard_store.PostcardStore()
+
+
+def test_stored_postcard_evicted_while_serving_is_rendered_again(postcard_client, monkeypatch, tmp_path):
+    response = post_postcard(postcard_client, {'color': 'blue', 'characters': [generate_random_character()]})
+    url = response['X-Postcard-URL']
+
+    # Evicted after local_path found it, before the file was opened
+    store = postcard_store._store
+    monkeypatch.setattr(store, 'local_path', lambda request_hash, extension: str(tmp_path / 'evicted.png'))
+    stored = postcard_client.get(url)
+
+    assert stored.status_code == 200
+    assert stored.content == response.content
+
+
+@pytest.fixture
+def sprite_tree(tmp_path, monkeypatch):
+    """A private copy of the sprites, and an on-disk portrait tier"""
+    sprites = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'PortraitSprites')
+    if not os.path.isdir(sprites):
+        pytest.skip('PortraitSprites not available')
+    base_path = str(tmp_path / 'static')
+    shutil.copytree(sprites, os.path.join(base_path, 'PortraitSprites'))
+    monkeypatch.setattr(postcard_generator, 'PORTRAIT_CACHE_DIR', str(tmp_path / 'portraits'))
+    yield base_path
+    postcard_generator.reload_asset_index(base_path)
+
+
+def test_portrait_disk_tier_follows_sprite_changes(sprite_tree):
+    character = generate_random_character('Male')
+    canonical = postcard_generator.canonicalize_character(character)
+    portrait_hash = postcard_generator.character_hash(canonical)
+
+    postcard_generator.render_character(character, sprite_tree, 64)
+    first_path = postcard_generator.get_portrait_disk_path(portrait_hash, (64, 64), sprite_tree)
+    assert os.path.exists(first_path)
+
+    # A sprite changes on disk and the asset index is reloaded
+    body_path = next(path for key, path in postcard_generator.get_asset_index(sprite_tree).items() if key[0] == 'Body')
+    with Image.open(body_path) as body:
+        body.transpose(Image.Transpose.FLIP_LEFT_RIGHT).save(body_path)
+    os.utime(body_path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    postcard_generator.reload_asset_index(sprite_tree)
+
+    assert not os.path.exists(first_path)
+    second_path = postcard_generator.get_portrait_disk_path(portrait_hash, (64, 64), sprite_tree)
+    assert second_path != first_path
+    postcard_generator.render_character(character, sprite_tree, 64)
+    assert os.path.exists(second_path)
+
+
+def test_base64_and_multipart_are_plain_responses_with_length(postcard_client):
+    body = {'color': 'blue', 'characters': [generate_random_character()]}
+    image = post_postcard(postcard_client, body).content
+
+    as_base64 = post_postcard(postcard_client, dict(body, format='base64'))
+    assert not as_base64.streaming
+    assert as_base64['Content-Length'] == str(len(as_base64.content))
+    assert base64.b64decode(as_base64.json()['image']) == image
+
+    multipart = post_postcard(postcard_client, dict(body, format='multipart'))
+    assert not multipart.streaming
+    assert multipart['Content-Length'] == str(len(multipart.content))
+    assert image in multipart.content
+
+
+@pytest.mark.parametrize('quality', [True, False, 0, 101, 80.0, '80'])
+def test_invalid_quality_is_rejected(postcard_client, quality):
+    response = post_postcard(postcard_client, {
+        'color': 'blue', 'characters': [generate_random_character()], 'encoding': 'webp', 'quality': quality,
+    })
+
+    assert response.status_code == 400
@@ -23,6 +23,18 @@ def test_all_required_files_exist():
         'api/postcard_generator.py',
         'api/character_generator.py',
         'api/photo_matcher.py',
+        'api/sprite_atlas.py',
+        'api/sprite_cache.py',
+        'api/postcard_store.py',
+        'api/crew_cache.py',
+        'api/crew_stream.py',
+        'api/photo_cache.py',
+        'api/photo_preprocess.py',
+        'api/sprite_metadata.py',
+        'api/llm_limiter.py',
+        'api/prompts.py',
+        'api/schemas.py',
+        'api/llm_transport.py',
         'api/sprite-metadata.json',
         'api/urls.py',
         'api/__init__.py',
@@ -97,6 +109,18 @@ def test_modules_can_import():
         'api.postcard_generator',
         'api.character_generator',
         'api.photo_matcher',
+        'api.sprite_atlas',
+        'api.sprite_cache',
+        'api.postcard_store',
+        'api.crew_cache',
+        'api.crew_stream',
+        'api.photo_cache',
+        'api.photo_preprocess',
+        'api.sprite_metadata',
+        'api.llm_limiter',
+        'api.prompts',
+        'api.schemas',
+        'api.llm_transport',
     ]
 
     all_imported = True
@@ -137,6 +161,17 @@ def test_function_signatures():
 
         print(f"  ✅ generate_postcard({', '.join(params)})")
 
+        # generate_postcard_timed must accept the same arguments
+        from api.postcard_generator import generate_postcard_timed
+        timed_params = list(inspect.signature(generate_postcard_timed).parameters.keys())
+        if timed_params != expected_params:
+            print(f"  ❌ generate_postcard_timed signature is wrong!")
+            print(f"     Expected: {expected_params}")
+            print(f"     Got:      {timed_params}")
+            return False
+
+        print(f"  ✅ generate_postcard_timed({', '.join(timed_params)})")
+
         # Check it's called correctly in views_postcard
         import ast
         views_postcard_path = os.path.join(
@@ -151,7 +186,7 @@ def test_function_signatures():
         found_call = False
         for node in ast.walk(tree):
             if isinstance(node, ast.Call):
-                if isinstance(node.func, ast.Name) and node.func.id == 'generate_postcard':
+                if isinstance(node.func, ast.Name) and node.func.id in ('generate_postcard', 'generate_postcard_timed'):
                     found_call = True
                     # Check argument order (simple check)
                     if len(node.args) >= 2:
@@ -0,0 +1,139 @@
+"""
+Sprite tinting and sprite atlas tests
+Run with: python -m pytest -q tests/test_sprites.py
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import postcard_generator, sprite_atlas
+
+FOLDER = '10_Hair_Hair'
+
+
+def reference_tint(img, hex_color):
+    """apply_color_tint as it was before lookup tables (split / eval / merge)"""
+    img = img.convert('RGBA')
+    tint = postcard_generator.hex_to_rgb(hex_color)
+    base = img.split()
+    r = Image.eval(base[0], lambda a: int((a * tint[0]) / 255))
+    g = Image.eval(base[1], lambda a: int((a * tint[1]) / 255))
+    b = Image.eval(base[2], lambda a: int((a * tint[2]) / 255))
+    return Image.merge('RGBA', (r, g, b, base[3]))
+
+
+def sample_image():
+    """64x64 RGBA image covering every channel value, in random order"""
+    rng = random.Random(2)
+    values = list(range(256)) * 16
+    bands = []
+    for _ in range(4):
+        rng.shuffle(values)
+        band = Image.new('L', (64, 64))
+        band.putdata(values)
+        bands.append(band)
+    return Image.merge('RGBA', bands)
+
+
+def test_tint_lut_matches_reference_for_every_palette_color():
+    image = sample_image()
+    colors = sorted({color for palette in postcard_generator.COLOR_PALETTES.values() for color in palette})
+    assert colors
+
+    for color in colors:
+        assert postcard_generator.apply_color_tint(image, color).tobytes() == \
+            reference_tint(image, color).tobytes(), color
+
+
+def test_tint_converts_non_rgba_input():
+    image = sample_image().convert('RGB')
+    color = postcard_generator.COLOR_PALETTES['Skin'][0]
+
+    tinted = postcard_generator.apply_color_tint(image, color)
+
+    assert tinted.mode == 'RGBA'
+    assert tinted.tobytes() == reference_tint(image, color).tobytes()
+
+
+@pytest.fixture
+def atlas_setup(monkeypatch, tmp_path):
+    """A one-folder sprite tree and an empty atlas directory"""
+    base_path = tmp_path / 'static'
+    folder_path = base_path / 'PortraitSprites' / FOLDER
+    folder_path.mkdir(parents=True)
+    for index, color in enumerate([(200, 30, 30, 255), (30, 200, 30, 128)]):
+        Image.new('RGBA', (8, 8), color).save(folder_path / f'hair_{index}.png')
+
+    atlas_dir = tmp_path / 'atlas'
+    monkeypatch.setattr(sprite_atlas, 'SPRITE_ATLAS_DIR', str(atlas_dir))
+    sprite_atlas.reset_sprite_atlas()
+    yield str(base_path), folder_path, atlas_dir
+    sprite_atlas.reset_sprite_atlas()
+
+
+def write_atlas(atlas_dir, folder_path, shade=0):
+    filenames = sorted(os.listdir(folder_path))
+    sprites = []
+    for filename in filenames:
+        with Image.open(folder_path / filename) as source:
+            sprites.append((filename, None, source.convert('RGBA').point(lambda v: min(255, v + shade))))
+    sources = {filename: sprite_atlas.file_digest(folder_path / filename) for filename in filenames}
+    return sprite_atlas.write_folder_atlas(str(atlas_dir), FOLDER, sprites, sources)
+
+
+def atlas_sprite(base_path, filename='hair_0.png'):
+    path = os.path.join(base_path, 'PortraitSprites', FOLDER, filename)
+    return sprite_atlas.get_atlas_sprite(base_path, path, None, (8, 8))
+
+
+def test_atlas_round_trip(atlas_setup):
+    base_path, folder_path, atlas_dir = atlas_setup
+    assert write_atlas(atlas_dir, folder_path) == (2, 2 * 8 * 8 * 4)
+
+    with Image.open(folder_path / 'hair_1.png') as source:
+        expected = source.convert('RGBA').tobytes()
+    assert atlas_sprite(base_path, 'hair_1.png').tobytes() == expected
+
+
+def test_index_names_a_content_addressed_blob(atlas_setup):
+    base_path, folder_path, atlas_dir = atlas_setup
+    write_atlas(atlas_dir, folder_path)
+    first = json.loads((atlas_dir / f'{FOLDER}.json').read_text())['blob']
+    write_atlas(atlas_dir, folder_path, shade=10)
+    second = json.loads((atlas_dir / f'{FOLDER}.json').read_text())['blob']
+    write_atlas(atlas_dir, folder_path, shade=20)
+    third = json.loads((atlas_dir / f'{FOLDER}.json').read_text())['blob']
+
+    assert len({first, second, third}) == 3
+    # The blob the previous index named survives one rebuild, older ones are removed
+    blobs = sorted(name for name in os.listdir(atlas_dir) if name.endswith('.rgba'))
+    assert blobs == sorted([second, third])
+
+
+def test_truncated_blob_is_rejected(atlas_setup):
+    base_path, folder_path, atlas_dir = atlas_setup
+    write_atlas(atlas_dir, folder_path)
+    blob = atlas_dir / json.loads((atlas_dir / f'{FOLDER}.json').read_text())['blob']
+    blob.write_bytes(blob.read_bytes()[:100])
+
+    assert atlas_sprite(base_path) is None
+
+
+def test_stale_atlas_falls_back_to_pngs(atlas_setup):
+    base_path, folder_path, atlas_dir = atlas_setup
+    write_atlas(atlas_dir, folder_path)
+    Image.new('RGBA', (8, 8), (0, 0, 255, 255)).save(folder_path / 'hair_0.png')
+
+    assert atlas_sprite(base_path) is None
+
+    # Rebuilt against the new sprites, the atlas is used again
+    write_atlas(atlas_dir, folder_path)
+    sprite_atlas.reset_sprite_atlas()
+    assert atlas_sprite(base_path).getpixel((0, 0)) == (0, 0, 255, 255)